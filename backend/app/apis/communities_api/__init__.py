@@ -1,11 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, Field, TypeAdapter
 from datetime import datetime, timezone # Added timezone
 import uuid
 from typing import List
 
-import databutton as db
 from app.auth import AuthorizedUser # Assuming your auth utilities are here
+from app.libs.codec import RecordCodec
+from app.libs.repository import (
+    VersionConflictError,
+    get_async_repository,
+    get_community_catalog,
+    get_conflict_retries,
+)
+from app.libs.responses import (
+    etag_matches,
+    get_response_cache,
+    json_bytes_response,
+    make_etag,
+    not_modified_response,
+)
+
+logger = logging.getLogger(__name__)
 
 # --- Pydantic Models for Communities ---
 class CommunityBase(BaseModel):
@@ -34,9 +51,17 @@ class ForumCategoryResponse(ForumCategoryBase):
     community_id: str
     created_at: datetime
 
-# Internal model for storing category data, including soft delete flag
+# Internal model for storing category data, including soft delete flag and the version it was read at
 class ForumCategoryStoredData(ForumCategoryResponse):
     is_deleted: bool = False
+    version: int = 0
+
+# Stored records decode straight into these models
+COMMUNITY_CODEC = RecordCodec(CommunityResponse)
+CATEGORY_CODEC = RecordCodec(ForumCategoryStoredData)
+
+# Serializes stored categories as responses, leaving out is_deleted and version
+CATEGORY_LIST_ADAPTER = TypeAdapter(List[ForumCategoryResponse])
 
 
 router = APIRouter(
@@ -45,18 +70,24 @@ router = APIRouter(
 )
 
 # --- Helper Functions ---
-def _get_community_doc_or_404(community_id: str) -> dict:
-    """Fetches a community document by ID from db.storage.json or raises 404."""
-    storage_key = f"community-{community_id}.json"
+async def _get_community_doc_or_404(community_id: str) -> dict:
+    """Fetches a community document by ID from the repository or raises 404."""
     try:
-        community_doc = db.storage.json.get(key=storage_key)
-        if not community_doc or not isinstance(community_doc, dict):
-            raise HTTPException(status_code=404, detail="Community not found")
-        return community_doc
+        return await get_async_repository().get_community(community_id)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Community not found")
-    except Exception as e:
-        print(f"Error fetching community doc {community_id}: {e}")
+    except Exception:
+        logger.exception("Error fetching community doc", extra={"community_id": community_id})
+        raise HTTPException(status_code=500, detail="Error accessing community data")
+
+async def _get_community_version_or_404(community_id: str) -> str:
+    """Fetches the version of a community and its members or raises 404."""
+    try:
+        return await get_async_repository().get_community_version(community_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Community not found")
+    except Exception:
+        logger.exception("Error fetching community version", extra={"community_id": community_id})
         raise HTTPException(status_code=500, detail="Error accessing community data")
 
 def _ensure_admin_permission(community_doc: dict, user: AuthorizedUser):
@@ -88,13 +119,11 @@ async def create_community(
         "member_ids": [creator_id],  # Creator is initially the only member
         "created_at": created_at_dt.isoformat(), # Store as ISO format string
     }
-    
-    print(f"Attempting to save community: {community_data_to_save}")
 
     try:
-        storage_key = f"community-{community_id}.json"
-        db.storage.json.put(key=storage_key, value=community_data_to_save)
-        print(f"Community saved to db.storage.json with key: {storage_key}")
+        await get_async_repository().create_community(community_data_to_save)
+        get_community_catalog().upsert(community_data_to_save)
+        logger.info("Community saved", extra={"community_id": community_id, "user_id": creator_id})
         
         return CommunityResponse(
             id=community_id,
@@ -105,7 +134,7 @@ async def create_community(
             created_at=created_at_dt
         )
     except Exception as e:
-        print(f"Error saving community to db.storage.json: {e}")
+        logger.exception("Error saving community to storage", extra={"community_id": community_id})
         raise HTTPException(status_code=500, detail=f"Failed to create community: {str(e)}")
 
 @router.get("/me", response_model=List[CommunityResponse])
@@ -114,71 +143,54 @@ async def list_my_communities(user: AuthorizedUser):
     List all communities the authenticated user is a member of (or created).
     """
     user_id = user.sub
-    user_communities = []
-    print(f"Fetching communities for user: {user_id}")
+    logger.debug("Fetching communities for user", extra={"user_id": user_id})
 
     try:
-        all_community_files = db.storage.json.list()
-        print(f"Found {len(all_community_files)} total community files in storage.")
-
-        for file_info in all_community_files:
-            key = file_info.name
-            if not key.startswith("community-") or not key.endswith(".json"):
-                # print(f"Skipping non-community file: {key}")
-                continue
-            
-            try:
-                community_data = db.storage.json.get(key)
-                if community_data and isinstance(community_data, dict):
-                    if user_id == community_data.get("creator_id") or user_id in community_data.get("member_ids", []):
-                        user_communities.append(
-                            CommunityResponse(
-                                id=community_data["id"],
-                                name=community_data["name"],
-                                description=community_data["description"],
-                                creator_id=community_data["creator_id"],
-                                member_ids=community_data["member_ids"],
-                                created_at=datetime.fromisoformat(community_data["created_at"])
-                            )
-                        )
-                        # print(f"Added community '{community_data.get('name')}' (ID: {community_data.get('id')}) to list for user {user_id}")
-                # Removed noisy logs for brevity
-            except FileNotFoundError:
-                print(f"File not found for key: {key} (should not happen during list)")
-            except Exception as e:
-                print(f"Error processing community file {key}: {e}")
-
-        print(f"Returning {len(user_communities)} communities for user {user_id}")
+        # Carries the current member_ids of every community, no listing per community
+        community_records = await get_async_repository().list_user_communities(user_id)
+        user_communities = COMMUNITY_CODEC.decode_many(community_records)
+
+        logger.debug("Returning %d communities for user", len(user_communities), extra={"user_id": user_id})
         return user_communities
-    except Exception as e:
-        print(f"Error listing communities from db.storage.json: {e}")
+    except Exception:
+        logger.exception("Error listing communities from storage", extra={"user_id": user_id})
         raise HTTPException(status_code=500, detail="Failed to list communities")
 
 @router.get("/{community_id}", response_model=CommunityResponse)
-async def get_community_details(community_id: str):
+async def get_community_details(community_id: str, request: Request):
     """
     Get details for a specific community by its ID.
     """
-    community_doc = _get_community_doc_or_404(community_id)
-    print(f"Successfully fetched community data: {community_doc}")
-    
-    created_at_val = community_doc.get("created_at")
-    if isinstance(created_at_val, str):
-        created_at_dt = datetime.fromisoformat(created_at_val)
-    elif isinstance(created_at_val, datetime):
-        created_at_dt = created_at_val
-    else:
-        print(f"Warning: created_at is missing or invalid type for community {community_id}. Using current UTC time.")
-        created_at_dt = datetime.now(timezone.utc)
-
-    return CommunityResponse(
-        id=community_doc["id"],
-        name=community_doc["name"],
-        description=community_doc["description"],
-        creator_id=community_doc["creator_id"],
-        member_ids=community_doc.get("member_ids", []),
-        created_at=created_at_dt
-    )
+    # Unchanged communities are answered with 304 or the body serialized for their current version
+    version = await _get_community_version_or_404(community_id)
+    etag = make_etag("community_details", community_id, version)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+    body = get_response_cache().get("community_details", community_id, version)
+    if body is not None:
+        return json_bytes_response(body, etag=etag)
+
+    # The body is cached and tagged with the version it was read at, which may be newer than the one above
+    try:
+        version, community_record = await get_async_repository().get_community_snapshot(community_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Community not found")
+    except Exception:
+        logger.exception("Error fetching community data", extra={"community_id": community_id})
+        raise HTTPException(status_code=500, detail="Error accessing community data")
+    logger.debug("Fetched community data", extra={"community_id": community_id})
+
+    patched = not isinstance(community_record.get("created_at"), str)
+    if patched:
+        logger.warning("created_at is missing or invalid type, using current UTC time", extra={"community_id": community_id})
+        community_record["created_at"] = datetime.now(timezone.utc)
+
+    body = COMMUNITY_CODEC.decode(community_record).model_dump_json().encode()
+    if version is None or patched:
+        # The members match no version yet, or the body differs from one request to the next
+        return json_bytes_response(body)
+    get_response_cache().put("community_details", community_id, version, body)
+    return json_bytes_response(body, etag=make_etag("community_details", community_id, version))
 
 # --- Forum Category Endpoints ---
 @router.post("/{community_id}/forum-categories", response_model=ForumCategoryResponse, status_code=201, tags=["Forum Categories"])
@@ -188,7 +200,7 @@ async def create_forum_category(
     user: AuthorizedUser
 ):
     """Create a new forum category within a community. Admin only."""
-    community_doc = _get_community_doc_or_404(community_id)
+    community_doc = await _get_community_doc_or_404(community_id)
     _ensure_admin_permission(community_doc, user)
 
     category_id = str(uuid.uuid4())
@@ -203,11 +215,10 @@ async def create_forum_category(
         is_deleted=False
     )
     
-    storage_key = f"fcategory_{community_id}_{category_id}.json"
-    
     try:
-        db.storage.json.put(key=storage_key, value=stored_category_data.model_dump(mode='json'))
-        print(f"Forum category '{stored_category_data.name}' saved with key: {storage_key}")
+        await get_async_repository().put_category(RecordCodec.encode(stored_category_data))
+        get_response_cache().invalidate("forum_categories", community_id)
+        logger.info("Forum category saved", extra={"community_id": community_id, "category_id": category_id})
         
         # Return ForumCategoryResponse (without is_deleted field)
         return ForumCategoryResponse(
@@ -218,57 +229,47 @@ async def create_forum_category(
             created_at=created_at_dt
         )
     except Exception as e:
-        print(f"Error saving forum category to db.storage.json: {e}")
+        logger.exception("Error saving forum category to storage", extra={"community_id": community_id})
         raise HTTPException(status_code=500, detail=f"Failed to create forum category: {str(e)}")
 
 # Placeholder for GET, PUT, DELETE category endpoints
 @router.get("/{community_id}/forum-categories", response_model=List[ForumCategoryResponse], tags=["Forum Categories"])
-async def list_forum_categories(community_id: str):
+async def list_forum_categories(community_id: str, request: Request):
     """List all non-deleted forum categories for a community."""
-    # First, check if community exists to provide a friendly 404 if not
-    _get_community_doc_or_404(community_id) # We don't need the doc itself, just to ensure it exists
-    
-    categories = []
-    prefix_to_match = f"fcategory_{community_id}_"
-    print(f"Fetching forum categories for community {community_id} with prefix '{prefix_to_match}'")
+    # First, check if community exists to provide a friendly 404 if not, unknown communities have version 0 too
+    await _get_community_doc_or_404(community_id) # We don't need the doc itself, just to ensure it exists
+
+    # Unchanged category lists are answered with 304
+    try:
+        version = await get_async_repository().get_categories_version(community_id)
+    except Exception:
+        logger.exception("Error fetching forum categories version", extra={"community_id": community_id})
+        raise HTTPException(status_code=500, detail="Error accessing community data")
+    etag = make_etag("forum_categories", community_id, version)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
 
     try:
-        all_category_files = db.storage.json.list()
-        print(f"Found {len(all_category_files)} total JSON files in storage.")
-
-        for file_info in all_category_files:
-            key = file_info.name
-            if key.startswith(prefix_to_match) and key.endswith(".json"):
-                try:
-                    category_stored_data_dict = db.storage.json.get(key)
-                    # Validate that it's a dictionary and has the is_deleted flag
-                    if isinstance(category_stored_data_dict, dict):
-                        category_stored_data = ForumCategoryStoredData(**category_stored_data_dict)
-                        if not category_stored_data.is_deleted:
-                            # Convert to ForumCategoryResponse (which excludes is_deleted)
-                            categories.append(
-                                ForumCategoryResponse(
-                                    id=category_stored_data.id,
-                                    community_id=category_stored_data.community_id,
-                                    name=category_stored_data.name,
-                                    description=category_stored_data.description,
-                                    created_at=category_stored_data.created_at
-                                )
-                            )
-                            print(f"Added category '{category_stored_data.name}' to list for community {community_id}")
-                        else:
-                            print(f"Skipping deleted category with key: {key}")
-                    else:
-                        print(f"Skipping non-dict data for key: {key}")
-                except FileNotFoundError:
-                    print(f"File not found for key: {key} during list (should not happen if consistency is maintained)")
-                except Exception as e:
-                    print(f"Error processing category file {key}: {e}")
+        # Or with the body serialized for their current version
+        body = get_response_cache().get("forum_categories", community_id, version)
+        if body is not None:
+            return json_bytes_response(body, etag=etag)
+
+        logger.debug("Fetching forum categories", extra={"community_id": community_id})
+        # Cached and tagged with the version they were read at, which may be newer than the one above
+        version, category_dicts = await get_async_repository().list_categories_snapshot(community_id)
+        etag = make_etag("forum_categories", community_id, version)
+        # The response model leaves out is_deleted and version of the stored categories
+        categories = [
+            category for category in CATEGORY_CODEC.decode_many(category_dicts) if not category.is_deleted
+        ]
         
-        print(f"Returning {len(categories)} non-deleted categories for community {community_id}")
-        return categories
+        logger.debug("Returning %d non-deleted categories", len(categories), extra={"community_id": community_id})
+        body = CATEGORY_LIST_ADAPTER.dump_json(categories)
+        get_response_cache().put("forum_categories", community_id, version, body)
+        return json_bytes_response(body, etag=etag)
     except Exception as e:
-        print(f"Error listing forum categories for community {community_id}: {e}")
+        logger.exception("Error listing forum categories", extra={"community_id": community_id})
         raise HTTPException(status_code=500, detail=f"Failed to list forum categories: {str(e)}")
 
 
@@ -280,27 +281,27 @@ async def update_forum_category(
     user: AuthorizedUser
 ):
     """Update an existing forum category. Admin only."""
-    community_doc = _get_community_doc_or_404(community_id)
+    community_doc = await _get_community_doc_or_404(community_id)
     _ensure_admin_permission(community_doc, user)
 
     storage_key = f"fcategory_{community_id}_{category_id}.json"
-    print(f"Attempting to update category with key: {storage_key}")
+    logger.debug("Attempting to update category", extra={"key": storage_key})
 
-    try:
-        # Fetch existing category data
+    async def apply_update() -> ForumCategoryStoredData:
+        # Fetch existing category data, again on every retry
         try:
-            existing_category_dict = db.storage.json.get(key=storage_key)
+            existing_category_dict = await get_async_repository().get_category(community_id, category_id)
             if not isinstance(existing_category_dict, dict):
-                print(f"Category data for {storage_key} is not a dict.")
+                logger.warning("Category data is not a dict", extra={"key": storage_key})
                 raise HTTPException(status_code=404, detail="Forum category not found or data corrupted")
-            existing_category = ForumCategoryStoredData(**existing_category_dict)
+            existing_category = CATEGORY_CODEC.decode(existing_category_dict)
         except FileNotFoundError:
-            print(f"Forum category not found with key: {storage_key} for update.")
+            logger.info("Forum category not found for update", extra={"key": storage_key})
             raise HTTPException(status_code=404, detail="Forum category not found")
 
         # Check if it's marked as deleted
         if existing_category.is_deleted:
-            print(f"Attempt to update an already deleted category: {storage_key}")
+            logger.info("Attempt to update an already deleted category", extra={"key": storage_key})
             raise HTTPException(status_code=404, detail="Forum category not found (it may have been deleted)")
 
         # Update fields
@@ -308,8 +309,14 @@ async def update_forum_category(
         existing_category.description = category_update_data.description
         # created_at, id, community_id, is_deleted remain unchanged by this operation
 
-        db.storage.json.put(key=storage_key, value=existing_category.model_dump(mode='json'))
-        print(f"Forum category '{existing_category.name}' updated with key: {storage_key}")
+        # Only written if nobody changed the category since it was read
+        await get_async_repository().put_category(RecordCodec.encode(existing_category))
+        get_response_cache().invalidate("forum_categories", community_id)
+        return existing_category
+
+    try:
+        existing_category = await get_conflict_retries().run("update_forum_category", apply_update)
+        logger.info("Forum category updated", extra={"key": storage_key})
 
         return ForumCategoryResponse(
             id=existing_category.id,
@@ -320,49 +327,59 @@ async def update_forum_category(
         )
     except HTTPException: # Re-raise HTTPExceptions directly
         raise
+    except VersionConflictError as e:
+        logger.warning("Gave up updating forum category after repeated conflicts: %s", e, extra={"key": storage_key})
+        raise HTTPException(status_code=409, detail="Forum category is being modified concurrently, please try again.")
     except Exception as e:
-        print(f"Error updating forum category {storage_key}: {e}")
+        logger.exception("Error updating forum category", extra={"key": storage_key})
         raise HTTPException(status_code=500, detail=f"Failed to update forum category: {str(e)}")
 
 
 @router.delete("/{community_id}/forum-categories/{category_id}", status_code=204, tags=["Forum Categories"])
 async def delete_forum_category(community_id: str, category_id: str, user: AuthorizedUser):
     """Soft delete a forum category. Admin only. Returns 204 No Content on success."""
-    community_doc = _get_community_doc_or_404(community_id)
+    community_doc = await _get_community_doc_or_404(community_id)
     _ensure_admin_permission(community_doc, user)
 
     storage_key = f"fcategory_{community_id}_{category_id}.json"
-    print(f"Attempting to soft-delete category with key: {storage_key}")
+    logger.debug("Attempting to soft-delete category", extra={"key": storage_key})
 
-    try:
-        # Fetch existing category data
+    async def apply_delete() -> None:
+        # Fetch existing category data, again on every retry
         try:
-            existing_category_dict = db.storage.json.get(key=storage_key)
+            existing_category_dict = await get_async_repository().get_category(community_id, category_id)
             if not isinstance(existing_category_dict, dict):
-                print(f"Category data for {storage_key} is not a dict for delete.")
+                logger.warning("Category data is not a dict for delete", extra={"key": storage_key})
                 raise HTTPException(status_code=404, detail="Forum category not found or data corrupted")
-            existing_category = ForumCategoryStoredData(**existing_category_dict)
+            existing_category = CATEGORY_CODEC.decode(existing_category_dict)
         except FileNotFoundError:
-            print(f"Forum category not found with key: {storage_key} for delete.")
+            logger.info("Forum category not found for delete", extra={"key": storage_key})
             raise HTTPException(status_code=404, detail="Forum category not found")
 
         # If already marked as deleted, consider it a success (idempotent)
         if existing_category.is_deleted:
-            print(f"Category {storage_key} is already marked as deleted.")
-            return # No content, so just return
+            logger.info("Category is already marked as deleted", extra={"key": storage_key})
+            return
 
         # Mark as deleted and save
         existing_category.is_deleted = True
         # Update timestamp for deletion if we add such a field later, e.g., deleted_at = datetime.now(timezone.utc)
-        
-        db.storage.json.put(key=storage_key, value=existing_category.model_dump(mode='json'))
-        print(f"Forum category '{existing_category.name}' (key: {storage_key}) marked as deleted.")
-        
+
+        # Only written if nobody changed the category since it was read
+        await get_async_repository().put_category(RecordCodec.encode(existing_category))
+        get_response_cache().invalidate("forum_categories", community_id)
+        logger.info("Forum category marked as deleted", extra={"key": storage_key})
+
+    try:
+        await get_conflict_retries().run("delete_forum_category", apply_delete)
         # HTTP 204 No Content response is automatically handled by FastAPI for status_code=204 and no return value
         return
 
     except HTTPException: # Re-raise HTTPExceptions directly
         raise
+    except VersionConflictError as e:
+        logger.warning("Gave up deleting forum category after repeated conflicts: %s", e, extra={"key": storage_key})
+        raise HTTPException(status_code=409, detail="Forum category is being modified concurrently, please try again.")
     except Exception as e:
-        print(f"Error soft-deleting forum category {storage_key}: {e}")
+        logger.exception("Error soft-deleting forum category", extra={"key": storage_key})
         raise HTTPException(status_code=500, detail=f"Failed to delete forum category: {str(e)}")
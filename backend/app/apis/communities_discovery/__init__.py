@@ -1,13 +1,16 @@
+import logging
 import uuid
 from typing import List, Optional
 
-import databutton as db
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 
-router = APIRouter(tags=["Community Discovery"])
+from app.libs.codec import RecordCodec
+from app.libs.repository import decode_cursor, encode_cursor, get_async_community_catalog
+
+logger = logging.getLogger(__name__)
 
-COMMUNITY_KEY_PREFIX = "community-"  # Confirmed from forum_topics API
+router = APIRouter(tags=["Community Discovery"])
 
 
 class CommunityBasicInfo(BaseModel):
@@ -21,62 +24,65 @@ class CommunityBasicInfo(BaseModel):
         from_attributes = True # Pydantic V2 equivalent of orm_mode
 
 
+# Catalog entries decode straight into the response model, their other fields are ignored
+COMMUNITY_INFO_CODEC = RecordCodec(CommunityBasicInfo)
+
+
 class CommunityListResponse(BaseModel):
     communities: List[CommunityBasicInfo]
     total_count: int
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page, null when this page is not full")
 
 
 @router.get("/communities", response_model=CommunityListResponse)
 async def list_all_communities(
     offset: int = Query(0, ge=0, description="Offset for pagination"),
-    limit: int = Query(20, ge=1, le=100, description="Limit for pagination")
+    limit: int = Query(20, ge=1, le=100, description="Limit for pagination"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, offset is applied after it")
 ):
     """List all available, non-deleted communities with basic information."""
-    all_community_infos = [] 
-    community_keys = []
+    try:
+        after = decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
     try:
-        all_json_files = db.storage.json.list()
-        for file_info in all_json_files:
-            if file_info.name.startswith(COMMUNITY_KEY_PREFIX) and file_info.name.endswith(".json"):
-                community_keys.append(file_info.name)
-    except Exception as e:
-        print(f"Error listing community files from storage: {e}")
+        # Served from the in-memory catalog, deleted communities are already excluded
+        paginated_entries, total_count = await get_async_community_catalog().page(offset, limit, after)
+    except Exception:
+        logger.exception("Error loading community catalog")
         raise HTTPException(status_code=500, detail="Error retrieving community list")
 
-    # Paginate keys before loading data
-    paginated_keys = community_keys[offset : offset + limit]
-
-    for key in paginated_keys:
-        try:
-            community_data = db.storage.json.get(key)
-            if isinstance(community_data, dict) and not community_data.get("is_deleted", False):
-                # Ensure ID is UUID object
-                if isinstance(community_data.get("id"), str):
-                    community_data["id"] = uuid.UUID(community_data["id"])
-                elif not isinstance(community_data.get("id"), uuid.UUID):
-                    print(f"Skipping community {key} due to invalid or missing ID type.")
-                    continue # Skip if ID is not a string or UUID
-
-                member_ids = community_data.get("member_ids", [])
-                if not isinstance(member_ids, list):
-                    member_ids = [] # Default to empty list if not a list
-                
-                basic_info = CommunityBasicInfo(
-                    id=community_data["id"],
-                    name=community_data.get("name", "Unnamed Community"),
-                    description=community_data.get("description"),
-                    member_count=len(member_ids)
-                )
-                all_community_infos.append(basic_info)
-        except FileNotFoundError:
-            # Should not happen if key came from list(), but handle defensively
-            print(f"Community file {key} listed but not found during retrieval.")
-        except Exception as e:
-            print(f"Error processing community data for key {key}: {e}")
-            # Optionally, decide if a single bad record should stop the whole list
+    all_community_infos = COMMUNITY_INFO_CODEC.decode_many(paginated_entries)
+
+    next_cursor = None
+    if len(paginated_entries) == limit:
+        next_cursor = encode_cursor(paginated_entries[-1]["created_at"], paginated_entries[-1]["id"])
 
     return CommunityListResponse(
         communities=all_community_infos,
-        total_count=len(community_keys) # Total count of all found (non-paginated) communities
+        total_count=total_count, # Total count of all non-deleted (non-paginated) communities
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/search/communities", response_model=CommunityListResponse)
+async def search_communities(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search for in community names and descriptions"),
+    offset: int = Query(0, ge=0, description="Offset for pagination"),
+    limit: int = Query(20, ge=1, le=100, description="Limit for pagination")
+):
+    """Search non-deleted communities by name and description, best matches first.
+
+    Every word of the query has to match the start of a word in the name or description.
+    """
+    try:
+        matched_entries, total_count = await get_async_community_catalog().search(q, offset, limit)
+    except Exception:
+        logger.exception("Error searching community catalog")
+        raise HTTPException(status_code=500, detail="Error searching communities")
+
+    return CommunityListResponse(
+        communities=COMMUNITY_INFO_CODEC.decode_many(matched_entries),
+        total_count=total_count # Total count of all matches (non-paginated)
     )
@@ -0,0 +1,63 @@
+"""Decoding of stored records straight into response models.
+
+Stored records are json dicts with ids and datetimes as strings. Pydantic
+parses those into the model's UUID and datetime fields itself, so a record is
+validated exactly once, without converting fields by hand or building an
+intermediate model.
+
+Usage:
+
+    from app.libs.codec import RecordCodec
+
+    TOPIC_CODEC = RecordCodec(ForumTopicResponse, defaults={"creator_id": "unknown"})
+
+    topic = TOPIC_CODEC.decode(topic_dict)
+    topics = TOPIC_CODEC.decode_many(topic_dicts)
+"""
+
+import logging
+from typing import Generic, TypeVar
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+logger = logging.getLogger(__name__)
+
+
+class RecordCodec(Generic[ModelT]):
+    """Decodes stored records into model, filling in defaults for fields older records lack."""
+
+    def __init__(self, model: type[ModelT], defaults: dict | None = None):
+        self.model = model
+        self.defaults = defaults or {}
+        self._list_adapter = TypeAdapter(list[model])
+
+    def _with_defaults(self, record: dict) -> dict:
+        return {**self.defaults, **record} if self.defaults else record
+
+    def decode(self, record: dict) -> ModelT:
+        """Validate one stored record, raises ValidationError."""
+        return self.model.model_validate(self._with_defaults(record))
+
+    def decode_many(self, records: list[dict]) -> list[ModelT]:
+        """Validate a batch of stored records in one call, skipping the ones that are invalid."""
+        records = [self._with_defaults(record) for record in records]
+        try:
+            return self._list_adapter.validate_python(records)
+        except ValidationError:
+            pass
+
+        # Rare: at least one record is broken, find it and keep the rest
+        decoded = []
+        for record in records:
+            try:
+                decoded.append(self.model.model_validate(record))
+            except ValidationError as e:
+                logger.warning("Skipping invalid %s record: %s", self.model.__name__, e, extra={"record_id": record.get("id")})
+        return decoded
+
+    @staticmethod
+    def encode(instance: BaseModel) -> dict:
+        """Json-compatible dict of a model, the shape records are stored in."""
+        return instance.model_dump(mode="json")
@@ -0,0 +1,62 @@
+"""Firebase Admin SDK, initialized on first use.
+
+Nothing is imported or initialized until get_firestore_client() (or
+get_firebase_app()) is called, so workers don't pay for firebase_admin and the
+FIREBASE_SERVICE_ACCOUNT_KEY secret lookup at startup:
+
+    from app.libs.firebase import get_firestore_client
+
+    client = get_firestore_client()
+    if client is None:
+        raise HTTPException(status_code=503, detail="Firestore is not available")
+
+Both return None when the SDK cannot be initialized, the reason is logged once.
+"""
+
+import functools
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def get_firebase_app():
+    """Initialize the Firebase Admin SDK from the FIREBASE_SERVICE_ACCOUNT_KEY secret once."""
+    import databutton as db
+    import firebase_admin
+    from firebase_admin import credentials
+
+    logger.info("Starting Firebase Admin SDK initialization")
+    try:
+        firebase_secret_value = db.secrets.get("FIREBASE_SERVICE_ACCOUNT_KEY")
+        if firebase_secret_value is None:
+            logger.error("FIREBASE_SERVICE_ACCOUNT_KEY secret is NOT SET. Cannot initialize Firebase.")
+            return None
+        cred = credentials.Certificate(json.loads(firebase_secret_value))
+
+        if not firebase_admin._apps:
+            app_firebase = firebase_admin.initialize_app(cred)
+            logger.info("Firebase Admin SDK initialized, app name: %s", app_firebase.name)
+        else:
+            app_firebase = firebase_admin.get_app() # Get the already initialized default app
+            logger.info("Using existing Firebase app, app name: %s", app_firebase.name)
+        return app_firebase
+    except json.JSONDecodeError as e:
+        logger.error("Failed to parse FIREBASE_SERVICE_ACCOUNT_KEY JSON: %s", e)
+    except Exception:
+        logger.exception("Firebase Admin SDK initialization failed")
+    return None
+
+
+@functools.cache
+def get_firestore_client():
+    """Firestore client of the Firebase app, created on first use."""
+    app_firebase = get_firebase_app()
+    if app_firebase is None:
+        logger.warning("Firebase app is not initialized. Firestore will not be available.")
+        return None
+
+    from firebase_admin import firestore
+
+    return firestore.client(app=app_firebase)
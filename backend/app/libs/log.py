@@ -0,0 +1,182 @@
+"""Structured logging for the app.
+
+configure_logging(), called by main.create_app, sends the records of the app's
+loggers through a bounded queue to a background thread, which writes them to
+stdout as one json object per line. Logging from a request never waits on
+stdout, and records are dropped (and counted) rather than blocking when the
+queue is full.
+
+Usage:
+
+    import logging
+
+    logger = logging.getLogger(__name__)
+
+    logger.debug("Fetching forum categories", extra={"community_id": community_id})
+
+Fields passed in extra become fields of the json object. Every record carries
+the id of the request it was logged from, which RequestIdMiddleware takes
+from the X-Request-ID header or generates, and sends back in the response.
+
+- LOG_LEVEL: level of the app's loggers (default DEBUG in development, INFO in production)
+- LOG_DEBUG_SAMPLE_RATE: fraction of debug records that are kept (default 1.0)
+- LOG_QUEUE_SIZE: records waiting to be written before new ones are dropped (default 10000)
+
+Debug logging costs next to nothing when the level is INFO, the record is
+not even created.
+"""
+
+import atexit
+import contextvars
+import copy
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+
+from app.env import Mode, mode
+
+# Loggers of our own code, everything else logs at WARNING and above
+APP_LOGGERS = ("app", "databutton_app", "main")
+
+REQUEST_ID_HEADER = b"x-request-id"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+# Id of the request being handled, None outside of requests
+request_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has, anything else was passed in extra
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One json object per record: time, level, logger, message, request id and extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request id and samples debug records."""
+
+    def __init__(self, debug_sample_rate: float):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and random.random() >= self.debug_sample_rate:
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records when the queue is full instead of blocking."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Rendered in the logging thread, the args may change after we return
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}
+
+
+@functools.cache
+def configure_logging() -> NonBlockingQueueHandler:
+    """Route all logging through the queue to stdout once, returns the queue handler."""
+    default_level = "DEBUG" if mode == Mode.DEV else "INFO"
+    level = os.environ.get("LOG_LEVEL", default_level).upper()
+    debug_sample_rate = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+    log_queue = queue.Queue(int(os.environ.get("LOG_QUEUE_SIZE", "10000")))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    # Writes out what is still queued on shutdown
+    atexit.register(listener.stop)
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestContextFilter(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(logging.WARNING)
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(level)
+    return handler
+
+
+class RequestIdMiddleware:
+    """Sets the request id for the records logged while handling a request.
+
+    A valid X-Request-ID header from the client or proxy is kept, otherwise a
+    new id is generated. The id is sent back in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
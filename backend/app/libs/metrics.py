@@ -0,0 +1,200 @@
+"""Latency histograms and component counters in the Prometheus text format.
+
+main.create_app adds MetricsMiddleware, which records the latency of every
+request per route template, and serves all metrics at METRICS_PATH (default
+"/metrics"). Set METRICS_TOKEN to require "Authorization: Bearer <token>" there.
+
+Besides requests, the histograms cover every storage pool call per
+repository method and, for the databutton backend, every db.storage.json
+get/put/delete/list per calling repository method:
+
+    get_metrics().storage_seconds.observe(("get", "repository.get_community", "ok"), seconds)
+
+Components with a stats() method are exported as gauges named
+app_<name>_<field>, nested per-name stats get a name label:
+
+    get_metrics().register_stats("response_cache", lambda: get_response_cache().stats())
+"""
+
+import bisect
+import functools
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable
+
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_NAME_PATTERN = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative latency histogram per combination of label values."""
+
+    def __init__(self, name: str, description: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> [count per bucket..., count above the last bucket], sum
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = {}
+
+    def observe(self, label_values: tuple, seconds: float) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            counts = self._counts.get(label_values)
+            if counts is None:
+                counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+                self._sums[label_values] = 0.0
+            counts[index] += 1
+            self._sums[label_values] += seconds
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = [(values, list(counts), self._sums[values]) for values, counts in self._counts.items()]
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for values, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _labels(self.label_names, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            cumulative += counts[-1]
+            bucket_labels = _labels(self.label_names, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, values)} {cumulative}")
+        return lines
+
+
+def _flatten(prefix: str, stats: dict, labels: tuple = ()):
+    """(metric name, label values, value) of the numbers in a stats() dict."""
+    if stats and all(isinstance(item, dict) for item in stats.values()):
+        # Stats per name, e.g. per storage call or per retried operation
+        for item_name, item_stats in stats.items():
+            yield from _flatten(prefix, item_stats, labels + (item_name,))
+        return
+    for key, value in stats.items():
+        name = METRIC_NAME_PATTERN.sub("_", f"{prefix}_{key}")
+        if isinstance(value, (int, float)):
+            yield name, labels, value
+        elif isinstance(value, dict):
+            yield from _flatten(name, value, labels)
+
+
+def _name_labels(count: int) -> tuple:
+    return ("name",) + tuple(f"name{level}" for level in range(2, count + 1))
+
+
+class Metrics:
+    """The app's histograms plus the stats() of registered components."""
+
+    def __init__(self):
+        self.request_seconds = Histogram(
+            "http_request_duration_seconds", "Request latency per route template.", ("method", "route", "status")
+        )
+        self.storage_pool_seconds = Histogram(
+            "storage_pool_call_duration_seconds", "Run time of storage calls from endpoints.", ("call",)
+        )
+        self.storage_seconds = Histogram(
+            "storage_op_duration_seconds", "Latency of db.storage.json operations per caller.", ("op", "caller", "outcome")
+        )
+        self._stats: dict[str, Callable[[], dict]] = {}
+
+    def register_stats(self, name: str, stats: Callable[[], dict]) -> None:
+        """Export the numbers returned by stats() on every scrape."""
+        self._stats[name] = stats
+
+    def observe_storage_op(self, op: str, caller: str, seconds: float, outcome: str) -> None:
+        self.storage_seconds.observe((op, caller, outcome), seconds)
+
+    def observe_pool_call(self, name: str, seconds: float) -> None:
+        self.storage_pool_seconds.observe((name,), seconds)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in (self.request_seconds, self.storage_pool_seconds, self.storage_seconds):
+            lines.extend(histogram.render())
+
+        for component, stats in self._stats.items():
+            try:
+                values = list(_flatten(f"app_{component}", stats()))
+            except Exception:
+                logger.exception("Failed to collect stats", extra={"component": component})
+                continue
+            # The samples of a metric have to follow its TYPE line together
+            samples: dict[str, list[str]] = {}
+            for name, labels, value in values:
+                samples.setdefault(name, []).append(f"{name}{_labels(_name_labels(len(labels)), labels)} {float(value)}")
+            for name, name_samples in samples.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(name_samples)
+        return "\n".join(lines) + "\n"
+
+
+@functools.cache
+def get_metrics() -> Metrics:
+    """Create the metrics of this process once and reuse them."""
+    return Metrics()
+
+
+class MetricsMiddleware:
+    """Records the latency of every http request per method, route template and status class."""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope, unmatched paths share one label
+            route = scope.get("route")
+            template = getattr(route, "path_format", None) or "unmatched"
+            self.metrics.request_seconds.observe(
+                (scope["method"], template, f"{status_code // 100}xx"), time.perf_counter() - started_at
+            )
+
+
+async def metrics_endpoint(request: Request) -> PlainTextResponse:
+    """All metrics in the Prometheus text format."""
+    token = os.environ.get("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}"):
+        return PlainTextResponse("Not authenticated", status_code=401)
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
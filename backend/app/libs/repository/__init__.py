@@ -0,0 +1,157 @@
+"""Storage repository for communities, forum categories, forum topics and memberships.
+
+Usage from async endpoints, which run the blocking storage calls on a bounded
+worker pool of STORAGE_WORKERS threads (default 16) with at most
+STORAGE_MAX_CONCURRENCY calls running or queued (default 64):
+
+    from app.libs.repository import get_async_repository
+
+    community = await get_async_repository().get_community(community_id)
+
+get_repository() returns the same repository for synchronous callers.
+
+The backend is chosen with the STORAGE_BACKEND environment variable:
+
+- "databutton" (default): one json document per record in db.storage.json
+- "sqlite": embedded SQLite database at STORAGE_SQLITE_PATH (default "storage.sqlite3")
+
+The databutton backend keeps the keys of the bucket in memory, so listing a
+key prefix does not list the whole bucket; the keys are relisted every
+STORAGE_KEY_LISTING_TTL_SECONDS (default 60) to pick up other workers' writes.
+It reads through an in-process cache bounded by
+STORAGE_CACHE_MAX_BYTES (default 64 MiB, 0 disables it) whose entries expire
+after STORAGE_CACHE_TTL_SECONDS (default 30). Its counters are available from
+get_json_store().stats(). Listings fetch up to STORAGE_GET_MANY_FANOUT
+documents at once (default 16).
+
+Forum categories, member counters and the index documents of the databutton
+backend are written with compare-and-swap on their "version" field.
+Endpoints retry such read-modify-write operations up to
+STORAGE_CAS_MAX_ATTEMPTS times (default 5):
+
+    await get_conflict_retries().run("update_forum_category", update)
+
+Their conflict rates are available from get_conflict_retries().stats().
+
+Community discovery reads from an in-memory catalog, reloaded from the
+repository every COMMUNITY_CATALOG_TTL_SECONDS (default 60):
+
+    communities, total_count = await get_async_community_catalog().page(offset, limit)
+
+Call timings of both are available from get_storage_pool().stats(). They are
+also recorded in the latency histograms of app.libs.metrics, as is every
+db.storage.json operation, tagged with the storage call it ran in.
+
+Index documents of the databutton backend that did not exist in earlier
+versions are built by a one-time backfill, see app.libs.repository.backfill.
+
+Importing this package is cheap: the databutton SDK is imported and the
+backend opened by the first get_repository() call.
+"""
+
+import functools
+import os
+
+from app.libs.metrics import get_metrics
+
+from .async_storage import AsyncStorage, StoragePool
+from .base import Repository
+from .batch import get_many
+from .cache import CachedJsonStore
+from .catalog import CommunityCatalog
+from .cursor import decode_cursor, encode_cursor
+from .instrumented import InstrumentedJsonStore
+from .keys import KeyListingStore
+from .versions import ConflictRetries, VersionConflictError, VersionedJsonStore
+
+
+@functools.cache
+def get_json_store():
+    """Create the db.storage.json store used by the databutton backend once and reuse it."""
+    # Imported on first use, the databutton SDK takes about half a second to import
+    import databutton as db
+
+    store = KeyListingStore(
+        VersionedJsonStore(InstrumentedJsonStore(db.storage.json, get_metrics().observe_storage_op)),
+        float(os.environ.get("STORAGE_KEY_LISTING_TTL_SECONDS", "60")),
+    )
+    max_bytes = int(os.environ.get("STORAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    if max_bytes <= 0:
+        return store
+    ttl_seconds = float(os.environ.get("STORAGE_CACHE_TTL_SECONDS", "30"))
+    return CachedJsonStore(store, max_bytes, ttl_seconds)
+
+
+@functools.cache
+def get_repository() -> Repository:
+    """Create the configured repository once and reuse it."""
+    backend = os.environ.get("STORAGE_BACKEND", "databutton")
+
+    if backend == "databutton":
+        from .json_storage import JsonStorageRepository
+
+        max_fanout = int(os.environ.get("STORAGE_GET_MANY_FANOUT", "16"))
+        return JsonStorageRepository(get_json_store(), max_fanout)
+    if backend == "sqlite":
+        from .sqlite import SqliteRepository
+
+        return SqliteRepository(os.environ.get("STORAGE_SQLITE_PATH", "storage.sqlite3"))
+
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+@functools.cache
+def get_community_catalog() -> CommunityCatalog:
+    """Create the in-memory community catalog once and reuse it."""
+    ttl_seconds = float(os.environ.get("COMMUNITY_CATALOG_TTL_SECONDS", "60"))
+    return CommunityCatalog(get_repository(), ttl_seconds)
+
+
+@functools.cache
+def get_conflict_retries() -> ConflictRetries:
+    """Create the retry policy for version conflicts once and reuse it."""
+    return ConflictRetries(int(os.environ.get("STORAGE_CAS_MAX_ATTEMPTS", "5")))
+
+
+@functools.cache
+def get_storage_pool() -> StoragePool:
+    """Create the worker pool for storage calls from async endpoints once and reuse it."""
+    max_workers = int(os.environ.get("STORAGE_WORKERS", "16"))
+    max_concurrency = int(os.environ.get("STORAGE_MAX_CONCURRENCY", "64"))
+    return StoragePool(max_workers, max_concurrency, get_metrics().observe_pool_call)
+
+
+@functools.cache
+def get_async_repository() -> AsyncStorage:
+    """Awaitable repository running its calls on the storage pool."""
+    return AsyncStorage(get_repository(), get_storage_pool(), "repository")
+
+
+@functools.cache
+def get_async_community_catalog() -> AsyncStorage:
+    """Awaitable community catalog running its calls on the storage pool."""
+    return AsyncStorage(get_community_catalog(), get_storage_pool(), "catalog")
+
+
+__all__ = [
+    "AsyncStorage",
+    "CachedJsonStore",
+    "CommunityCatalog",
+    "ConflictRetries",
+    "InstrumentedJsonStore",
+    "KeyListingStore",
+    "Repository",
+    "StoragePool",
+    "VersionConflictError",
+    "VersionedJsonStore",
+    "decode_cursor",
+    "encode_cursor",
+    "get_async_community_catalog",
+    "get_async_repository",
+    "get_community_catalog",
+    "get_conflict_retries",
+    "get_json_store",
+    "get_many",
+    "get_repository",
+    "get_storage_pool",
+]
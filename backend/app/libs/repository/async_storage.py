@@ -0,0 +1,113 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+import time
+
+from app.libs.storage_io import storage_io_var
+
+# Name of the storage call a thread is running, e.g. "repository.get_community"
+storage_call_var: contextvars.ContextVar[str] = contextvars.ContextVar("storage_call", default="direct")
+
+
+class StoragePool:
+    """Bounded worker pool running blocking storage calls for async endpoints.
+
+    At most max_workers calls run at once; max_concurrency caps the calls that
+    are running or queued, further callers wait on the event loop. Time spent
+    queued and running is recorded per call name, and passed to
+    observe(name, run_seconds) when given, e.g. for latency histograms.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int, observe=None):
+        self.max_workers = max_workers
+        self.max_concurrency = max_concurrency
+        self.observe = observe
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="storage"
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # name -> {"calls", "errors", "wait_seconds", "run_seconds", "max_run_seconds"}
+        self._timings: dict[str, dict[str, float]] = {}
+
+    def _record(self, name: str, wait_seconds: float, run_seconds: float, failed: bool) -> None:
+        with self._lock:
+            timing = self._timings.setdefault(
+                name,
+                {"calls": 0, "errors": 0, "wait_seconds": 0.0, "run_seconds": 0.0, "max_run_seconds": 0.0},
+            )
+            timing["calls"] += 1
+            timing["errors"] += failed
+            timing["wait_seconds"] += wait_seconds
+            timing["run_seconds"] += run_seconds
+            timing["max_run_seconds"] = max(timing["max_run_seconds"], run_seconds)
+        if self.observe is not None:
+            self.observe(name, run_seconds)
+        request_io = storage_io_var.get()
+        if request_io is not None:
+            request_io.record_call(run_seconds)
+
+    async def run(self, name: str, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and return its result."""
+        queued_at = time.perf_counter()
+        started_at = None
+
+        def call():
+            nonlocal started_at
+            started_at = time.perf_counter()
+            storage_call_var.set(name)
+            return fn(*args, **kwargs)
+
+        async with self._semaphore:
+            with self._lock:
+                self._in_flight += 1
+            failed = True
+            try:
+                # The call sees the caller's context, e.g. the request id of its log records
+                context = contextvars.copy_context()
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, context.run, call)
+                failed = False
+                return result
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    self._in_flight -= 1
+                started_at = started_at or finished_at
+                self._record(name, started_at - queued_at, finished_at - started_at, failed)
+
+    def stats(self) -> dict:
+        """Pool size, calls in flight and timings per call name."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "calls": {name: dict(timing) for name, timing in self._timings.items()},
+            }
+
+
+class AsyncStorage:
+    """Awaitable view of a repository or catalog, running its methods on a StoragePool.
+
+    Usage:
+
+        community = await get_async_repository().get_community(community_id)
+    """
+
+    def __init__(self, target, pool: StoragePool, name: str):
+        self._target = target
+        self._pool = pool
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        method = getattr(self._target, attr)
+        call_name = f"{self._name}.{attr}"
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self._pool.run(call_name, method, *args, **kwargs)
+
+        return call
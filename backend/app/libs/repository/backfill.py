@@ -0,0 +1,37 @@
+"""One-time backfill of the index documents of the databutton backend.
+
+Run from the backend directory, with the environment of the app, before
+deploying a version that relies on the indexes:
+
+    python -m app.libs.repository.backfill
+
+Users without a per-user community index are treated as having no
+communities, so the indexes of users who created or joined communities
+before the index existed have to be built here. Category and topic indexes
+missing for older communities and categories are built here too, rather
+than by the first request listing them. Only missing entries and indexes
+are added, so running it again is safe.
+"""
+
+import logging
+import os
+
+from app.libs.log import configure_logging
+from app.libs.repository import get_repository
+
+# Named explicitly, run as a script this module is __main__
+logger = logging.getLogger("app.libs.repository.backfill")
+
+
+def main() -> None:
+    configure_logging()
+    if os.environ.get("STORAGE_BACKEND", "databutton") != "databutton":
+        logger.info("Nothing to backfill, the sqlite backend keeps no index documents")
+        return
+    repository = get_repository()
+    logger.info("Indexed the communities of %d users", repository.backfill_user_communities())
+    logger.info("Indexed the categories and topics of %d communities", repository.backfill_topic_indexes())
+
+
+if __name__ == "__main__":
+    main()
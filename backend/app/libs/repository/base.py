@@ -0,0 +1,164 @@
+from abc import ABC, abstractmethod
+
+# Storage key prefixes / patterns shared by the json backends
+COMMUNITY_KEY_PREFIX = "community-"
+COMMUNITY_KEY_PATTERN = "community-{community_id}.json"
+FCATEGORY_KEY_PATTERN = "fcategory_{community_id}_{category_id}.json"
+FTOPIC_KEY_PATTERN = "forumtopic_{community_id}_{category_id}_{topic_id}.json"
+
+
+def catalog_entry(community: dict) -> dict:
+    """Compact view of a community document used by the community catalog."""
+    member_ids = community.get("member_ids", [])
+    if not isinstance(member_ids, list):
+        member_ids = []
+    return {
+        "id": community["id"],
+        "name": community.get("name", "Unnamed Community"),
+        "description": community.get("description"),
+        "member_count": community.get("member_count", len(member_ids)),
+        "is_deleted": community.get("is_deleted", False),
+        "created_at": community.get("created_at", ""),
+    }
+
+
+class Repository(ABC):
+    """Storage for communities, forum categories, forum topics and memberships.
+
+    Records are plain json-compatible dicts in the same shape the routers have
+    always stored them in (ids and datetimes as strings). Getters raise
+    FileNotFoundError when a record does not exist, mirroring db.storage.json.
+
+    Memberships are stored apart from the community document, so joining does
+    not rewrite it. The member_ids of a community document only hold the
+    creator and the members who joined before that; use is_member,
+    list_members and count_members for the current members.
+
+    Communities, forum categories and member counters carry a "version" field;
+    writes of categories and member counters only succeed if the stored record
+    is still at the version they were read at (0 for new records) and raise
+    VersionConflictError otherwise.
+
+    Topic listings accept an after=(created_at, id) position and continue right
+    after that record in listing order, before applying offset.
+    """
+
+    # --- Communities ---
+    @abstractmethod
+    def get_community(self, community_id: str) -> dict:
+        """Get a community document by id."""
+
+    @abstractmethod
+    def create_community(self, community: dict) -> None:
+        """Store a new community document."""
+
+    @abstractmethod
+    def add_member(self, community_id: str, user_id: str) -> bool:
+        """Add user to the community members, return False if they already were one.
+
+        Raises VersionConflictError if another join updated the member count
+        first. Calling it again then finishes the join and returns True.
+        """
+
+    @abstractmethod
+    def is_member(self, community_id: str, user_id: str) -> bool:
+        """Check whether user is a member of the community."""
+
+    @abstractmethod
+    def list_members(self, community_id: str) -> list[str]:
+        """Return the member ids, those in the community document first, then the others by id."""
+
+    @abstractmethod
+    def count_members(self, community_id: str) -> int:
+        """Return the number of members of the community."""
+
+    @abstractmethod
+    def get_memberships(self, user_id: str, community_ids: list[str]) -> dict[str, dict]:
+        """Return {"is_member", "is_creator"} of user for each community id.
+
+        Creators count as members. Unknown communities are reported as neither.
+        """
+
+    @abstractmethod
+    def get_community_version(self, community_id: str) -> str:
+        """Version of a community document and its members, changes with every write to them.
+
+        Versions are read past any cache, like the versions below.
+        """
+
+    @abstractmethod
+    def get_community_snapshot(self, community_id: str) -> tuple[str | None, dict]:
+        """Return the version of a community and its document with member_ids, read as of that version.
+
+        The version is None while a join is still being written, such a
+        document is not to be cached under any version.
+        """
+
+    @abstractmethod
+    def list_catalog(self) -> list[dict]:
+        """Return catalog entries of all communities, including soft-deleted ones, oldest first."""
+
+    @abstractmethod
+    def list_user_communities(self, user_id: str) -> list[dict]:
+        """Return all communities the user created or is a member of, with their current member_ids."""
+
+    # --- Forum categories ---
+    @abstractmethod
+    def get_category(self, community_id: str, category_id: str) -> dict:
+        """Get a forum category document, including soft-deleted ones."""
+
+    @abstractmethod
+    def put_category(self, category: dict) -> None:
+        """Create or overwrite a forum category document if it is still at category["version"]."""
+
+    @abstractmethod
+    def list_categories(self, community_id: str) -> list[dict]:
+        """Return all forum category documents of a community, including soft-deleted ones."""
+
+    @abstractmethod
+    def get_categories_version(self, community_id: str) -> int:
+        """Version of the forum categories of a community, changes with every category write."""
+
+    @abstractmethod
+    def list_categories_snapshot(self, community_id: str) -> tuple[int, list[dict]]:
+        """Return the version of the forum categories of a community and the categories as of that version."""
+
+    # --- Forum topics ---
+    @abstractmethod
+    def put_topic(self, topic: dict) -> None:
+        """Create or overwrite a forum topic document."""
+
+    @abstractmethod
+    def find_topic(self, community_id: str, topic_id: str) -> dict:
+        """Get a non-deleted forum topic of a community by id."""
+
+    @abstractmethod
+    def list_category_topics(
+        self,
+        community_id: str,
+        category_id: str,
+        offset: int,
+        limit: int,
+        after: tuple[str, str] | None = None,
+    ) -> tuple[list[dict], int]:
+        """Return a page of non-deleted topics in a category, newest first, and their total count.
+
+        The page holds limit topics unless there are no more after it.
+        """
+
+    @abstractmethod
+    def get_category_topics_version(self, community_id: str, category_id: str) -> int:
+        """Version of the topics of a category, changes with every topic write in it."""
+
+    @abstractmethod
+    def get_community_topics_version(self, community_id: str) -> int:
+        """Version of the topics of a community, changes with every topic write in it."""
+
+    @abstractmethod
+    def list_latest_topics(
+        self, community_id: str, limit: int, after: tuple[str, str] | None = None
+    ) -> tuple[list[dict], int]:
+        """Return the newest non-deleted topics of a community and their total count.
+
+        The page holds limit topics unless there are no more after it.
+        """
@@ -0,0 +1,24 @@
+import concurrent.futures
+import contextvars
+
+
+def get_many(store, keys: list[str], executor: concurrent.futures.Executor, fresh: bool = False) -> list:
+    """Get documents for keys concurrently on executor, in the order of keys.
+
+    A key that fails to load has its exception in place of the document (e.g.
+    FileNotFoundError), the other keys are unaffected. The fan-out is bounded by
+    the number of workers of executor. With fresh, the documents are read past
+    the cache with store.get_uncached.
+    """
+
+    def get(key: str):
+        try:
+            return store.get_uncached(key) if fresh else store.get(key)
+        except Exception as e:
+            return e
+
+    if len(keys) <= 1:
+        return [get(key) for key in keys]
+    # Each get runs in the caller's context, so it is accounted to the caller's storage call
+    futures = [executor.submit(contextvars.copy_context().run, get, key) for key in keys]
+    return [future.result() for future in futures]
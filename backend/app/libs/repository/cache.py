@@ -0,0 +1,124 @@
+import collections
+import json
+import threading
+import time
+
+
+class CachedJsonStore:
+    """Read-through cache in front of a db.storage.json compatible store.
+
+    Documents are kept json encoded, so every get returns a fresh dict callers
+    are free to modify, and the cache is bounded by the encoded size. Entries
+    expire after ttl_seconds to pick up writes made by other workers, and puts
+    and deletes through this store update the cache right away.
+    """
+
+    def __init__(self, store, max_bytes: int, ttl_seconds: float):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (expires_at, encoded document), least recently used first
+        self._entries: collections.OrderedDict[str, tuple[float, bytes]] = collections.OrderedDict()
+        self._size = 0
+        # Bumped by every write, a read that raced with a write is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def _remember(self, key: str, value: dict, generation: int | None = None) -> None:
+        encoded = json.dumps(value).encode()
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._drop(key)
+            if len(encoded) > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, encoded)
+            self._size += len(encoded)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def get(self, key: str, *, default: dict | None = None) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1])
+            self._drop(key)
+            self.misses += 1
+            generation = self._generation
+
+        try:
+            value = self.store.get(key)
+        except FileNotFoundError:
+            if default is not None:
+                return default
+            raise
+        if isinstance(value, dict):
+            self._remember(key, value, generation)
+        return value
+
+    def get_uncached(self, key: str) -> dict | None:
+        """Read key from the store, bypassing the cache, e.g. before changing a document other workers change too.
+
+        The result is not cached, the write that usually follows caches what
+        it writes.
+        """
+        with self._lock:
+            self._drop(key)
+        return self.store.get(key)
+
+    def put(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._generation += 1
+            self._drop(key)
+        self.store.put(key=key, value=value)
+        self._remember(key, value)
+
+    def put_if_version(self, key: str, value: dict, expected_version: int) -> int:
+        # A conflict leaves the key uncached, so the retry reads the current record
+        with self._lock:
+            self._generation += 1
+            self._drop(key)
+        version = self.store.put_if_version(key, value, expected_version)
+        self._remember(key, {**value, "version": version})
+        return version
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self._drop(key)
+        self.store.delete(key)
+
+    def list_keys(self, prefix: str = "") -> list[str]:
+        return self.store.list_keys(prefix)
+
+    def refresh_keys(self, older_than: float) -> None:
+        self.store.refresh_keys(older_than)
+
+    def list(self):
+        return self.store.list()
+
+    def stats(self) -> dict:
+        """Counters, hit ratio and current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
@@ -0,0 +1,95 @@
+import bisect
+import threading
+import time
+
+from .base import Repository, catalog_entry
+from .search import CommunitySearchIndex
+
+
+class CommunityCatalog:
+    """In-memory catalog of community entries for discovery.
+
+    Entries are loaded from the repository on first use and reloaded after
+    ttl_seconds to pick up writes made by other workers. Writes in this process
+    are applied with upsert, so reads in between need no storage access. A
+    search index over the non-deleted entries is kept in step with them.
+    """
+
+    def __init__(self, repository: Repository, ttl_seconds: float):
+        self._repository = repository
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        # (created_at, id) of non-deleted entries, oldest first
+        self._order: list[tuple[str, str]] = []
+        self._search_index = CommunitySearchIndex()
+        self._loaded_at: float | None = None
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self._ttl_seconds:
+            return
+        entries = {entry["id"]: entry for entry in self._repository.list_catalog()}
+        with self._lock:
+            # Only reindex what changed since the previous load
+            for community_id in self._entries.keys() - entries.keys():
+                self._search_index.remove(community_id)
+            for entry in entries.values():
+                self._index(self._entries.get(entry["id"]), entry)
+            self._entries = entries
+            self._order = sorted(
+                (entry["created_at"], entry["id"])
+                for entry in entries.values()
+                if not entry["is_deleted"]
+            )
+            self._loaded_at = time.monotonic()
+
+    def _index(self, previous: dict | None, entry: dict) -> None:
+        if entry["is_deleted"]:
+            self._search_index.remove(entry["id"])
+        elif (
+            previous is None
+            or previous["is_deleted"]
+            or previous["name"] != entry["name"]
+            or previous["description"] != entry["description"]
+        ):
+            self._search_index.add(entry)
+
+    def upsert(self, community: dict) -> None:
+        """Apply a created or joined community document to the catalog."""
+        if self._loaded_at is None:
+            # Nothing cached yet, the next read loads the current state
+            return
+        entry = catalog_entry(community)
+        with self._lock:
+            previous = self._entries.get(entry["id"])
+            if previous is not None and not previous["is_deleted"]:
+                position = (previous["created_at"], previous["id"])
+                index = bisect.bisect_left(self._order, position)
+                if index < len(self._order) and self._order[index] == position:
+                    del self._order[index]
+            self._index(previous, entry)
+            self._entries[entry["id"]] = entry
+            if not entry["is_deleted"]:
+                bisect.insort(self._order, (entry["created_at"], entry["id"]))
+
+    def page(
+        self, offset: int, limit: int, after: tuple[str, str] | None = None
+    ) -> tuple[list[dict], int]:
+        """Return a page of non-deleted entries, oldest first, and their total count.
+
+        With after=(created_at, id) the page starts right after that entry,
+        before applying offset.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            start = 0 if after is None else bisect.bisect_right(self._order, tuple(after))
+            start += offset
+            page = self._order[start : start + limit]
+            return [self._entries[community_id] for _, community_id in page], len(self._order)
+
+    def search(self, query: str, offset: int, limit: int) -> tuple[list[dict], int]:
+        """Return a page of non-deleted entries matching query, best first, and the number of matches."""
+        self._ensure_loaded()
+        with self._lock:
+            community_ids, total_count = self._search_index.search(query, offset, limit, self._entries)
+            return [self._entries[community_id] for community_id in community_ids], total_count
@@ -0,0 +1,20 @@
+import base64
+import json
+
+
+def encode_cursor(created_at: str, record_id: str) -> str:
+    """Opaque pagination token for the position of a record in a listing."""
+    raw = json.dumps([created_at, record_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    """Inverse of encode_cursor, raises ValueError for malformed tokens."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(created_at, str) or not isinstance(record_id, str):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return created_at, record_id
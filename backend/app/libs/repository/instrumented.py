@@ -0,0 +1,49 @@
+import time
+
+from app.libs.storage_io import storage_io_var
+
+from .async_storage import storage_call_var
+
+
+class InstrumentedJsonStore:
+    """Times every call to a db.storage.json compatible store.
+
+    observe(op, caller, seconds, outcome) is called after each get, put,
+    delete and list, with the storage call it ran in as caller (e.g.
+    "repository.list_latest_topics") and "ok", "missing" or "error" as outcome.
+    The operation is also counted for the request it ran in.
+    """
+
+    def __init__(self, store, observe):
+        self.store = store
+        self.observe = observe
+
+    def _call(self, op: str, fn, *args, document=None, **kwargs):
+        started_at = time.perf_counter()
+        outcome = "error"
+        try:
+            result = fn(*args, **kwargs)
+            outcome = "ok"
+            return result
+        except FileNotFoundError:
+            outcome = "missing"
+            raise
+        finally:
+            seconds = time.perf_counter() - started_at
+            self.observe(op, storage_call_var.get(), seconds, outcome)
+            request_io = storage_io_var.get()
+            if request_io is not None:
+                # The document read or written, for the byte count
+                request_io.record_operation(op, seconds, result if outcome == "ok" and op == "get" else document)
+
+    def get(self, key: str, *, default: dict | None = None):
+        return self._call("get", self.store.get, key, default=default)
+
+    def put(self, key: str, value: dict) -> None:
+        self._call("put", self.store.put, key=key, value=value, document=value)
+
+    def delete(self, key: str) -> None:
+        self._call("delete", self.store.delete, key)
+
+    def list(self):
+        return self._call("list", self.store.list)
@@ -0,0 +1,748 @@
+import bisect
+import collections
+import concurrent.futures
+import itertools
+import logging
+import time
+from typing import Callable, Iterator
+
+from .base import (
+    COMMUNITY_KEY_PATTERN,
+    COMMUNITY_KEY_PREFIX,
+    FCATEGORY_KEY_PATTERN,
+    FTOPIC_KEY_PATTERN,
+    Repository,
+    catalog_entry,
+)
+from .batch import get_many
+from .keys import KeyListingStore
+from .versions import StripedLocks, VersionConflictError, VersionedJsonStore, record_version
+
+logger = logging.getLogger(__name__)
+
+# Index documents maintained next to the records, topic indexes are a head listing their month chunks
+FTOPIC_INDEX_KEY_PATTERN = "ftopicmonths_{community_id}_{category_id}.json"
+FTOPIC_INDEX_CHUNK_KEY_PATTERN = "ftopicmonth_{community_id}_{category_id}_{month}.json"
+FTOPIC_COMMUNITY_INDEX_KEY_PATTERN = "ftopiccommunitymonths_{community_id}.json"
+FTOPIC_COMMUNITY_INDEX_CHUNK_KEY_PATTERN = "ftopiccommunitymonth_{community_id}_{month}.json"
+FTOPIC_REF_KEY_PATTERN = "ftopicref_{topic_id}.json"
+USER_COMMUNITIES_KEY_PATTERN = "usercommunities_{user_id}.json"
+COMMUNITY_CATALOG_KEY = "communitycatalogmonths.json"
+COMMUNITY_CATALOG_CHUNK_KEY_PATTERN = "communitycatalog_{month}.json"
+MEMBERSHIP_KEY_PREFIX = "membership_{community_id}_"
+MEMBERSHIP_KEY_PATTERN = "membership_{community_id}_{user_id}.json"
+MEMBER_COUNT_KEY_PATTERN = "membercount_{community_id}.json"
+FCATEGORY_INDEX_KEY_PATTERN = "fcategoryindex_{community_id}.json"
+FTOPIC_CATEGORY_VERSION_KEY_PATTERN = "ftopicversion_{community_id}_{category_id}.json"
+FTOPIC_COMMUNITY_VERSION_KEY_PATTERN = "ftopicversion_{community_id}.json"
+
+# Attempts to bump a version counter before giving up on concurrent bumps
+MAX_VERSION_BUMPS = 10
+
+# Users whose joins a member counter remembers, so a retried join is not counted twice
+MEMBER_COUNT_RECENT_JOINS = 50
+
+
+def split_by_month(entries: list, order: Callable = lambda entry: entry[:2]) -> dict[str, list]:
+    """Index entries by the month of their created_at, oldest first.
+
+    order(entry) is the (created_at, id) an entry is sorted by, by default
+    its first two items.
+    """
+    months = collections.defaultdict(list)
+    for entry in entries:
+        months[order(entry)[0][:7]].append(entry)
+    return {month: sorted(month_entries, key=order) for month, month_entries in sorted(months.items())}
+
+
+def catalog_order(entry: dict) -> tuple[str, str]:
+    return entry["created_at"], entry["id"]
+
+
+class JsonStorageRepository(Repository):
+    """Repository keeping one json document per record in db.storage.json.
+
+    Topics in a category are listed through an index of [created_at, topic_id]
+    pairs of the non-deleted topics, oldest first, so a page only reads the
+    topics on it. The index is split into a chunk document per month, listed
+    with their entry counts by a small head document, so a page reads the head
+    and the one or two chunks it falls in, and a new topic rewrites only the
+    chunk of its month. The latest topics of a community are listed the same
+    way, from an index of all its topics that also holds their category ids.
+    Each topic also has a reference document pointing at its community,
+    category and storage key, so it can be found by id alone. A per-user index
+    lists the communities each user created or joined, and a catalog holds the
+    compact entries of all communities, in month chunks like the topic indexes.
+    Every membership is its own record, so a membership check is a single read,
+    and each community has a member counter document updated on join, which the
+    catalog listing reads the member counts from. The categories of a community
+    are listed through an index document of their ids, whose version is the
+    version of the categories. Version counters per community and per category
+    change with every write to their topics. Index documents are read past the
+    cache and written with compare-and-swap on their version, so workers
+    changing the same index don't lose each other's entries. Other list queries
+    scan the keys under a prefix and fetch every match. Documents of a listing
+    are fetched concurrently, at most max_fanout at a time.
+    """
+
+    def __init__(self, store=None, max_fanout: int = 16):
+        # Anything with the get/put/delete interface of db.storage.json plus get_uncached, list_keys(prefix)
+        # and put_if_version
+        if store is None:
+            import databutton as db
+
+            store = KeyListingStore(VersionedJsonStore(db.storage.json), ttl_seconds=60)
+        self.store = store
+        self._fetch_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_fanout, thread_name_prefix="storage-get"
+        )
+        # Serializes read-modify-write of index documents within this process, never held while taking
+        # another index lock, since keys share locks
+        self._index_locks = StripedLocks()
+
+    # --- Helpers ---
+    def _get_doc(self, key: str) -> dict:
+        doc = self.store.get(key)
+        if not doc or not isinstance(doc, dict):
+            raise FileNotFoundError(key)
+        return doc
+
+    def _list_keys(self, prefix: str) -> list[str]:
+        return [key for key in self.store.list_keys(prefix) if key.endswith(".json")]
+
+    def _load_docs(self, keys: list[str], fresh: bool = False) -> list[dict]:
+        docs = []
+        for key, doc in zip(keys, get_many(self.store, keys, self._fetch_executor, fresh)):
+            if isinstance(doc, FileNotFoundError):
+                logger.warning("File not found during list (should not happen)", extra={"key": key})
+            elif isinstance(doc, Exception):
+                logger.error("Error loading storage file: %s", doc, extra={"key": key})
+            elif isinstance(doc, dict):
+                docs.append(doc)
+            else:
+                logger.warning("Skipping non-dict data", extra={"key": key})
+        return docs
+
+    def _load_topics(self, prefix: str) -> list[dict]:
+        topics = [
+            topic
+            for topic in self._load_docs(self._list_keys(prefix))
+            if not topic.get("is_deleted", False)
+        ]
+        # Newest first, created_at is stored as a UTC ISO 8601 string
+        topics.sort(key=lambda t: (t.get("created_at", ""), t.get("id", "")), reverse=True)
+        return topics
+
+    def _topic_index_key(self, community_id: str, category_id: str) -> str:
+        return FTOPIC_INDEX_KEY_PATTERN.format(community_id=community_id, category_id=category_id)
+
+    def _read_shared_doc(self, key: str, build: Callable[[], dict], fresh: bool = False) -> dict:
+        """Read a document maintained by all workers, building and storing it if it does not exist yet.
+
+        fresh reads past the cache, as needed before changing the document.
+        """
+        try:
+            return self.store.get_uncached(key) if fresh else self.store.get(key)
+        except FileNotFoundError:
+            pass
+        doc = build()
+        try:
+            doc["version"] = self.store.put_if_version(key, doc, 0)
+        except VersionConflictError:
+            # Another worker built it first
+            return self.store.get_uncached(key)
+        return doc
+
+    def _update_shared_doc(self, key: str, read: Callable[[], dict], change: Callable[[dict], dict | None]) -> None:
+        """Read-modify-write of a document maintained by all workers.
+
+        read() returns the current document past the cache, change(doc) the
+        document to write or None to leave it as it is. The write only
+        succeeds if nobody wrote the document since it was read, otherwise it
+        is read and changed again.
+        """
+        with self._index_locks[key]:
+            for _ in range(MAX_VERSION_BUMPS):
+                doc = read()
+                value = change(doc)
+                if value is None:
+                    return
+                try:
+                    self.store.put_if_version(key, value, record_version(doc))
+                    return
+                except VersionConflictError:
+                    continue
+        raise VersionConflictError(key, record_version(doc), record_version(doc) + 1)
+
+    def _read_index_chunk(self, key: str, fresh: bool = False) -> dict:
+        # Months without entries have no chunk
+        try:
+            return self.store.get_uncached(key) if fresh else self.store.get(key)
+        except FileNotFoundError:
+            return {"entries": []}
+
+    def _build_month_index(self, chunk_key: Callable[[str], str], entries: list, **order) -> dict:
+        """Store the chunks of entries, returns the head document listing them."""
+        months = []
+        for month, month_entries in split_by_month(entries, **order).items():
+            try:
+                self.store.put_if_version(chunk_key(month), {"entries": month_entries}, 0)
+            except VersionConflictError:
+                # Another worker built it first, or added to it once its head existed
+                month_entries = self._read_index_chunk(chunk_key(month), fresh=True)["entries"]
+            months.append([month, len(month_entries)])
+        return {"months": months}
+
+    def _update_month_index(
+        self,
+        key: str,
+        read_head: Callable[..., dict],
+        chunk_key: Callable[[str], str],
+        month: str,
+        change: Callable[[list[list]], list[list]],
+    ) -> None:
+        """Change the entries of one month chunk, and its count in the head if it changed.
+
+        change(entries) returns the new entries of the chunk. The head is
+        read first, so an index built from a scan never overwrites the chunk.
+        """
+        read_head()
+        counted = []
+
+        def change_chunk(doc: dict) -> dict | None:
+            entries = change(doc["entries"])
+            if entries == doc["entries"]:
+                return None
+            counted.append(len(entries) != len(doc["entries"]))
+            return {"entries": entries}
+
+        self._update_shared_doc(
+            chunk_key(month), lambda: self._read_index_chunk(chunk_key(month), fresh=True), change_chunk
+        )
+        if not any(counted):
+            return
+
+        def change_head(doc: dict) -> dict | None:
+            # Counted again after the head was read, so the last head write has the last chunk count
+            counts = dict(doc["months"])
+            count = len(self._read_index_chunk(chunk_key(month), fresh=True)["entries"])
+            if counts.get(month, 0) == count:
+                return None
+            counts[month] = count
+            return {"months": sorted([m, c] for m, c in counts.items() if c)}
+
+        self._update_shared_doc(key, lambda: read_head(fresh=True), change_head)
+
+    def _iter_month_index(
+        self,
+        head: dict,
+        chunk_key: Callable[[str], str],
+        offset: int = 0,
+        after: tuple[str, str] | None = None,
+    ) -> Iterator[list]:
+        """Entries of an index newest first, starting right after after and past offset entries.
+
+        Chunks are read as the iteration reaches them, months that lie
+        entirely within the offset are skipped by their count in the head.
+        """
+        after_month = None if after is None else after[0][:7]
+        for month, count in reversed(head["months"]):
+            if after_month is not None and month > after_month:
+                continue
+            if month != after_month and offset >= count:
+                offset -= count
+                continue
+            entries = self._read_index_chunk(chunk_key(month))["entries"]
+            end = len(entries) if month != after_month else bisect.bisect_left(entries, list(after))
+            if offset >= end:
+                offset -= end
+                continue
+            yield from reversed(entries[: end - offset])
+            offset = 0
+
+    def _load_index_page(self, entries: Iterator[list], limit: int, key: Callable[[list], str]) -> list[dict]:
+        """Topics of the next limit index entries, reading on past entries whose topic is deleted or missing.
+
+        The index can briefly hold topics another worker is deleting, the
+        page is still full unless the entries run out.
+        """
+        topics = []
+        while len(topics) < limit:
+            batch = list(itertools.islice(entries, limit - len(topics)))
+            if not batch:
+                break
+            docs = self._load_docs([key(entry) for entry in batch])
+            topics += [topic for topic in docs if not topic.get("is_deleted", False)]
+        return topics
+
+    def _topic_chunk_key(self, community_id: str, category_id: str) -> Callable[[str], str]:
+        return lambda month: FTOPIC_INDEX_CHUNK_KEY_PATTERN.format(
+            community_id=community_id, category_id=category_id, month=month
+        )
+
+    def _community_topic_chunk_key(self, community_id: str) -> Callable[[str], str]:
+        return lambda month: FTOPIC_COMMUNITY_INDEX_CHUNK_KEY_PATTERN.format(community_id=community_id, month=month)
+
+    def _read_topic_index(self, community_id: str, category_id: str, fresh: bool = False) -> dict:
+        key = self._topic_index_key(community_id, category_id)
+
+        def build() -> dict:
+            # Categories created before the index existed, build it once from a scan
+            logger.info("Building topic index", extra={"key": key})
+            topics = self._load_topics(f"forumtopic_{community_id}_{category_id}_")
+            for topic in topics:
+                self._put_topic_ref(topic)
+            return self._build_month_index(
+                self._topic_chunk_key(community_id, category_id),
+                [[topic["created_at"], topic["id"]] for topic in topics],
+            )
+
+        return self._read_shared_doc(key, build, fresh)
+
+    def _read_community_topic_index(self, community_id: str, fresh: bool = False) -> dict:
+        key = FTOPIC_COMMUNITY_INDEX_KEY_PATTERN.format(community_id=community_id)
+
+        def build() -> dict:
+            # Communities with topics from before the index existed, build it once from a scan
+            logger.info("Building community topic index", extra={"key": key})
+            topics = self._load_topics(f"forumtopic_{community_id}_")
+            return self._build_month_index(
+                self._community_topic_chunk_key(community_id),
+                [[topic["created_at"], topic["id"], topic["category_id"]] for topic in topics],
+            )
+
+        return self._read_shared_doc(key, build, fresh)
+
+    def _topic_key(self, community_id: str, category_id: str, topic_id: str) -> str:
+        return FTOPIC_KEY_PATTERN.format(
+            community_id=community_id, category_id=category_id, topic_id=topic_id
+        )
+
+    def _put_topic_ref(self, topic: dict) -> None:
+        self.store.put(
+            key=FTOPIC_REF_KEY_PATTERN.format(topic_id=topic["id"]),
+            value={
+                "community_id": topic["community_id"],
+                "category_id": topic["category_id"],
+                "key": self._topic_key(topic["community_id"], topic["category_id"], topic["id"]),
+            },
+        )
+
+    def _find_legacy_topic_ref(self, community_id: str, topic_id: str) -> dict:
+        """Reference of a topic stored before references existed, found in the key listing and stored."""
+        suffix = f"_{topic_id}.json"
+        for key in self._list_keys(f"forumtopic_{community_id}_"):
+            if key.endswith(suffix):
+                topic = self._get_doc(key)
+                self._put_topic_ref(topic)
+                return {"community_id": topic["community_id"], "key": key}
+        raise FileNotFoundError(topic_id)
+
+    def _update_topic_index(self, topic: dict) -> None:
+        community_id, category_id = topic["community_id"], topic["category_id"]
+        # Topics keep their created_at, so they stay in the chunk of the same month
+        month = topic["created_at"][:7]
+
+        def change(entries: list[list]) -> list[list]:
+            entries = [entry for entry in entries if entry[1] != topic["id"]]
+            if not topic.get("is_deleted", False):
+                bisect.insort(entries, [topic["created_at"], topic["id"]])
+            return entries
+
+        self._update_month_index(
+            self._topic_index_key(community_id, category_id),
+            lambda fresh=False: self._read_topic_index(community_id, category_id, fresh),
+            self._topic_chunk_key(community_id, category_id),
+            month,
+            change,
+        )
+
+        def change_community(entries: list[list]) -> list[list]:
+            entries = [entry for entry in entries if entry[1] != topic["id"]]
+            if not topic.get("is_deleted", False):
+                bisect.insort(entries, [topic["created_at"], topic["id"], category_id])
+            return entries
+
+        self._update_month_index(
+            FTOPIC_COMMUNITY_INDEX_KEY_PATTERN.format(community_id=community_id),
+            lambda fresh=False: self._read_community_topic_index(community_id, fresh),
+            self._community_topic_chunk_key(community_id),
+            month,
+            change_community,
+        )
+
+    def _read_user_communities(self, user_id: str, fresh: bool = False) -> dict:
+        # Users without an index have not created or joined anything since it exists,
+        # backfill_user_communities indexed those who did before
+        key = USER_COMMUNITIES_KEY_PATTERN.format(user_id=user_id)
+        try:
+            return self.store.get_uncached(key) if fresh else self.store.get(key)
+        except FileNotFoundError:
+            return {"community_ids": []}
+
+    def _add_user_communities(self, user_id: str, community_ids: list[str]) -> None:
+        def change(doc: dict) -> dict | None:
+            added = [c for c in dict.fromkeys(community_ids) if c not in doc["community_ids"]]
+            if not added:
+                return None
+            return {"community_ids": doc["community_ids"] + added}
+
+        self._update_shared_doc(
+            USER_COMMUNITIES_KEY_PATTERN.format(user_id=user_id),
+            lambda: self._read_user_communities(user_id, fresh=True),
+            change,
+        )
+
+    def _membership_key(self, community_id: str, user_id: str) -> str:
+        return MEMBERSHIP_KEY_PATTERN.format(community_id=community_id, user_id=user_id)
+
+    def _read_member_count(self, community_id: str, fresh: bool = False) -> dict:
+        key = MEMBER_COUNT_KEY_PATTERN.format(community_id=community_id)
+
+        def build() -> dict:
+            # Communities created before the counter existed, count their members once
+            logger.info("Building member count", extra={"key": key})
+            return {"member_count": len(self.list_members(community_id))}
+
+        return self._read_shared_doc(key, build, fresh)
+
+    def _member_ids(self, community: dict) -> list[str]:
+        prefix = MEMBERSHIP_KEY_PREFIX.format(community_id=community["id"])
+        member_ids = dict.fromkeys(community.get("member_ids", []))
+        for key in self._list_keys(prefix):
+            member_ids.setdefault(key[len(prefix) : -len(".json")])
+        return list(member_ids)
+
+    def _bump_version(self, key: str) -> int:
+        for _ in range(MAX_VERSION_BUMPS):
+            try:
+                current_version = record_version(self.store.get(key))
+            except FileNotFoundError:
+                current_version = 0
+            try:
+                return self.store.put_if_version(key, {}, current_version)
+            except VersionConflictError:
+                continue
+        raise VersionConflictError(key, current_version, current_version + 1)
+
+    def _read_version(self, key: str) -> int:
+        # Read past the cache, a version answers whether a client's copy is still current
+        try:
+            return record_version(self.store.get_uncached(key))
+        except FileNotFoundError:
+            return 0
+
+    def _read_category_index(self, community_id: str, fresh: bool = False) -> dict:
+        key = FCATEGORY_INDEX_KEY_PATTERN.format(community_id=community_id)
+
+        def build() -> dict:
+            # Communities with categories from before the index existed, build it once from a scan
+            logger.info("Building category index", extra={"key": key})
+            prefix = f"fcategory_{community_id}_"
+            return {"category_ids": [key[len(prefix) : -len(".json")] for key in self._list_keys(prefix)]}
+
+        return self._read_shared_doc(key, build, fresh)
+
+    def _update_category_index(self, category: dict) -> None:
+        def change(doc: dict) -> dict:
+            # Written on every category write, its version is the version of the categories
+            if category["id"] in doc["category_ids"]:
+                return {"category_ids": doc["category_ids"]}
+            return {"category_ids": doc["category_ids"] + [category["id"]]}
+
+        self._update_shared_doc(
+            FCATEGORY_INDEX_KEY_PATTERN.format(community_id=category["community_id"]),
+            lambda: self._read_category_index(category["community_id"], fresh=True),
+            change,
+        )
+
+    def _category_keys(self, community_id: str, category_ids: list[str]) -> list[str]:
+        return [
+            FCATEGORY_KEY_PATTERN.format(community_id=community_id, category_id=category_id)
+            for category_id in category_ids
+        ]
+
+    def _catalog_chunk_key(self, month: str) -> str:
+        return COMMUNITY_CATALOG_CHUNK_KEY_PATTERN.format(month=month)
+
+    def _read_catalog(self, fresh: bool = False) -> dict:
+        def build() -> dict:
+            # Communities created before the catalog existed, build it once from a scan
+            logger.info("Building community catalog", extra={"key": COMMUNITY_CATALOG_KEY})
+            entries = [
+                catalog_entry(community)
+                for community in self._load_docs(self._list_keys(COMMUNITY_KEY_PREFIX))
+                if isinstance(community.get("id"), str)
+            ]
+            return self._build_month_index(self._catalog_chunk_key, entries, order=catalog_order)
+
+        return self._read_shared_doc(COMMUNITY_CATALOG_KEY, build, fresh)
+
+    def _update_catalog(self, community: dict) -> None:
+        entry = catalog_entry(community)
+
+        def change(entries: list[dict]) -> list[dict]:
+            entries = [e for e in entries if e["id"] != entry["id"]]
+            bisect.insort(entries, entry, key=catalog_order)
+            return entries
+
+        self._update_month_index(
+            COMMUNITY_CATALOG_KEY, self._read_catalog, self._catalog_chunk_key, entry["created_at"][:7], change
+        )
+
+    # --- Communities ---
+    def get_community(self, community_id: str) -> dict:
+        return self._get_doc(COMMUNITY_KEY_PATTERN.format(community_id=community_id))
+
+    def create_community(self, community: dict) -> None:
+        member_ids = list(dict.fromkeys(community.get("member_ids", [])))
+        self.store.put_if_version(
+            COMMUNITY_KEY_PATTERN.format(community_id=community["id"]), community, 0
+        )
+        for user_id in member_ids:
+            self.store.put(
+                key=self._membership_key(community["id"], user_id),
+                value={"community_id": community["id"], "user_id": user_id},
+            )
+        self.store.put_if_version(
+            MEMBER_COUNT_KEY_PATTERN.format(community_id=community["id"]),
+            {"member_count": len(member_ids)},
+            0,
+        )
+        for user_id in {community.get("creator_id"), *member_ids} - {None}:
+            self._add_user_communities(user_id, [community["id"]])
+        self._update_catalog(community)
+
+    def add_member(self, community_id: str, user_id: str) -> bool:
+        # Written in order: membership, counter, user index. A join is complete once the community is in the
+        # user's index, one that stopped before is finished by the next attempt
+        membership_key = self._membership_key(community_id, user_id)
+        try:
+            self.store.get_uncached(membership_key)
+            if community_id in self._read_user_communities(user_id, fresh=True)["community_ids"]:
+                return False
+        except FileNotFoundError:
+            # Members who joined before memberships had their own records
+            if user_id in self.get_community(community_id).get("member_ids", []):
+                return False
+            self.store.put(key=membership_key, value={"community_id": community_id, "user_id": user_id})
+        counter = self._read_member_count(community_id)
+        recent_ids = counter.get("recent_ids", [])
+        if user_id not in recent_ids:
+            # Raises on a concurrent join, the retry finds the membership and only updates the counter
+            self.store.put_if_version(
+                MEMBER_COUNT_KEY_PATTERN.format(community_id=community_id),
+                {
+                    "member_count": counter["member_count"] + 1,
+                    "recent_ids": (recent_ids + [user_id])[-MEMBER_COUNT_RECENT_JOINS:],
+                },
+                record_version(counter),
+            )
+        self._add_user_communities(user_id, [community_id])
+        return True
+
+    def is_member(self, community_id: str, user_id: str) -> bool:
+        try:
+            self.store.get(self._membership_key(community_id, user_id))
+            return True
+        except FileNotFoundError:
+            pass
+        # Members who joined before memberships had their own records
+        return user_id in self.get_community(community_id).get("member_ids", [])
+
+    def list_members(self, community_id: str) -> list[str]:
+        return self._member_ids(self.get_community(community_id))
+
+    def count_members(self, community_id: str) -> int:
+        self.get_community(community_id)
+        return self._read_member_count(community_id)["member_count"]
+
+    def get_memberships(self, user_id: str, community_ids: list[str]) -> dict[str, dict]:
+        # The user's index answers membership, only the communities in it are read for their creator
+        joined = set(self._read_user_communities(user_id)["community_ids"]).intersection(community_ids)
+        keys = [COMMUNITY_KEY_PATTERN.format(community_id=community_id) for community_id in joined]
+        created = {
+            community["id"]
+            for community in self._load_docs(keys)
+            if community.get("creator_id") == user_id
+        }
+        return {
+            community_id: {"is_member": community_id in joined, "is_creator": community_id in created}
+            for community_id in community_ids
+        }
+
+    def get_community_version(self, community_id: str) -> str:
+        # Read past the cache, a version answers whether a client's copy is still current
+        community = self.store.get_uncached(COMMUNITY_KEY_PATTERN.format(community_id=community_id))
+        if not community or not isinstance(community, dict):
+            raise FileNotFoundError(community_id)
+        counter = self._read_member_count(community_id, fresh=True)
+        return f"{record_version(community)}.{record_version(counter)}"
+
+    def get_community_snapshot(self, community_id: str) -> tuple[str | None, dict]:
+        started_at = time.monotonic()
+        community = self.store.get_uncached(COMMUNITY_KEY_PATTERN.format(community_id=community_id))
+        if not community or not isinstance(community, dict):
+            raise FileNotFoundError(community_id)
+        counter = self._read_member_count(community_id, fresh=True)
+        member_ids = self._member_ids(community)
+        if len(member_ids) < counter["member_count"]:
+            # Joins through other workers the key listing has not seen yet, their memberships are written before
+            # the counter
+            self.store.refresh_keys(started_at)
+            member_ids = self._member_ids(community)
+        record = {**community, "member_ids": member_ids}
+        if len(member_ids) < counter["member_count"]:
+            # Memberships still not listed, the record may lack members of this version
+            return None, record
+        return f"{record_version(community)}.{record_version(counter)}", record
+
+    def list_catalog(self) -> list[dict]:
+        keys = [self._catalog_chunk_key(month) for month, _ in self._read_catalog()["months"]]
+        entries = [entry for chunk in self._load_docs(keys) for entry in chunk["entries"]]
+        # Joins only update the counter of their community, the catalog holds the counts from creation
+        keys = [MEMBER_COUNT_KEY_PATTERN.format(community_id=entry["id"]) for entry in entries]
+        for entry, counter in zip(entries, get_many(self.store, keys, self._fetch_executor)):
+            if isinstance(counter, dict):
+                entry["member_count"] = counter["member_count"]
+        return entries
+
+    def list_user_communities(self, user_id: str) -> list[dict]:
+        keys = [
+            COMMUNITY_KEY_PATTERN.format(community_id=community_id)
+            for community_id in self._read_user_communities(user_id)["community_ids"]
+        ]
+        # Members come from the key listing, no read per community
+        return [
+            {**community, "member_ids": self._member_ids(community)} for community in self._load_docs(keys)
+        ]
+
+    # --- Forum categories ---
+    def get_category(self, community_id: str, category_id: str) -> dict:
+        return self._get_doc(
+            FCATEGORY_KEY_PATTERN.format(community_id=community_id, category_id=category_id)
+        )
+
+    def put_category(self, category: dict) -> None:
+        self.store.put_if_version(
+            FCATEGORY_KEY_PATTERN.format(
+                community_id=category["community_id"], category_id=category["id"]
+            ),
+            category,
+            record_version(category),
+        )
+        self._update_category_index(category)
+
+    def list_categories(self, community_id: str) -> list[dict]:
+        category_ids = self._read_category_index(community_id)["category_ids"]
+        return self._load_docs(self._category_keys(community_id, category_ids))
+
+    def list_categories_snapshot(self, community_id: str) -> tuple[int, list[dict]]:
+        # Categories are written before the index, read past the cache they are at least of its version
+        index = self._read_category_index(community_id, fresh=True)
+        categories = self._load_docs(self._category_keys(community_id, index["category_ids"]), fresh=True)
+        return record_version(index), categories
+
+    def get_categories_version(self, community_id: str) -> int:
+        # Communities without an index yet have it built by the first listing
+        return self._read_version(FCATEGORY_INDEX_KEY_PATTERN.format(community_id=community_id))
+
+    # --- Forum topics ---
+    def put_topic(self, topic: dict) -> None:
+        self.store.put(
+            key=self._topic_key(topic["community_id"], topic["category_id"], topic["id"]),
+            value=topic,
+        )
+        self._put_topic_ref(topic)
+        self._update_topic_index(topic)
+        self._bump_version(
+            FTOPIC_CATEGORY_VERSION_KEY_PATTERN.format(
+                community_id=topic["community_id"], category_id=topic["category_id"]
+            )
+        )
+        self._bump_version(FTOPIC_COMMUNITY_VERSION_KEY_PATTERN.format(community_id=topic["community_id"]))
+
+    def find_topic(self, community_id: str, topic_id: str) -> dict:
+        # Unknown ids are answered from the reference without reading any topic
+        try:
+            ref = self._get_doc(FTOPIC_REF_KEY_PATTERN.format(topic_id=topic_id))
+        except FileNotFoundError:
+            ref = self._find_legacy_topic_ref(community_id, topic_id)
+        if ref.get("community_id") != community_id:
+            raise FileNotFoundError(topic_id)
+        topic = self._get_doc(ref["key"])
+        if topic.get("is_deleted", False) or topic.get("id") != topic_id:
+            raise FileNotFoundError(topic_id)
+        return topic
+
+    def list_category_topics(
+        self,
+        community_id: str,
+        category_id: str,
+        offset: int,
+        limit: int,
+        after: tuple[str, str] | None = None,
+    ) -> tuple[list[dict], int]:
+        head = self._read_topic_index(community_id, category_id)
+        total_count = sum(count for _, count in head["months"])
+        entries = self._iter_month_index(head, self._topic_chunk_key(community_id, category_id), offset, after)
+        topics = self._load_index_page(
+            entries, limit, lambda entry: self._topic_key(community_id, category_id, entry[1])
+        )
+        return topics, total_count
+
+    def get_category_topics_version(self, community_id: str, category_id: str) -> int:
+        return self._read_version(
+            FTOPIC_CATEGORY_VERSION_KEY_PATTERN.format(community_id=community_id, category_id=category_id)
+        )
+
+    def get_community_topics_version(self, community_id: str) -> int:
+        return self._read_version(FTOPIC_COMMUNITY_VERSION_KEY_PATTERN.format(community_id=community_id))
+
+    def list_latest_topics(
+        self, community_id: str, limit: int, after: tuple[str, str] | None = None
+    ) -> tuple[list[dict], int]:
+        head = self._read_community_topic_index(community_id)
+        # [created_at, topic_id, category_id] entries, newest first from right after after
+        entries = self._iter_month_index(head, self._community_topic_chunk_key(community_id), after=after)
+        topics = self._load_index_page(
+            entries, limit, lambda entry: self._topic_key(community_id, entry[2], entry[1])
+        )
+        return topics, sum(count for _, count in head["months"])
+
+    # --- Backfills ---
+    def backfill_user_communities(self) -> int:
+        """Index the communities of users who created or joined them before the per-user index existed.
+
+        Only adds missing entries, so it is safe to run again. Returns the
+        number of users indexed.
+        """
+        user_communities = collections.defaultdict(list)
+        for community in self._load_docs(self._list_keys(COMMUNITY_KEY_PREFIX)):
+            if not isinstance(community.get("id"), str):
+                continue
+            for user_id in {community.get("creator_id"), *self._member_ids(community)} - {None}:
+                user_communities[user_id].append(community["id"])
+        for user_id, community_ids in user_communities.items():
+            self._add_user_communities(user_id, community_ids)
+        return len(user_communities)
+
+    def backfill_topic_indexes(self) -> int:
+        """Build the missing category and topic indexes of all communities, returns the number of communities.
+
+        Missing indexes are also built on first read, this saves the first
+        readers the scan. Topic indexes stored as one document per category or
+        community (ftopicindex_*, ftopiccommunityindex_*) are no longer read and
+        can be deleted afterwards.
+        """
+        communities = [
+            community
+            for community in self._load_docs(self._list_keys(COMMUNITY_KEY_PREFIX))
+            if isinstance(community.get("id"), str)
+        ]
+        for community in communities:
+            self._read_category_index(community["id"])
+            self._read_community_topic_index(community["id"])
+            for category in self.list_categories(community["id"]):
+                self._read_topic_index(community["id"], category["id"])
+        return len(communities)
@@ -0,0 +1,80 @@
+import bisect
+import threading
+import time
+
+
+class KeyListingStore:
+    """Keeps the keys of a db.storage.json compatible store in a sorted in-memory list.
+
+    list_keys(prefix) is answered with two bisections instead of listing the
+    whole bucket. The keys are listed from the store once and then kept up to
+    date by the puts and deletes going through this store, with a full relist
+    every ttl_seconds to pick up keys written by other workers.
+    """
+
+    def __init__(self, store, ttl_seconds: float):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._keys: list[str] = []
+        self._listed_at: float | None = None
+
+    def _ensure_listed(self) -> None:
+        # Called with the lock held, so concurrent callers wait for a single listing
+        if self._listed_at is not None and time.monotonic() - self._listed_at < self.ttl_seconds:
+            return
+        self._keys = sorted(file_info.name for file_info in self.store.list())
+        self._listed_at = time.monotonic()
+
+    def _add_key(self, key: str) -> None:
+        with self._lock:
+            if self._listed_at is None:
+                return
+            index = bisect.bisect_left(self._keys, key)
+            if index == len(self._keys) or self._keys[index] != key:
+                self._keys.insert(index, key)
+
+    def refresh_keys(self, older_than: float) -> None:
+        """List the keys from the store again unless that happened since older_than (a time.monotonic() value).
+
+        For readers that found keys written by other workers missing, callers
+        that waited on the lock for the same relist don't repeat it.
+        """
+        with self._lock:
+            if self._listed_at is not None and self._listed_at >= older_than:
+                return
+            self._listed_at = None
+            self._ensure_listed()
+
+    def list_keys(self, prefix: str = "") -> list[str]:
+        """Return the keys starting with prefix, in sorted order."""
+        with self._lock:
+            self._ensure_listed()
+            start = bisect.bisect_left(self._keys, prefix)
+            end = bisect.bisect_left(self._keys, prefix + "￿", lo=start)
+            return self._keys[start:end]
+
+    def get(self, key: str, *, default: dict | None = None) -> dict | None:
+        return self.store.get(key, default=default)
+
+    def get_uncached(self, key: str) -> dict | None:
+        return self.store.get(key)
+
+    def put(self, key: str, value: dict) -> None:
+        self.store.put(key=key, value=value)
+        self._add_key(key)
+
+    def put_if_version(self, key: str, value: dict, expected_version: int) -> int:
+        version = self.store.put_if_version(key, value, expected_version)
+        self._add_key(key)
+        return version
+
+    def delete(self, key: str) -> None:
+        self.store.delete(key)
+        with self._lock:
+            index = bisect.bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+
+    def list(self):
+        return self.store.list()
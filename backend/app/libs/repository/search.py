@@ -0,0 +1,114 @@
+import bisect
+import heapq
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Weight of a token by the field it appears in
+NAME_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+# Shorter query terms only match whole tokens, a single letter would match most of the index
+MIN_PREFIX_LENGTH = 2
+
+
+def tokenize(text: str | None) -> list[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class CommunitySearchIndex:
+    """Inverted index over community names and descriptions.
+
+    Every query term must match the start of a token of the community (or the
+    whole token, for terms shorter than MIN_PREFIX_LENGTH). Matches
+    are ranked by field weight, doubled for whole-token matches, then by member
+    count. Not thread safe, callers serialize access.
+    """
+
+    def __init__(self):
+        # token -> {community_id: weight}
+        self._postings: dict[str, dict[str, int]] = {}
+        # Distinct tokens in sorted order, for prefix lookups
+        self._tokens: list[str] = []
+        # community_id -> {token: weight}, to remove a community again
+        self._community_tokens: dict[str, dict[str, int]] = {}
+
+    def add(self, entry: dict) -> None:
+        """Index a catalog entry, replacing an earlier version of it."""
+        self.remove(entry["id"])
+
+        tokens: dict[str, int] = {}
+        for token in tokenize(entry.get("description")):
+            tokens[token] = DESCRIPTION_WEIGHT
+        for token in tokenize(entry.get("name")):
+            tokens[token] = NAME_WEIGHT
+
+        for token, weight in tokens.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._tokens, token)
+            postings[entry["id"]] = weight
+        self._community_tokens[entry["id"]] = tokens
+
+    def remove(self, community_id: str) -> None:
+        for token in self._community_tokens.pop(community_id, {}):
+            postings = self._postings[token]
+            del postings[community_id]
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def _term_scores(self, term: str) -> dict[str, int]:
+        if len(term) < MIN_PREFIX_LENGTH:
+            return {
+                community_id: weight * 2
+                for community_id, weight in self._postings.get(term, {}).items()
+            }
+
+        scores: dict[str, int] = {}
+        index = bisect.bisect_left(self._tokens, term)
+        while index < len(self._tokens) and self._tokens[index].startswith(term):
+            token = self._tokens[index]
+            multiplier = 2 if token == term else 1
+            for community_id, weight in self._postings[token].items():
+                score = weight * multiplier
+                if score > scores.get(community_id, 0):
+                    scores[community_id] = score
+            index += 1
+        return scores
+
+    def search(
+        self, query: str, offset: int, limit: int, entries: dict[str, dict]
+    ) -> tuple[list[str], int]:
+        """Return a page of matching community ids, best first, and the number of matches.
+
+        entries maps community ids to their catalog entries, used for ranking ties.
+        """
+        scores: dict[str, int] | None = None
+        for term in dict.fromkeys(tokenize(query)):
+            term_scores = self._term_scores(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {
+                    community_id: scores[community_id] + score
+                    for community_id, score in term_scores.items()
+                    if community_id in scores
+                }
+            if not scores:
+                return [], 0
+
+        if scores is None:
+            return [], 0
+
+        ranked = heapq.nsmallest(
+            offset + limit,
+            scores,
+            key=lambda community_id: (
+                -scores[community_id],
+                -entries[community_id]["member_count"],
+                community_id,
+            ),
+        )
+        return ranked[offset:], len(scores)
@@ -0,0 +1,401 @@
+import contextlib
+import json
+import sqlite3
+import threading
+
+from .base import Repository, catalog_entry
+from .versions import VersionConflictError, record_version
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS communities (
+    id TEXT PRIMARY KEY,
+    creator_id TEXT,
+    created_at TEXT NOT NULL,
+    is_deleted INTEGER NOT NULL DEFAULT 0,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_communities_created_at ON communities (created_at, id);
+CREATE INDEX IF NOT EXISTS ix_communities_creator_id ON communities (creator_id);
+
+CREATE TABLE IF NOT EXISTS memberships (
+    community_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (community_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_memberships_user_id ON memberships (user_id, community_id);
+
+CREATE TABLE IF NOT EXISTS member_counts (
+    community_id TEXT PRIMARY KEY,
+    member_count INTEGER NOT NULL
+);
+
+-- Version counters of collections, e.g. "categories:<community_id>"
+CREATE TABLE IF NOT EXISTS versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id TEXT PRIMARY KEY,
+    community_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    is_deleted INTEGER NOT NULL DEFAULT 0,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_categories_community_id ON categories (community_id, created_at);
+
+CREATE TABLE IF NOT EXISTS topics (
+    id TEXT PRIMARY KEY,
+    community_id TEXT NOT NULL,
+    category_id TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    is_deleted INTEGER NOT NULL DEFAULT 0,
+    doc TEXT NOT NULL
+);
+-- Listing order is (created_at, id), earlier databases have these indexes without id
+DROP INDEX IF EXISTS ix_topics_category_id;
+DROP INDEX IF EXISTS ix_topics_community_id;
+CREATE INDEX IF NOT EXISTS ix_topics_category_created_at ON topics (community_id, category_id, is_deleted, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_topics_community_created_at ON topics (community_id, is_deleted, created_at, id);
+"""
+
+
+class SqliteRepository(Repository):
+    """Repository backed by an embedded SQLite database in WAL mode.
+
+    Records are kept as json documents next to the columns they are queried by,
+    so list queries run as indexed SQL. Versioned writes check the version
+    inside the write transaction, and joins never conflict since the member
+    count is updated in the same transaction as the membership. Each thread
+    gets its own connection, which means path must point to a file (not
+    ":memory:").
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    # --- Helpers ---
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def _read_transaction(self):
+        # Reads inside see a single snapshot of the database, WAL keeps writers going meanwhile
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        finally:
+            conn.execute("COMMIT")
+
+    def _fetch_doc(self, sql: str, params: tuple) -> dict:
+        row = self._connection().execute(sql, params).fetchone()
+        if row is None:
+            raise FileNotFoundError(params[0])
+        return json.loads(row[0])
+
+    def _fetch_docs(self, sql: str, params: tuple) -> list[dict]:
+        return [json.loads(row[0]) for row in self._connection().execute(sql, params)]
+
+    def _count(self, sql: str, params: tuple) -> int:
+        return self._connection().execute(sql, params).fetchone()[0]
+
+    def _bump_version(self, conn: sqlite3.Connection, name: str) -> None:
+        conn.execute(
+            "INSERT INTO versions (name, version) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET version = version + 1",
+            (name,),
+        )
+
+    def _read_version(self, name: str) -> int:
+        row = self._connection().execute("SELECT version FROM versions WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None else 0
+
+    # --- Communities ---
+    def get_community(self, community_id: str) -> dict:
+        return self._fetch_doc("SELECT doc FROM communities WHERE id = ?", (community_id,))
+
+    def create_community(self, community: dict) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO communities (id, creator_id, created_at, is_deleted, doc) VALUES (?, ?, ?, ?, ?)",
+                (
+                    community["id"],
+                    community.get("creator_id"),
+                    community["created_at"],
+                    int(community.get("is_deleted", False)),
+                    json.dumps({**community, "version": 1}),
+                ),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO memberships (community_id, user_id) VALUES (?, ?)",
+                [(community["id"], user_id) for user_id in community.get("member_ids", [])],
+            )
+            conn.execute(
+                "INSERT INTO member_counts (community_id, member_count) VALUES (?, ?)",
+                (community["id"], len(set(community.get("member_ids", [])))),
+            )
+
+    def add_member(self, community_id: str, user_id: str) -> bool:
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM communities WHERE id = ?", (community_id,)).fetchone() is None:
+                raise FileNotFoundError(community_id)
+            added = conn.execute(
+                "INSERT OR IGNORE INTO memberships (community_id, user_id) VALUES (?, ?)",
+                (community_id, user_id),
+            ).rowcount
+            if added:
+                # Communities created before the counter existed start from a count of their rows
+                conn.execute(
+                    """
+                    INSERT INTO member_counts (community_id, member_count)
+                    VALUES (?, (SELECT COUNT(*) FROM memberships WHERE community_id = ?))
+                    ON CONFLICT (community_id) DO UPDATE SET member_count = member_count + 1
+                    """,
+                    (community_id, community_id),
+                )
+        return bool(added)
+
+    def is_member(self, community_id: str, user_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM memberships WHERE community_id = ? AND user_id = ?",
+            (community_id, user_id),
+        ).fetchone()
+        return row is not None
+
+    def list_members(self, community_id: str) -> list[str]:
+        member_ids = dict.fromkeys(self.get_community(community_id).get("member_ids", []))
+        for (user_id,) in self._connection().execute(
+            "SELECT user_id FROM memberships WHERE community_id = ? ORDER BY user_id",
+            (community_id,),
+        ):
+            member_ids.setdefault(user_id)
+        return list(member_ids)
+
+    def count_members(self, community_id: str) -> int:
+        self.get_community(community_id)
+        return self._count(
+            """
+            SELECT COALESCE(
+                (SELECT member_count FROM member_counts WHERE community_id = ?),
+                (SELECT COUNT(*) FROM memberships WHERE community_id = ?)
+            )
+            """,
+            (community_id, community_id),
+        )
+
+    def get_memberships(self, user_id: str, community_ids: list[str]) -> dict[str, dict]:
+        memberships = {
+            community_id: {"is_member": False, "is_creator": False} for community_id in community_ids
+        }
+        placeholders = ", ".join("?" * len(memberships))
+        rows = self._connection().execute(
+            f"""
+            SELECT id, creator_id = ?,
+                   EXISTS (SELECT 1 FROM memberships WHERE community_id = communities.id AND user_id = ?)
+            FROM communities
+            WHERE id IN ({placeholders})
+            """,
+            (user_id, user_id, *memberships),
+        )
+        for community_id, is_creator, is_member in rows:
+            memberships[community_id] = {
+                "is_member": bool(is_member or is_creator),
+                "is_creator": bool(is_creator),
+            }
+        return memberships
+
+    def get_community_version(self, community_id: str) -> str:
+        row = self._connection().execute(
+            """
+            SELECT COALESCE(json_extract(doc, '$.version'), 0),
+                   COALESCE(
+                       (SELECT member_count FROM member_counts WHERE community_id = communities.id),
+                       (SELECT COUNT(*) FROM memberships WHERE community_id = communities.id)
+                   )
+            FROM communities WHERE id = ?
+            """,
+            (community_id,),
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(community_id)
+        # Members are never removed, so their count is a version of the memberships
+        return f"{row[0]}.{row[1]}"
+
+    def get_community_snapshot(self, community_id: str) -> tuple[str | None, dict]:
+        with self._read_transaction():
+            version = self.get_community_version(community_id)
+            return version, {**self.get_community(community_id), "member_ids": self.list_members(community_id)}
+
+    def list_catalog(self) -> list[dict]:
+        rows = self._connection().execute(
+            """
+            SELECT id, json_extract(doc, '$.name'), json_extract(doc, '$.description'),
+                   COALESCE(
+                       (SELECT member_count FROM member_counts WHERE community_id = communities.id),
+                       (SELECT COUNT(*) FROM memberships WHERE community_id = communities.id)
+                   ),
+                   is_deleted, created_at
+            FROM communities
+            ORDER BY created_at, id
+            """
+        )
+        return [
+            catalog_entry(
+                {
+                    "id": community_id,
+                    "name": name,
+                    "description": description,
+                    "member_count": member_count,
+                    "is_deleted": bool(is_deleted),
+                    "created_at": created_at,
+                }
+            )
+            for community_id, name, description, member_count, is_deleted, created_at in rows
+        ]
+
+    def list_user_communities(self, user_id: str) -> list[dict]:
+        communities = self._fetch_docs(
+            """
+            SELECT doc FROM communities
+            WHERE id IN (SELECT community_id FROM memberships WHERE user_id = ?)
+               OR creator_id = ?
+            ORDER BY created_at, id
+            """,
+            (user_id, user_id),
+        )
+        # The members of all of them in one query, merged as list_members does
+        member_ids = {community["id"]: dict.fromkeys(community.get("member_ids", [])) for community in communities}
+        placeholders = ", ".join("?" * len(member_ids))
+        for community_id, member_id in self._connection().execute(
+            f"SELECT community_id, user_id FROM memberships WHERE community_id IN ({placeholders}) ORDER BY user_id",
+            tuple(member_ids),
+        ):
+            member_ids[community_id].setdefault(member_id)
+        return [{**community, "member_ids": list(member_ids[community["id"]])} for community in communities]
+
+    # --- Forum categories ---
+    def get_category(self, community_id: str, category_id: str) -> dict:
+        return self._fetch_doc(
+            "SELECT doc FROM categories WHERE id = ? AND community_id = ?",
+            (category_id, community_id),
+        )
+
+    def put_category(self, category: dict) -> None:
+        expected_version = record_version(category)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(json_extract(doc, '$.version'), 0) FROM categories WHERE id = ?",
+                (category["id"],),
+            ).fetchone()
+            current_version = row[0] if row is not None else 0
+            if current_version != expected_version:
+                raise VersionConflictError(category["id"], expected_version, current_version)
+            conn.execute(
+                "INSERT OR REPLACE INTO categories (id, community_id, created_at, is_deleted, doc) VALUES (?, ?, ?, ?, ?)",
+                (
+                    category["id"],
+                    category["community_id"],
+                    category["created_at"],
+                    int(category.get("is_deleted", False)),
+                    json.dumps({**category, "version": expected_version + 1}),
+                ),
+            )
+            self._bump_version(conn, f"categories:{category['community_id']}")
+
+    def list_categories(self, community_id: str) -> list[dict]:
+        return self._fetch_docs(
+            "SELECT doc FROM categories WHERE community_id = ? ORDER BY created_at",
+            (community_id,),
+        )
+
+    def get_categories_version(self, community_id: str) -> int:
+        return self._read_version(f"categories:{community_id}")
+
+    def list_categories_snapshot(self, community_id: str) -> tuple[int, list[dict]]:
+        with self._read_transaction():
+            return self.get_categories_version(community_id), self.list_categories(community_id)
+
+    # --- Forum topics ---
+    def put_topic(self, topic: dict) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO topics (id, community_id, category_id, created_at, is_deleted, doc) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    topic["id"],
+                    topic["community_id"],
+                    topic["category_id"],
+                    topic["created_at"],
+                    int(topic.get("is_deleted", False)),
+                    json.dumps(topic),
+                ),
+            )
+            self._bump_version(conn, f"topics:{topic['community_id']}:{topic['category_id']}")
+            self._bump_version(conn, f"topics:{topic['community_id']}")
+
+    def find_topic(self, community_id: str, topic_id: str) -> dict:
+        return self._fetch_doc(
+            "SELECT doc FROM topics WHERE id = ? AND community_id = ? AND is_deleted = 0",
+            (topic_id, community_id),
+        )
+
+    def get_category_topics_version(self, community_id: str, category_id: str) -> int:
+        return self._read_version(f"topics:{community_id}:{category_id}")
+
+    def get_community_topics_version(self, community_id: str) -> int:
+        return self._read_version(f"topics:{community_id}")
+
+    def _list_topics(
+        self, where: str, params: tuple, offset: int, limit: int, after: tuple[str, str] | None
+    ) -> tuple[list[dict], int]:
+        seek, seek_params = "", ()
+        if after is not None:
+            # Row value comparison lets SQLite seek the (created_at, id) index
+            seek, seek_params = " AND (created_at, id) < (?, ?)", tuple(after)
+        topics = self._fetch_docs(
+            f"SELECT doc FROM topics WHERE {where}{seek} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            params + seek_params + (limit, offset),
+        )
+        return topics, self._count(f"SELECT COUNT(*) FROM topics WHERE {where}", params)
+
+    def list_category_topics(
+        self,
+        community_id: str,
+        category_id: str,
+        offset: int,
+        limit: int,
+        after: tuple[str, str] | None = None,
+    ) -> tuple[list[dict], int]:
+        return self._list_topics(
+            "community_id = ? AND category_id = ? AND is_deleted = 0",
+            (community_id, category_id),
+            offset,
+            limit,
+            after,
+        )
+
+    def list_latest_topics(
+        self, community_id: str, limit: int, after: tuple[str, str] | None = None
+    ) -> tuple[list[dict], int]:
+        return self._list_topics(
+            "community_id = ? AND is_deleted = 0", (community_id,), 0, limit, after
+        )
@@ -0,0 +1,135 @@
+import asyncio
+import random
+import threading
+
+
+class VersionConflictError(Exception):
+    """A versioned write found the record at a different version than expected."""
+
+    def __init__(self, key: str, expected_version: int, current_version: int):
+        super().__init__(f"{key} is at version {current_version}, expected {expected_version}")
+        self.key = key
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+class StripedLocks:
+    """Fixed pool of locks, a key uses the lock its hash falls on.
+
+    Keys sharing a lock wait for each other, but the pool does not grow with
+    the number of keys locked over the life of the process.
+    """
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __getitem__(self, key: str) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+
+def record_version(doc: dict | None) -> int:
+    """Version of a stored record, 0 for records that do not exist or predate versions."""
+    return doc.get("version", 0) if isinstance(doc, dict) else 0
+
+
+class VersionedJsonStore:
+    """Adds compare-and-swap puts on top of a db.storage.json compatible store.
+
+    Records carry their version in a "version" field. put_if_version re-reads
+    the record from the store, bypassing any cache above this one, and only
+    writes it with the next version if it is still at the expected one.
+    db.storage.json has no conditional write, so the check and the write are
+    atomic between threads of this process but leave a small window between
+    workers.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._locks = StripedLocks()
+        self._stats_lock = threading.Lock()
+        self.versioned_puts = 0
+        self.conflicts = 0
+
+    def put_if_version(self, key: str, value: dict, expected_version: int) -> int:
+        """Write value as the next version of key and return that version.
+
+        Raises VersionConflictError when the record is not at expected_version.
+        """
+        with self._locks[key]:
+            try:
+                current_version = record_version(self.store.get(key))
+            except FileNotFoundError:
+                current_version = 0
+            conflict = current_version != expected_version
+            with self._stats_lock:
+                self.versioned_puts += 1
+                self.conflicts += conflict
+            if conflict:
+                raise VersionConflictError(key, expected_version, current_version)
+            self.store.put(key=key, value={**value, "version": expected_version + 1})
+        return expected_version + 1
+
+    def get(self, key: str, *, default: dict | None = None) -> dict | None:
+        return self.store.get(key, default=default)
+
+    def put(self, key: str, value: dict) -> None:
+        self.store.put(key=key, value=value)
+
+    def delete(self, key: str) -> None:
+        self.store.delete(key)
+
+    def list(self):
+        return self.store.list()
+
+    def stats(self) -> dict:
+        """Versioned puts and how many of them conflicted."""
+        with self._stats_lock:
+            return {"versioned_puts": self.versioned_puts, "conflicts": self.conflicts}
+
+
+class ConflictRetries:
+    """Retries read-modify-write operations that lose a version conflict.
+
+    Attempts, conflicts and operations that ran out of attempts are counted
+    per operation name.
+    """
+
+    def __init__(self, max_attempts: int):
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # name -> {"calls", "attempts", "conflicts", "exhausted"}
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def _count(self, name: str, field: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(
+                name, {"calls": 0, "attempts": 0, "conflicts": 0, "exhausted": 0}
+            )
+            counts[field] += 1
+
+    async def run(self, name: str, operation):
+        """Await operation() until it does not raise VersionConflictError.
+
+        operation must re-read the records it modifies on every call. After
+        max_attempts conflicts the last VersionConflictError is raised.
+        """
+        self._count(name, "calls")
+        for attempt in range(1, self.max_attempts + 1):
+            self._count(name, "attempts")
+            try:
+                return await operation()
+            except VersionConflictError:
+                self._count(name, "conflicts")
+                if attempt == self.max_attempts:
+                    self._count(name, "exhausted")
+                    raise
+            # Jittered backoff so the writers that conflicted do not meet again right away
+            await asyncio.sleep(random.uniform(0, 0.01 * attempt))
+
+    def stats(self) -> dict:
+        """Counts per operation name, with the share of attempts that conflicted."""
+        with self._lock:
+            return {
+                name: {**counts, "conflict_rate": counts["conflicts"] / max(counts["attempts"], 1)}
+                for name, counts in self._counts.items()
+            }
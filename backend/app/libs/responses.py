@@ -0,0 +1,135 @@
+"""Fast JSON responses and a cache of serialized response bodies.
+
+FastJSONResponse is the default response class of the app (see
+main.create_app); it encodes with orjson when that is installed.
+
+Hot read endpoints can keep their serialized body per record version, so an
+unchanged record is answered without decoding or encoding it again:
+
+    from app.libs.responses import get_response_cache
+
+    version = await get_async_repository().get_community_version(community_id)
+    body = get_response_cache().get("community_details", community_id, version)
+    if body is None:
+        body = build_body()
+        get_response_cache().put("community_details", community_id, version, body)
+    return json_bytes_response(body)
+
+Writes change the version, so stale bodies are never served. The cache holds
+at most RESPONSE_CACHE_MAX_ENTRIES bodies (default 2048, 0 disables it).
+
+The same versions make strong ETags, a revisit with a matching If-None-Match
+is answered 304 right after the version lookup:
+
+    etag = make_etag("community_details", community_id, version)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+"""
+
+import collections
+import functools
+import hashlib
+import os
+import threading
+from typing import Any, Hashable
+
+from fastapi.requests import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the standard json encoder
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson, same output as JSONResponse otherwise."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_bytes_response(body: bytes, status_code: int = 200, etag: str | None = None) -> Response:
+    """Response sending already serialized json as-is."""
+    headers = {"ETag": etag} if etag is not None else None
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag of a response identified by its name, resource, version and parameters."""
+    digest = hashlib.sha256("\0".join(map(str, parts)).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names this ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+class ResponseCache:
+    """Bounded LRU cache of serialized response bodies keyed by resource and version."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (name, resource_id) -> (version, body), least recently used first
+        self._entries: collections.OrderedDict[tuple[str, str], tuple[Hashable, bytes]] = (
+            collections.OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name: str, resource_id: str, version: Hashable) -> bytes | None:
+        """Return the cached body if it was cached at this version."""
+        key = (name, resource_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, name: str, resource_id: str, version: Hashable, body: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (name, resource_id)
+        with self._lock:
+            self._entries[key] = (version, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, name: str, resource_id: str) -> None:
+        """Drop a body right away, e.g. after a write that made it stale."""
+        with self._lock:
+            self._entries.pop((name, resource_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+@functools.cache
+def get_response_cache() -> ResponseCache:
+    """Create the response body cache once and reuse it."""
+    return ResponseCache(int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "2048")))
@@ -0,0 +1,42 @@
+import contextlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Wall clock time of the named phases of application startup.
+
+    Phases can nest, e.g. the import of each router inside "import routers":
+
+        timer = StartupTimer()
+        with timer.phase("import routers"):
+            for name in names:
+                with timer.phase(f"import router {name}"):
+                    ...
+        timer.report()
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        # phase name -> seconds, in the order the phases finished
+        self.timings: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started_at
+
+    def total_seconds(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def report(self) -> dict:
+        """Log the phase timings and return them in milliseconds."""
+        timings_ms = {name: round(seconds * 1000, 1) for name, seconds in self.timings.items()}
+        total_ms = round(self.total_seconds() * 1000, 1)
+        logger.info("Started in %.1f ms", total_ms, extra={"total_ms": total_ms, "phases_ms": timings_ms})
+        return timings_ms
@@ -0,0 +1,118 @@
+"""Storage I/O accounting per request, to catch endpoints that fan out into many storage calls.
+
+StorageIOMiddleware, added by main.create_app, counts for every request:
+
+- calls: repository and catalog calls from endpoints (both backends)
+- gets, puts, deletes and lists: db.storage.json operations (databutton backend)
+- their time and, in development, the size of the documents read and written
+
+In development the totals are sent in a Server-Timing response header, which
+browser dev tools show next to the request:
+
+    Server-Timing: storage;dur=12.4;desc="calls=3 gets=14 puts=0 deletes=0 lists=0 bytes=20480"
+
+A request making more than STORAGE_CALL_BUDGET calls or operations (default
+100, 0 disables the check) is logged as a warning with its counts, e.g.
+when a new per-item fetch loop slipped into an endpoint.
+"""
+
+import contextvars
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ("get", "put", "delete", "list")
+
+
+class RequestStorageIO:
+    """Storage calls and operations of one request, updated from the storage threads."""
+
+    def __init__(self, measure_bytes: bool = False):
+        self.measure_bytes = measure_bytes
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.call_seconds = 0.0
+        self.operations = dict.fromkeys(OPERATIONS, 0)
+        self.operation_seconds = 0.0
+        self.bytes = 0
+
+    def record_call(self, seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.call_seconds += seconds
+
+    def record_operation(self, op: str, seconds: float, document=None) -> None:
+        # Sizing means encoding the document again, so it is only done when asked for
+        size = 0
+        if self.measure_bytes and isinstance(document, dict):
+            size = len(json.dumps(document))
+        with self._lock:
+            self.operations[op] += 1
+            self.operation_seconds += seconds
+            self.bytes += size
+
+    def total_operations(self) -> int:
+        return sum(self.operations.values())
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                **{f"{op}s": count for op, count in self.operations.items()},
+                "bytes": self.bytes,
+                "call_seconds": round(self.call_seconds, 6),
+                "operation_seconds": round(self.operation_seconds, 6),
+            }
+
+    def server_timing(self) -> str:
+        counts = self.as_dict()
+        desc = " ".join(f"{name}={counts[name]}" for name in ("calls", "gets", "puts", "deletes", "lists", "bytes"))
+        # Calls include the operations they made, unless there were none (sqlite backend)
+        duration_ms = max(self.call_seconds, self.operation_seconds) * 1000
+        return f'storage;dur={duration_ms:.1f};desc="{desc}"'
+
+
+# Storage I/O of the request being handled, None outside of requests
+storage_io_var: contextvars.ContextVar[RequestStorageIO | None] = contextvars.ContextVar("storage_io", default=None)
+
+
+class StorageIOMiddleware:
+    """Counts the storage I/O of each http request, see the module docstring."""
+
+    def __init__(self, app, budget: int, server_timing: bool):
+        self.app = app
+        self.budget = budget
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_io = RequestStorageIO(measure_bytes=self.server_timing)
+
+        async def send_with_server_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", request_io.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = storage_io_var.set(request_io)
+        try:
+            await self.app(scope, receive, send_with_server_timing if self.server_timing else send)
+        finally:
+            storage_io_var.reset(token)
+            if self.budget > 0 and max(request_io.calls, request_io.total_operations()) > self.budget:
+                route = scope.get("route")
+                logger.warning(
+                    "Request exceeded the storage call budget of %d",
+                    self.budget,
+                    extra={
+                        "method": scope["method"],
+                        "route": getattr(route, "path_format", None) or scope["path"],
+                        **request_io.as_dict(),
+                    },
+                )
@@ -0,0 +1,23 @@
+"""Offline benchmark of the API, run from the backend directory.
+
+The app runs in-process against a local stand-in for db.storage.json
+(in memory, or a SQLite file for large data sets) and a local signing key
+instead of Firebase auth, so a run needs no network and no credentials.
+Every route of the routers in routers.json has a scenario, the report lists
+any route without one.
+
+    # Small data set generated in memory, report as json on stdout
+    python -m bench run --scale small
+
+    # Full data set (10k communities, 500 categories, 1M topics) generated once into a file
+    python -m bench generate --scale full --store /tmp/bench-full.sqlite3
+    python -m bench run --store /tmp/bench-full.sqlite3 --output report.json
+
+    # Keep a report as the baseline, later runs exit with 1 on regressions against it
+    python -m bench run --save-baseline baseline.json
+    python -m bench run --baseline baseline.json
+
+Runs against a file work on a copy, so every run starts from the same data.
+Reports are only comparable on the same machine with the same settings,
+compare() lists settings that differ.
+"""
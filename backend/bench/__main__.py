@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bench.auth import LocalSigningKey
+from bench.storage import MemoryJsonStore, SqliteJsonStore, install_storage
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Offline benchmark of the API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Write a data set to a SQLite file")
+    generate.add_argument("--store", required=True, help="SQLite file to create")
+    generate.add_argument("--scale", default="small", choices=("small", "medium", "full"))
+    generate.add_argument("--data-seed", type=int, default=1)
+
+    run = commands.add_parser("run", help="Run the scenarios and report latencies as json")
+    run.add_argument("--store", help="SQLite file from generate, by default a data set is generated in memory")
+    run.add_argument("--scale", default="small", choices=("small", "medium", "full"), help="Of the in-memory data set")
+    run.add_argument("--data-seed", type=int, default=1, help="Of the in-memory data set")
+    run.add_argument("--seed", type=int, default=1, help="Seed of the ids the scenarios pick")
+    run.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    run.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per scenario before those")
+    run.add_argument("--concurrency", type=int, default=8, help="Requests in flight at a time")
+    run.add_argument("--latency-ms", type=float, default=0.0, help="Simulated round trip of every storage operation")
+    run.add_argument("--scenario", action="append", help="Run only this scenario, can be repeated")
+    run.add_argument("--output", help="Write the report to this file instead of stdout")
+    run.add_argument("--baseline", help="Report to compare against, exits with 1 on regressions")
+    run.add_argument("--save-baseline", help="Also write the report to this file")
+    run.add_argument("--tolerance", type=float, default=0.2, help="Allowed change against the baseline, as a fraction")
+    run.add_argument("--min-delta-ms", type=float, default=0.5, help="Latency increases below this are not regressions")
+    return parser.parse_args(argv)
+
+
+def configure_environment() -> None:
+    """Settings of the app under test, read when main is imported."""
+    # The stand-in replaces db.storage.json, which only the databutton backend uses
+    os.environ["STORAGE_BACKEND"] = "databutton"
+    os.environ.setdefault("DATABUTTON_SERVICE_TYPE", "prodx")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+
+def generate_command(args: argparse.Namespace) -> int:
+    from bench.data import generate
+
+    started_at = time.perf_counter()
+    store = SqliteJsonStore(args.store)
+    manifest = generate(store, args.scale, args.data_seed)
+    store.checkpoint()
+    print(
+        f"Generated {args.scale} data set {manifest['counts']} in {time.perf_counter() - started_at:.1f} s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def open_run_store(args: argparse.Namespace, workdir: str):
+    from bench.data import generate, load_manifest
+
+    latency_seconds = args.latency_ms / 1000
+    if args.store is None:
+        started_at = time.perf_counter()
+        store = MemoryJsonStore(latency_seconds)
+        manifest = generate(store, args.scale, args.data_seed)
+        print(f"Generated {args.scale} data set in {time.perf_counter() - started_at:.1f} s", file=sys.stderr)
+        return store, manifest
+
+    # Writes of the scenarios go to a copy, the generated file stays as it was
+    path = os.path.join(workdir, "store.sqlite3")
+    shutil.copyfile(args.store, path)
+    store = SqliteJsonStore(path, latency_seconds)
+    manifest = load_manifest(store)
+    if manifest is None:
+        raise SystemExit(f"{args.store} has no data set, create it with: python -m bench generate --store {args.store}")
+    return store, manifest
+
+
+def run_command(args: argparse.Namespace) -> int:
+    from bench.runner import compare, run
+    from bench.scenarios import SCENARIOS
+
+    scenarios = SCENARIOS
+    if args.scenario:
+        unknown = set(args.scenario) - {scenario.name for scenario in SCENARIOS}
+        if unknown:
+            raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in args.scenario]
+
+    signing_key = LocalSigningKey()
+    signing_key.configure_environment()
+
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        store, manifest = open_run_store(args, workdir)
+        install_storage(store)
+
+        import main
+
+        options = {
+            "seed": args.seed,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+        }
+        report = asyncio.run(run(main.app, manifest, signing_key, scenarios, options))
+
+    if report["meta"]["uncovered_routes"] and not args.scenario:
+        print(f"Routes without a scenario: {', '.join(report['meta']['uncovered_routes'])}", file=sys.stderr)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        for name, values in report["comparison"]["mismatched_settings"].items():
+            print(f"Setting {name} differs from the baseline: {values}", file=sys.stderr)
+        for regression in report["comparison"]["regressions"]:
+            print(f"Regression: {regression}", file=sys.stderr)
+        exit_code = 1 if report["comparison"]["regressions"] else 0
+
+    encoded = json.dumps(report, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(encoded + "\n")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(encoded + "\n")
+    else:
+        print(encoded)
+    return exit_code
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    configure_environment()
+    if args.command == "generate":
+        return generate_command(args)
+    return run_command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""A local signing key standing in for Firebase auth, so tokens verify offline."""
+
+import json
+import os
+import tempfile
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+AUDIENCE = "bench"
+KEY_ID = "bench-key"
+
+
+class LocalSigningKey:
+    """RSA key whose public half auth_mw loads from AUTH_JWKS_FILE instead of Google."""
+
+    def __init__(self, key_id: str = KEY_ID):
+        self.key_id = key_id
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._tokens: dict[tuple[str, int], str] = {}
+
+    def jwk(self) -> dict:
+        """Public half of the key, as an entry of a JWKS."""
+        jwk = json.loads(RSAAlgorithm.to_jwk(self._key.public_key()))
+        jwk.update(kid=self.key_id, alg="RS256", use="sig")
+        return jwk
+
+    def configure_environment(self) -> None:
+        """Point auth_mw at this key, has to run before main is imported."""
+        fd, path = tempfile.mkstemp(prefix="bench-jwks-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"keys": [self.jwk()]}, f)
+        os.environ["AUTH_JWKS_FILE"] = path
+        os.environ["DATABUTTON_EXTENSIONS"] = json.dumps(
+            [{"name": "firebase-auth", "config": {"firebaseConfig": {"projectId": AUDIENCE}}}]
+        )
+
+    def token(self, user_id: str, expires_in: int = 3600) -> str:
+        """Signed id token of user_id, valid for expires_in seconds and reused for the same user."""
+        token = self._tokens.get((user_id, expires_in))
+        if token is None:
+            now = int(time.time())
+            claims = {"sub": user_id, "aud": AUDIENCE, "iat": now, "exp": now + expires_in}
+            token = self._tokens[user_id, expires_in] = jwt.encode(
+                claims, self._key, algorithm="RS256", headers={"kid": self.key_id}
+            )
+        return token
+
+    def headers(self, user_id: str) -> dict:
+        return {"authorization": f"Bearer {self.token(user_id)}"}
@@ -0,0 +1,338 @@
+"""Synthetic data set in the layout JsonStorageRepository keeps in db.storage.json.
+
+Popularity is skewed the way it is in production: a few communities hold
+most members, categories and topics, most communities are small. The same
+scale and seed always produce the same data set.
+"""
+
+import bisect
+import collections
+import dataclasses
+import itertools
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app.libs.repository.base import (
+    COMMUNITY_KEY_PATTERN,
+    FCATEGORY_KEY_PATTERN,
+    FTOPIC_KEY_PATTERN,
+    catalog_entry,
+)
+from app.libs.repository.json_storage import (
+    COMMUNITY_CATALOG_CHUNK_KEY_PATTERN,
+    COMMUNITY_CATALOG_KEY,
+    FCATEGORY_INDEX_KEY_PATTERN,
+    FTOPIC_COMMUNITY_INDEX_CHUNK_KEY_PATTERN,
+    FTOPIC_COMMUNITY_INDEX_KEY_PATTERN,
+    FTOPIC_CATEGORY_VERSION_KEY_PATTERN,
+    FTOPIC_COMMUNITY_VERSION_KEY_PATTERN,
+    FTOPIC_INDEX_CHUNK_KEY_PATTERN,
+    FTOPIC_INDEX_KEY_PATTERN,
+    FTOPIC_REF_KEY_PATTERN,
+    MEMBER_COUNT_KEY_PATTERN,
+    MEMBERSHIP_KEY_PATTERN,
+    USER_COMMUNITIES_KEY_PATTERN,
+    catalog_order,
+    split_by_month,
+)
+
+# Read by the scenarios to pick ids, stored next to the data set so a SQLite file carries its own
+MANIFEST_KEY = "benchmanifest.json"
+
+# Exponent of the Zipf distribution of popularity over communities and categories
+ZIPF_EXPONENT = 1.1
+
+# Topics sampled into the manifest for the topic detail scenario
+SAMPLED_TOPICS = 10_000
+
+WORDS = (
+    "art bikes books chess climbing code coffee cooking crypto cycling design diy drones film fishing "
+    "fitness football gaming gardening guitar hiking history jazz linux maps math movies music nature "
+    "photography physics poetry python robots running science sewing skating space startups tea "
+    "tennis travel trivia vinyl writing yoga"
+).split()
+
+
+@dataclasses.dataclass(frozen=True)
+class Scale:
+    communities: int
+    categories: int
+    topics: int
+    users: int
+    memberships: int
+
+
+SCALES = {
+    "small": Scale(communities=1_000, categories=50, topics=20_000, users=5_000, memberships=20_000),
+    "medium": Scale(communities=5_000, categories=250, topics=200_000, users=25_000, memberships=100_000),
+    "full": Scale(communities=10_000, categories=500, topics=1_000_000, users=100_000, memberships=500_000),
+}
+
+
+def user_id(n: int) -> str:
+    return f"benchuser{n:06d}"
+
+
+def zipf_cum_weights(count: int) -> list[float]:
+    """Cumulative weights for random.choices, rank 0 is the most popular."""
+    return list(itertools.accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(count)))
+
+
+class Generator:
+    """Builds the records of one data set, see generate()."""
+
+    def __init__(self, scale: Scale, seed: int):
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.now = datetime(2025, 6, 1, tzinfo=timezone.utc)
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _timestamp(self, after: datetime | None = None) -> datetime:
+        start = after or self.now - timedelta(days=365)
+        return start + timedelta(seconds=self.rng.uniform(0, (self.now - start).total_seconds()))
+
+    def _text(self, words: int) -> str:
+        return " ".join(self.rng.choices(WORDS, k=words)).capitalize()
+
+    def communities(self) -> list[dict]:
+        return [
+            {
+                "id": self._uuid(),
+                "name": f"{self._text(2)} {rank}",
+                "description": self._text(12),
+                "creator_id": user_id(self.rng.randrange(self.scale.users)),
+                "member_ids": [],
+                "created_at": self._timestamp(),
+                "version": 1,
+            }
+            for rank in range(self.scale.communities)
+        ]
+
+    def categories(self, communities: list[dict]) -> list[dict]:
+        # Popular communities get most categories, listed in the order of their community's rank
+        ranks = sorted(
+            self.rng.choices(range(len(communities)), cum_weights=zipf_cum_weights(len(communities)), k=self.scale.categories)
+        )
+        categories = []
+        for rank in ranks:
+            community = communities[rank]
+            categories.append(
+                {
+                    "id": self._uuid(),
+                    "community_id": community["id"],
+                    "name": self._text(2),
+                    "description": self._text(8),
+                    "created_at": self._timestamp(community["created_at"]),
+                    "is_deleted": False,
+                    "version": 1,
+                }
+            )
+        return categories
+
+    def topics(self, categories: list[dict]):
+        starts = [datetime.fromisoformat(category["created_at"]) for category in categories]
+        picks = self.rng.choices(
+            range(len(categories)), cum_weights=zipf_cum_weights(len(categories)), k=self.scale.topics
+        )
+        for index in picks:
+            category = categories[index]
+            created_at = self._timestamp(starts[index]).isoformat()
+            yield {
+                "title": self._text(6),
+                "content": self._text(40),
+                "id": self._uuid(),
+                "community_id": category["community_id"],
+                "category_id": category["id"],
+                "creator_id": user_id(self.rng.randrange(self.scale.users)),
+                "created_at": created_at,
+                "updated_at": created_at,
+                "is_deleted": False,
+            }
+
+    def memberships(self, communities: list[dict]) -> dict[str, list[str]]:
+        """Members per community id, creators included."""
+        members = {community["id"]: {community["creator_id"]: None} for community in communities}
+        picks = self.rng.choices(
+            range(len(communities)), cum_weights=zipf_cum_weights(len(communities)), k=self.scale.memberships
+        )
+        for rank in picks:
+            members[communities[rank]["id"]].setdefault(user_id(self.rng.randrange(self.scale.users)))
+        return {community_id: list(user_ids) for community_id, user_ids in members.items()}
+
+
+def month_index(key: str, chunk_key, entries: list, **order) -> list[tuple[str, dict]]:
+    """Head and month chunk documents of an index of entries."""
+    chunks = split_by_month(entries, **order)
+    head = {"months": [[month, len(month_entries)] for month, month_entries in chunks.items()], "version": 1}
+    return [(key, head)] + [(chunk_key(month), {"entries": e, "version": 1}) for month, e in chunks.items()]
+
+
+def generate(store, scale_name: str, seed: int) -> dict:
+    """Write a data set to store (anything with put_many), returns its manifest."""
+    generator = Generator(SCALES[scale_name], seed)
+    communities = generator.communities()
+    categories = generator.categories(communities)
+    members = generator.memberships(communities)
+
+    for community in communities:
+        community["member_ids"] = [community["creator_id"]]
+        community["created_at"] = community["created_at"].isoformat()
+    for category in categories:
+        category["created_at"] = category["created_at"].isoformat()
+
+    user_communities = collections.defaultdict(list)
+    for community_id, user_ids in members.items():
+        for member_id in user_ids:
+            user_communities[member_id].append(community_id)
+
+    category_index = collections.defaultdict(list)
+    for category in categories:
+        category_index[category["community_id"]].append(category["id"])
+
+    catalog = [catalog_entry({**c, "member_count": len(members[c["id"]])}) for c in communities]
+
+    store.put_many(
+        itertools.chain(
+            ((COMMUNITY_KEY_PATTERN.format(community_id=c["id"]), c) for c in communities),
+            (
+                (MEMBER_COUNT_KEY_PATTERN.format(community_id=community_id), {"member_count": len(user_ids), "version": 1})
+                for community_id, user_ids in members.items()
+            ),
+            (
+                (MEMBERSHIP_KEY_PATTERN.format(community_id=community_id, user_id=member_id), {"community_id": community_id, "user_id": member_id})
+                for community_id, user_ids in members.items()
+                for member_id in user_ids
+            ),
+            (
+                (USER_COMMUNITIES_KEY_PATTERN.format(user_id=member_id), {"community_ids": community_ids})
+                for member_id, community_ids in user_communities.items()
+            ),
+            month_index(
+                COMMUNITY_CATALOG_KEY,
+                lambda month: COMMUNITY_CATALOG_CHUNK_KEY_PATTERN.format(month=month),
+                catalog,
+                order=catalog_order,
+            ),
+            (
+                (FCATEGORY_KEY_PATTERN.format(community_id=c["community_id"], category_id=c["id"]), c)
+                for c in categories
+            ),
+            (
+                (FCATEGORY_INDEX_KEY_PATTERN.format(community_id=community_id), {"category_ids": category_ids, "version": 1})
+                for community_id, category_ids in category_index.items()
+            ),
+        )
+    )
+
+    # Topics are streamed, only their index entries and a sample are kept
+    topic_index = collections.defaultdict(list)
+    community_topic_index = collections.defaultdict(list)
+    sampled_topics = []
+
+    def topic_records():
+        for count, topic in enumerate(generator.topics(categories)):
+            community_id, category_id = topic["community_id"], topic["category_id"]
+            topic_index[(community_id, category_id)].append([topic["created_at"], topic["id"]])
+            community_topic_index[community_id].append([topic["created_at"], topic["id"], category_id])
+            if len(sampled_topics) < SAMPLED_TOPICS:
+                sampled_topics.append([community_id, topic["id"]])
+            else:
+                # Reservoir sampling keeps every topic equally likely
+                slot = generator.rng.randrange(count + 1)
+                if slot < SAMPLED_TOPICS:
+                    sampled_topics[slot] = [community_id, topic["id"]]
+            key = FTOPIC_KEY_PATTERN.format(community_id=community_id, category_id=category_id, topic_id=topic["id"])
+            yield key, topic
+            yield FTOPIC_REF_KEY_PATTERN.format(topic_id=topic["id"]), {
+                "community_id": community_id,
+                "category_id": category_id,
+                "key": key,
+            }
+
+    store.put_many(topic_records())
+
+    store.put_many(
+        itertools.chain(
+            itertools.chain.from_iterable(
+                month_index(
+                    FTOPIC_INDEX_KEY_PATTERN.format(community_id=c["community_id"], category_id=c["id"]),
+                    lambda month, c=c: FTOPIC_INDEX_CHUNK_KEY_PATTERN.format(
+                        community_id=c["community_id"], category_id=c["id"], month=month
+                    ),
+                    topic_index[(c["community_id"], c["id"])],
+                )
+                for c in categories
+            ),
+            itertools.chain.from_iterable(
+                month_index(
+                    FTOPIC_COMMUNITY_INDEX_KEY_PATTERN.format(community_id=community_id),
+                    lambda month, community_id=community_id: FTOPIC_COMMUNITY_INDEX_CHUNK_KEY_PATTERN.format(
+                        community_id=community_id, month=month
+                    ),
+                    entries,
+                )
+                for community_id, entries in community_topic_index.items()
+            ),
+            (
+                (FTOPIC_CATEGORY_VERSION_KEY_PATTERN.format(community_id=community_id, category_id=category_id), {"version": 1})
+                for community_id, category_id in topic_index
+            ),
+            (
+                (FTOPIC_COMMUNITY_VERSION_KEY_PATTERN.format(community_id=community_id), {"version": 1})
+                for community_id in {community_id for community_id, _ in topic_index}
+            ),
+        )
+    )
+
+    manifest = {
+        "scale": scale_name,
+        "seed": seed,
+        "counts": dataclasses.asdict(generator.scale),
+        # Rank order, the first entries are the most popular
+        "communities": [[c["id"], c["creator_id"]] for c in communities],
+        "categories": [[c["community_id"], c["id"]] for c in categories],
+        "topics": sampled_topics,
+        "search_terms": WORDS,
+    }
+    store.put_many([(MANIFEST_KEY, manifest)])
+    return manifest
+
+
+def load_manifest(store) -> dict | None:
+    try:
+        return store.get(MANIFEST_KEY)
+    except FileNotFoundError:
+        return None
+
+
+class Picker:
+    """Picks ids from a manifest with the same skew as the data set, seeded for repeatable runs."""
+
+    def __init__(self, manifest: dict, seed: int):
+        self.manifest = manifest
+        self.rng = random.Random(seed)
+        self._community_weights = zipf_cum_weights(len(manifest["communities"]))
+        self._category_weights = zipf_cum_weights(len(manifest["categories"]))
+
+    def community(self) -> tuple[str, str]:
+        """(community id, creator id)"""
+        index = bisect.bisect_left(self._community_weights, self.rng.uniform(0, self._community_weights[-1]))
+        return tuple(self.manifest["communities"][min(index, len(self._community_weights) - 1)])
+
+    def category(self) -> tuple[str, str]:
+        """(community id, category id)"""
+        index = bisect.bisect_left(self._category_weights, self.rng.uniform(0, self._category_weights[-1]))
+        return tuple(self.manifest["categories"][min(index, len(self._category_weights) - 1)])
+
+    def topic(self) -> tuple[str, str]:
+        """(community id, topic id)"""
+        return tuple(self.rng.choice(self.manifest["topics"]))
+
+    def user(self) -> str:
+        return user_id(self.rng.randrange(self.manifest["counts"]["users"]))
+
+    def search_term(self) -> str:
+        return self.rng.choice(self.manifest["search_terms"])
@@ -0,0 +1,168 @@
+"""Drives the app in-process over ASGI and reports latency percentiles per scenario.
+
+Requests go through httpx.ASGITransport into the app created by main, so no
+port is opened and nothing leaves the machine. Client and app share one
+event loop, the client's share of the latencies is small but included.
+"""
+
+import asyncio
+import math
+import platform
+import statistics
+import sys
+import time
+
+import httpx
+
+from bench.auth import LocalSigningKey
+from bench.data import Picker
+from bench.scenarios import Context, Scenario, uncovered_routes
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+def summarize(latencies: list[float], status_codes: dict[int, int], errors: int, elapsed: float) -> dict:
+    values = sorted(seconds * 1000 for seconds in latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(values), 3) if values else 0.0,
+            **{f"p{p}": round(percentile(values, p), 3) for p in PERCENTILES},
+            "max": round(values[-1], 3) if values else 0.0,
+        },
+    }
+
+
+async def run_scenario(ctx: Context, scenario: Scenario, requests: int, warmup: int, concurrency: int) -> dict:
+    # Setup requests are made here, before anything is timed
+    warmup_requests = [await scenario.prepare(ctx) for _ in range(warmup)]
+    measured_requests = [await scenario.prepare(ctx) for _ in range(requests)]
+
+    latencies: list[float] = []
+    status_codes: dict[int, int] = {}
+    errors = 0
+    samples = []
+
+    async def send(request, record: bool) -> None:
+        nonlocal errors
+        started_at = time.perf_counter()
+        response = await ctx.client.request(
+            request.method, request.url, headers=request.headers, params=request.params, json=request.json
+        )
+        seconds = time.perf_counter() - started_at
+        if not record:
+            return
+        latencies.append(seconds)
+        status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+        if response.status_code not in scenario.expected:
+            errors += 1
+            if len(samples) < 3:
+                samples.append(f"{response.status_code}: {response.text[:200]}")
+
+    async def worker(queue: list, record: bool) -> None:
+        while queue:
+            await send(queue.pop(), record)
+
+    for queue, record in ((warmup_requests[::-1], False), (measured_requests[::-1], True)):
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(queue, record) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+
+    result = summarize(latencies, status_codes, errors, elapsed)
+    if samples:
+        result["error_samples"] = samples
+    return result
+
+
+async def run(app, manifest: dict, signing_key: LocalSigningKey, scenarios: list[Scenario], options: dict) -> dict:
+    """Run scenarios one after another against app, returns the report."""
+    picker = Picker(manifest, options["seed"])
+    creators = dict(manifest["communities"])
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    started_at = time.perf_counter()
+    # The lifespan loads the signing keys and opens the storage, like a served app
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            ctx = Context(client=client, picker=picker, signing_key=signing_key, creators=creators)
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(
+                    ctx, scenario, options["requests"], options["warmup"], options["concurrency"]
+                )
+                print(f"{scenario.name}: {format_result(results[scenario.name])}", file=sys.stderr)
+
+    return {
+        "meta": {
+            **options,
+            "scale": manifest["scale"],
+            "data_seed": manifest["seed"],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "total_seconds": round(time.perf_counter() - started_at, 3),
+            "uncovered_routes": uncovered_routes(app.openapi(), scenarios),
+        },
+        "scenarios": results,
+    }
+
+
+def format_result(result: dict) -> str:
+    latency = result["latency_ms"]
+    return (
+        f"{result['throughput_rps']:.0f} req/s, p50 {latency['p50']:.2f} ms, p95 {latency['p95']:.2f} ms, "
+        f"p99 {latency['p99']:.2f} ms, {result['errors']} errors"
+    )
+
+
+# Settings that have to match for two reports to be comparable
+COMPARABLE_SETTINGS = ("scale", "data_seed", "seed", "requests", "concurrency", "latency_ms")
+
+
+def compare(report: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> dict:
+    """Regressions of report against baseline, per scenario both ran.
+
+    A scenario regressed when its p95 or p99 latency grew by more than
+    tolerance (a fraction) and min_delta_ms, or its throughput dropped by
+    more than tolerance, or it has errors the baseline did not have.
+    """
+    mismatched = {
+        name: {"baseline": baseline["meta"].get(name), "current": report["meta"].get(name)}
+        for name in COMPARABLE_SETTINGS
+        if baseline["meta"].get(name) != report["meta"].get(name)
+    }
+    scenarios = {}
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        changes = {}
+        for p in ("p50", "p95", "p99"):
+            before, after = previous["latency_ms"][p], current["latency_ms"][p]
+            changes[f"{p}_ratio"] = round(after / before, 3) if before else None
+            if p != "p50" and after > before * (1 + tolerance) and after - before > min_delta_ms:
+                regressions.append(f"{name}: {p} {before:.2f} -> {after:.2f} ms")
+        before, after = previous["throughput_rps"], current["throughput_rps"]
+        changes["throughput_ratio"] = round(after / before, 3) if before else None
+        if after < before * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before:.0f} -> {after:.0f} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+        scenarios[name] = changes
+    return {
+        "tolerance": tolerance,
+        "min_delta_ms": min_delta_ms,
+        "mismatched_settings": mismatched,
+        "scenarios": scenarios,
+        "regressions": regressions,
+    }
@@ -0,0 +1,255 @@
+"""One scenario per route of the routers in routers.json.
+
+A scenario prepares each of its requests before the timed phase, including
+any setup requests it needs (e.g. creating the category a delete removes),
+so only the request itself is measured. Ids are picked with the skew of
+the data set, popular communities are hit most.
+"""
+
+import dataclasses
+import itertools
+from typing import Awaitable, Callable
+
+import httpx
+
+from bench.auth import LocalSigningKey
+from bench.data import Picker
+
+
+@dataclasses.dataclass
+class Request:
+    method: str
+    url: str
+    headers: dict
+    params: dict | None = None
+    json: dict | list | None = None
+
+
+@dataclasses.dataclass
+class Context:
+    client: httpx.AsyncClient
+    picker: Picker
+    signing_key: LocalSigningKey
+    creators: dict[str, str]
+    # Unique suffixes for users and names created during the run
+    counter: itertools.count = dataclasses.field(default_factory=itertools.count)
+
+    def headers(self, user_id: str) -> dict:
+        return self.signing_key.headers(user_id)
+
+    async def setup(self, method: str, url: str, user_id: str, expected: int, **kwargs) -> httpx.Response:
+        """Unmeasured request preparing a measured one."""
+        response = await self.client.request(method, url, headers=self.headers(user_id), **kwargs)
+        if response.status_code != expected:
+            raise RuntimeError(f"Setup request {method} {url} returned {response.status_code}: {response.text[:200]}")
+        return response
+
+
+@dataclasses.dataclass(frozen=True)
+class Scenario:
+    name: str
+    method: str
+    # Route template as listed by app.openapi()
+    route: str
+    expected: frozenset[int]
+    prepare: Callable[[Context], Awaitable[Request]]
+
+
+def _get(url: str, user_id: str, ctx: Context, **params) -> Request:
+    return Request("GET", url, ctx.headers(user_id), params=params or None)
+
+
+async def list_communities(ctx: Context) -> Request:
+    return _get("/routes/communities", ctx.picker.user(), ctx, limit=20)
+
+
+async def search_communities(ctx: Context) -> Request:
+    return _get("/routes/search/communities", ctx.picker.user(), ctx, q=ctx.picker.search_term(), limit=20)
+
+
+async def get_community(ctx: Context) -> Request:
+    community_id, _ = ctx.picker.community()
+    return _get(f"/routes/communities/{community_id}", ctx.picker.user(), ctx)
+
+
+async def revalidate_community(ctx: Context) -> Request:
+    community_id, _ = ctx.picker.community()
+    user_id = ctx.picker.user()
+    url = f"/routes/communities/{community_id}"
+    response = await ctx.setup("GET", url, user_id, 200)
+    return Request("GET", url, {**ctx.headers(user_id), "if-none-match": response.headers["etag"]})
+
+
+async def my_communities(ctx: Context) -> Request:
+    return _get("/routes/communities/me", ctx.picker.user(), ctx)
+
+
+def _community_body(ctx: Context, user_id: str) -> dict:
+    return {"name": f"Bench community {next(ctx.counter)}", "description": "Created by the benchmark", "creator_id": user_id}
+
+
+async def create_community(ctx: Context) -> Request:
+    user_id = ctx.picker.user()
+    return Request("POST", "/routes/communities/", ctx.headers(user_id), json=_community_body(ctx, user_id))
+
+
+async def list_forum_categories(ctx: Context) -> Request:
+    community_id, _ = ctx.picker.community()
+    return _get(f"/routes/communities/{community_id}/forum-categories", ctx.picker.user(), ctx)
+
+
+def _category_body(ctx: Context) -> dict:
+    return {"name": f"Bench category {next(ctx.counter)}", "description": "Created by the benchmark"}
+
+
+async def create_forum_category(ctx: Context) -> Request:
+    community_id, creator_id = ctx.picker.community()
+    return Request(
+        "POST", f"/routes/communities/{community_id}/forum-categories", ctx.headers(creator_id), json=_category_body(ctx)
+    )
+
+
+async def update_forum_category(ctx: Context) -> Request:
+    community_id, category_id = ctx.picker.category()
+    return Request(
+        "PUT",
+        f"/routes/communities/{community_id}/forum-categories/{category_id}",
+        ctx.headers(ctx.creators[community_id]),
+        json=_category_body(ctx),
+    )
+
+
+async def delete_forum_category(ctx: Context) -> Request:
+    community_id, creator_id = ctx.picker.community()
+    url = f"/routes/communities/{community_id}/forum-categories"
+    response = await ctx.setup("POST", url, creator_id, 201, json=_category_body(ctx))
+    return Request("DELETE", f"{url}/{response.json()['id']}", ctx.headers(creator_id))
+
+
+async def list_category_topics(ctx: Context) -> Request:
+    community_id, category_id = ctx.picker.category()
+    return _get(f"/routes/communities/{community_id}/categories/{category_id}/topics", ctx.picker.user(), ctx)
+
+
+async def create_topic(ctx: Context) -> Request:
+    community_id, category_id = ctx.picker.category()
+    return Request(
+        "POST",
+        f"/routes/communities/{community_id}/categories/{category_id}/topics",
+        ctx.headers(ctx.picker.user()),
+        json={"title": f"Bench topic {next(ctx.counter)}", "content": "Created by the benchmark"},
+    )
+
+
+async def latest_topics(ctx: Context) -> Request:
+    # Picked through a category, so the community has topics
+    community_id, _ = ctx.picker.category()
+    return _get(f"/routes/communities/{community_id}/topics/latest", ctx.picker.user(), ctx)
+
+
+async def get_topic(ctx: Context) -> Request:
+    community_id, topic_id = ctx.picker.topic()
+    return _get(f"/routes/communities/{community_id}/topics/{topic_id}", ctx.picker.user(), ctx)
+
+
+async def join_community(ctx: Context) -> Request:
+    community_id, _ = ctx.picker.community()
+    # A user nobody has seen, so every join adds a member
+    user_id = f"benchjoiner{next(ctx.counter):07d}"
+    return Request("POST", f"/routes/communities/{community_id}/join", ctx.headers(user_id))
+
+
+async def membership_status(ctx: Context) -> Request:
+    community_id, _ = ctx.picker.community()
+    return _get(f"/routes/communities/{community_id}/membership_status", ctx.picker.user(), ctx)
+
+
+async def membership_statuses(ctx: Context) -> Request:
+    community_ids = list(dict.fromkeys(ctx.picker.community()[0] for _ in range(20)))
+    return Request(
+        "POST",
+        "/routes/communities/membership-statuses",
+        ctx.headers(ctx.picker.user()),
+        json={"community_ids": community_ids},
+    )
+
+
+SCENARIOS = [
+    Scenario("list_communities", "GET", "/routes/communities", frozenset({200}), list_communities),
+    Scenario("search_communities", "GET", "/routes/search/communities", frozenset({200}), search_communities),
+    Scenario("get_community", "GET", "/routes/communities/{community_id}", frozenset({200}), get_community),
+    Scenario("revalidate_community", "GET", "/routes/communities/{community_id}", frozenset({304}), revalidate_community),
+    Scenario("my_communities", "GET", "/routes/communities/me", frozenset({200}), my_communities),
+    Scenario("create_community", "POST", "/routes/communities/", frozenset({201}), create_community),
+    Scenario(
+        "list_forum_categories",
+        "GET",
+        "/routes/communities/{community_id}/forum-categories",
+        frozenset({200}),
+        list_forum_categories,
+    ),
+    Scenario(
+        "create_forum_category",
+        "POST",
+        "/routes/communities/{community_id}/forum-categories",
+        frozenset({201}),
+        create_forum_category,
+    ),
+    # Concurrent updates of a popular category may conflict
+    Scenario(
+        "update_forum_category",
+        "PUT",
+        "/routes/communities/{community_id}/forum-categories/{category_id}",
+        frozenset({200, 409}),
+        update_forum_category,
+    ),
+    Scenario(
+        "delete_forum_category",
+        "DELETE",
+        "/routes/communities/{community_id}/forum-categories/{category_id}",
+        frozenset({204}),
+        delete_forum_category,
+    ),
+    Scenario(
+        "list_category_topics",
+        "GET",
+        "/routes/communities/{community_id}/categories/{category_id}/topics",
+        frozenset({200}),
+        list_category_topics,
+    ),
+    Scenario(
+        "create_topic",
+        "POST",
+        "/routes/communities/{community_id}/categories/{category_id}/topics",
+        frozenset({201}),
+        create_topic,
+    ),
+    Scenario("latest_topics", "GET", "/routes/communities/{community_id}/topics/latest", frozenset({200}), latest_topics),
+    Scenario("get_topic", "GET", "/routes/communities/{community_id}/topics/{topic_id}", frozenset({200}), get_topic),
+    Scenario("join_community", "POST", "/routes/communities/{community_id}/join", frozenset({200}), join_community),
+    Scenario(
+        "membership_status",
+        "GET",
+        "/routes/communities/{community_id}/membership_status",
+        frozenset({200}),
+        membership_status,
+    ),
+    Scenario(
+        "membership_statuses",
+        "POST",
+        "/routes/communities/membership-statuses",
+        frozenset({200}),
+        membership_statuses,
+    ),
+]
+
+
+def uncovered_routes(openapi: dict, scenarios: list[Scenario]) -> list[str]:
+    """Routes of the app no scenario requests, e.g. after a router was added."""
+    covered = {(scenario.method, scenario.route) for scenario in scenarios}
+    return sorted(
+        f"{method.upper()} {path}"
+        for path, operations in openapi["paths"].items()
+        for method in operations
+        if (method.upper(), path) not in covered
+    )
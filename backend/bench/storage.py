@@ -0,0 +1,134 @@
+"""Local stand-ins for db.storage.json, so benchmarks run offline."""
+
+import collections
+import json
+import sqlite3
+import sys
+import threading
+import time
+import types
+
+# What db.storage.json.list() returns per key
+FileInfo = collections.namedtuple("FileInfo", ["name", "size"])
+
+
+class MemoryJsonStore:
+    """db.storage.json in a dict, documents are kept json encoded like the real store returns copies.
+
+    latency_seconds is slept on every call, to model the round trip to the real storage.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self._docs: dict[str, str] = {}
+
+    def _wait(self) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def get(self, key: str, default=None):
+        self._wait()
+        encoded = self._docs.get(key)
+        if encoded is None:
+            if default is not None:
+                return default
+            raise FileNotFoundError(key)
+        return json.loads(encoded)
+
+    def put(self, key: str, value) -> None:
+        self._wait()
+        self._docs[key] = json.dumps(value)
+
+    def put_many(self, items) -> None:
+        """Write (key, value) pairs without latency, for generating data sets."""
+        for key, value in items:
+            self._docs[key] = json.dumps(value)
+
+    def delete(self, key: str) -> None:
+        self._wait()
+        self._docs.pop(key, None)
+
+    def list(self):
+        self._wait()
+        return (FileInfo(key, len(encoded)) for key, encoded in list(self._docs.items()))
+
+
+class SqliteJsonStore:
+    """db.storage.json in a SQLite file, so a large data set is generated once and reused.
+
+    Every thread reads through its own connection, latency_seconds is slept on every call.
+    """
+
+    def __init__(self, path: str, latency_seconds: float = 0.0):
+        self.path = path
+        self.latency_seconds = latency_seconds
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS documents (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        return conn
+
+    def _wait(self) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def get(self, key: str, default=None):
+        self._wait()
+        row = self._connection().execute("SELECT value FROM documents WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            if default is not None:
+                return default
+            raise FileNotFoundError(key)
+        return json.loads(row[0])
+
+    def put(self, key: str, value) -> None:
+        self._wait()
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO documents (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def put_many(self, items) -> None:
+        """Write (key, value) pairs in one transaction without latency, for generating data sets."""
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (key, value) VALUES (?, ?)",
+                ((key, json.dumps(value)) for key, value in items),
+            )
+
+    def delete(self, key: str) -> None:
+        self._wait()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+
+    def checkpoint(self) -> None:
+        """Move the write-ahead log into the database file, so the file can be copied on its own."""
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def list(self):
+        self._wait()
+        rows = self._connection().execute("SELECT key, length(value) FROM documents").fetchall()
+        return (FileInfo(key, size) for key, size in rows)
+
+
+def open_store(path: str | None, latency_seconds: float = 0.0):
+    """In-memory store without a path, the SQLite file at path otherwise."""
+    if path is None:
+        return MemoryJsonStore(latency_seconds)
+    return SqliteJsonStore(path, latency_seconds)
+
+
+def install_storage(store) -> None:
+    """Make store the db.storage.json of the app.
+
+    The app imports databutton on first use of the storage, so this has to
+    run before that, in practice before importing main.
+    """
+    if "databutton" in sys.modules:
+        raise RuntimeError("databutton was imported already, install the storage stand-in first")
+    databutton = types.ModuleType("databutton")
+    databutton.storage = types.SimpleNamespace(json=store)
+    sys.modules["databutton"] = databutton
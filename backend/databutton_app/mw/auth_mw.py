@@ -1,13 +1,18 @@
-import functools
+import logging
 from http import HTTPStatus
 from typing import Annotated, Callable
 import jwt
 from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.requests import HTTPConnection
-from jwt import PyJWKClient
 from pydantic import BaseModel
 from starlette.requests import Request
 
+from databutton_app.mw.jwks import get_jwks
+from databutton_app.mw.token_cache import get_token_cache
+from databutton_app.mw.verifier import get_token_verifier
+
+logger = logging.getLogger(__name__)
+
 
 class AuthConfig(BaseModel):
     jwks_url: str
@@ -46,24 +51,27 @@ def get_audit_log(request: HTTPConnection) -> Callable[[str], None] | None:
 AuditLogDep = Annotated[Callable[[str], None] | None, Depends(get_audit_log)]
 
 
-def get_authorized_user(
+async def get_authorized_user(
     request: HTTPConnection,
 ) -> User:
     auth_config = get_auth_config(request)
 
     try:
+        # Parsing and the cache lookup run on the event loop, only new tokens go to the verifier pool
         if isinstance(request, WebSocket):
-            user = authorize_websocket(request, auth_config)
+            token = get_websocket_token(request)
         elif isinstance(request, Request):
-            user = authorize_request(request, auth_config)
+            token = get_request_token(request, auth_config)
         else:
             raise ValueError("Unexpected request type")
 
+        user = await authorize_token_async(token, auth_config) if token else None
+
         if user is not None:
             return user
-        print("Request authentication returned no user")
+        logger.debug("Request authentication returned no user")
     except Exception as e:
-        print(f"Request authentication failed: {e}")
+        logger.warning("Request authentication failed: %s", e)
 
     if isinstance(request, WebSocket):
         raise WebSocketException(
@@ -75,15 +83,10 @@ def get_authorized_user(
         )
 
 
-@functools.cache
-def get_jwks_client(url: str):
-    """Reuse client cached by its url, client caches keys by default."""
-    return PyJWKClient(url, cache_keys=True)
-
-
 def get_signing_key(url: str, token: str) -> tuple[str, str]:
-    client = get_jwks_client(url)
-    signing_key = client.get_signing_key_from_jwt(token)
+    # Keys are loaded at startup and refreshed in the background, see main.create_app
+    kid = jwt.get_unverified_header(token).get("kid")
+    signing_key = get_jwks(url).get_signing_key(kid)
     key = signing_key.key
     alg = signing_key.algorithm_name
     if alg != "RS256":
@@ -91,10 +94,7 @@ def get_signing_key(url: str, token: str) -> tuple[str, str]:
     return (key, alg)
 
 
-def authorize_websocket(
-    request: WebSocket,
-    auth_config: AuthConfig,
-) -> User | None:
+def get_websocket_token(request: WebSocket) -> str | None:
     # Parse Sec-Websocket-Protocol
     header = "Sec-Websocket-Protocol"
     sep = ","
@@ -111,33 +111,69 @@ def authorize_websocket(
             break
 
     if not token:
-        print(f"Missing bearer {prefix}.<token> in protocols")
+        logger.debug("Missing bearer %s.<token> in protocols", prefix)
         return None
 
-    return authorize_token(token, auth_config)
+    return token
 
 
-def authorize_request(
-    request: Request,
-    auth_config: AuthConfig,
-) -> User | None:
+def get_request_token(request: Request, auth_config: AuthConfig) -> str | None:
     auth_header = request.headers.get(auth_config.header)
     if not auth_header:
-        print(f"Missing header '{auth_config.header}'")
+        logger.debug("Missing header '%s'", auth_config.header)
         return None
 
     token = auth_header.startswith("Bearer ") and auth_header[7:]
     if not token:
-        print(f"Missing bearer token in '{auth_config.header}'")
+        logger.debug("Missing bearer token in '%s'", auth_config.header)
         return None
 
-    return authorize_token(token, auth_config)
+    return token
+
+
+def authorize_websocket(
+    request: WebSocket,
+    auth_config: AuthConfig,
+) -> User | None:
+    token = get_websocket_token(request)
+    return authorize_token(token, auth_config) if token else None
+
+
+def authorize_request(
+    request: Request,
+    auth_config: AuthConfig,
+) -> User | None:
+    token = get_request_token(request, auth_config)
+    return authorize_token(token, auth_config) if token else None
+
+
+async def authorize_token_async(
+    token: str,
+    auth_config: AuthConfig,
+) -> User | None:
+    """Like authorize_token, verifying new tokens on the dedicated verifier pool."""
+    cached_user = get_token_cache().get(token, auth_config.audience)
+    if cached_user is not None:
+        return cached_user
+    return await get_token_verifier().run(verify_token, token, auth_config)
 
 
 def authorize_token(
     token: str,
     auth_config: AuthConfig,
 ) -> User | None:
+    # Tokens verified before skip the signature check until shortly before they expire
+    cached_user = get_token_cache().get(token, auth_config.audience)
+    if cached_user is not None:
+        return cached_user
+    return verify_token(token, auth_config)
+
+
+def verify_token(
+    token: str,
+    auth_config: AuthConfig,
+) -> User | None:
+    """Check the token signature and claims, and cache the user on success. Blocking."""
     # Audience and jwks url to get signing key from based on the users config
     jwks_urls = [(auth_config.audience, auth_config.jwks_url)]
 
@@ -146,7 +182,7 @@ def authorize_token(
         try:
             key, alg = get_signing_key(jwks_url, token)
         except Exception as e:
-            print(f"Failed to get signing key {e}")
+            logger.warning("Failed to get signing key: %s", e)
             continue
 
         try:
@@ -157,13 +193,15 @@ def authorize_token(
                 audience=audience,
             )
         except jwt.PyJWTError as e:
-            print(f"Failed to decode and validate token {e}")
+            logger.info("Failed to decode and validate token: %s", e)
             continue
 
     try:
         user = User.model_validate(payload)
-        print(f"User {user.sub} authenticated")
+        logger.debug("User authenticated", extra={"user_id": user.sub})
+        if isinstance(payload.get("exp"), (int, float)):
+            get_token_cache().put(token, auth_config.audience, user, payload["exp"])
         return user
     except Exception as e:
-        print(f"Failed to parse token payload {e}")
+        logger.info("Failed to parse token payload: %s", e)
         return None
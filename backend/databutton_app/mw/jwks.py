@@ -0,0 +1,134 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+
+import jwt
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class JwksKeySet:
+    """Signing keys of a JWKS url (or a local JWKS file), kept in memory.
+
+    load() downloads the keys; it is called once at startup and then by
+    refresh_periodically() shortly before the keys expire according to the
+    Cache-Control max-age of the response, so requests find their key in
+    memory. A token signed with an unknown kid triggers at most one
+    download at a time and at most one every unknown_kid_interval seconds,
+    concurrent requests wait for that same download.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        file_path: str | None = None,
+        refresh_interval: float = 3600,
+        unknown_kid_interval: float = 30,
+        timeout: float = 10,
+    ):
+        self.url = url
+        self.file_path = file_path
+        self.refresh_interval = refresh_interval
+        self.unknown_kid_interval = unknown_kid_interval
+        self.timeout = timeout
+        self._keys: dict[str, jwt.PyJWK] = {}
+        self._expires_at = 0.0
+        self._loaded_at = 0.0
+        self._attempted_at = float("-inf")
+        self._load_lock = threading.Lock()
+        self.loads = 0
+        self.load_errors = 0
+
+    def _fetch(self) -> tuple[dict, float]:
+        if self.file_path:
+            with open(self.file_path) as f:
+                return json.load(f), self.refresh_interval
+
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            match = MAX_AGE_PATTERN.search(response.headers.get("Cache-Control", ""))
+            max_age = float(match.group(1)) if match else self.refresh_interval
+            return json.load(response), max_age
+
+    def load(self) -> None:
+        """Download the current keys, replacing the ones in memory."""
+        with self._load_lock:
+            self._load()
+
+    def _load(self) -> None:
+        self._attempted_at = time.monotonic()
+        try:
+            data, max_age = self._fetch()
+            key_set = jwt.PyJWKSet.from_dict(data)
+        except Exception:
+            self.load_errors += 1
+            raise
+        self._keys = {key.key_id: key for key in key_set.keys if key.key_id}
+        self._loaded_at = time.monotonic()
+        self._expires_at = self._loaded_at + max_age
+        self.loads += 1
+        logger.info("Loaded %d signing keys from %s, valid for %.0fs", len(self._keys), self.file_path or self.url, max_age)
+
+    def get_signing_key(self, kid: str) -> jwt.PyJWK:
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        # Unknown kid, possibly rotated keys: one download for all requests waiting on it
+        loaded_at = self._loaded_at
+        with self._load_lock:
+            key = self._keys.get(kid)
+            if key is None and self._loaded_at == loaded_at:
+                if time.monotonic() - self._attempted_at >= self.unknown_kid_interval:
+                    self._load()
+                    key = self._keys.get(kid)
+        if key is None:
+            raise jwt.PyJWKClientError(f"Unable to find a signing key that matches: {kid}")
+        return key
+
+    def seconds_until_refresh(self) -> float:
+        """Refresh when 90% of the keys' lifetime has passed."""
+        lifetime = self._expires_at - self._loaded_at
+        return max(self._loaded_at + lifetime * 0.9 - time.monotonic(), 0)
+
+    async def refresh_periodically(self, retry_interval: float = 60) -> None:
+        """Keep the keys fresh until cancelled, run as a background task."""
+        while True:
+            await asyncio.sleep(self.seconds_until_refresh())
+            try:
+                await asyncio.to_thread(self.load)
+            except Exception as e:
+                # Keep using the keys we have, they usually outlive their max-age
+                logger.warning("Failed to refresh signing keys from %s: %s", self.file_path or self.url, e)
+                await asyncio.sleep(retry_interval)
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys),
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "seconds_until_refresh": self.seconds_until_refresh(),
+        }
+
+
+@functools.cache
+def get_jwks(url: str) -> JwksKeySet:
+    """Key set of a JWKS url, created once per url.
+
+    Set AUTH_JWKS_FILE to the path of a JWKS json file to read the keys from
+    that file instead, e.g. for offline tests and benchmarks.
+    AUTH_JWKS_REFRESH_SECONDS (default 3600) is the refresh interval used when
+    the response has no max-age.
+    """
+    return JwksKeySet(
+        url,
+        file_path=os.environ.get("AUTH_JWKS_FILE") or None,
+        refresh_interval=float(os.environ.get("AUTH_JWKS_REFRESH_SECONDS", "3600")),
+    )
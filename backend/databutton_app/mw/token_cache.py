@@ -0,0 +1,84 @@
+import collections
+import functools
+import hashlib
+import os
+import threading
+import time
+
+
+class VerifiedTokenCache:
+    """Bounded cache of users whose token has already been verified.
+
+    Entries are keyed by a hash of the token and the audience it was verified
+    for, so raw tokens are never kept in memory, and expire safety_margin
+    seconds before the token's exp. The least recently used entry is evicted
+    when max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int, safety_margin: float):
+        self.max_entries = max_entries
+        self.safety_margin = safety_margin
+        self._lock = threading.Lock()
+        # key -> (expires_at as unix time, user), least recently used first
+        self._entries: collections.OrderedDict[bytes, tuple[float, object]] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token: str, audience: str) -> bytes:
+        return hashlib.sha256(f"{audience}\0{token}".encode()).digest()
+
+    def get(self, token: str, audience: str):
+        """Return the cached user of token, or None if it has to be verified."""
+        key = self._key(token, audience)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, audience: str, user, exp: float) -> None:
+        """Remember the user of a verified token until exp minus the safety margin."""
+        expires_at = exp - self.safety_margin
+        if self.max_entries <= 0 or expires_at <= time.time():
+            return
+        key = self._key(token, audience)
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """Counters, hit ratio and current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+@functools.cache
+def get_token_cache() -> VerifiedTokenCache:
+    """Create the verified-token cache once and reuse it.
+
+    AUTH_TOKEN_CACHE_MAX_ENTRIES (default 10000, 0 disables it) bounds the
+    cache and AUTH_TOKEN_CACHE_MARGIN_SECONDS (default 30) is how long before
+    exp a token is verified again.
+    """
+    return VerifiedTokenCache(
+        int(os.environ.get("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000")),
+        float(os.environ.get("AUTH_TOKEN_CACHE_MARGIN_SECONDS", "30")),
+    )
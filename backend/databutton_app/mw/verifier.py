@@ -0,0 +1,92 @@
+import asyncio
+import concurrent.futures
+import functools
+import os
+import threading
+import time
+
+
+class TokenVerifier:
+    """Dedicated, bounded thread pool for token signature checks.
+
+    Verification runs on its own max_workers threads, so a burst of new
+    tokens cannot occupy the threads the rest of the app runs on. At most
+    max_pending verifications are queued or running, further callers wait on
+    the event loop. Queue depth and latencies are available from stats().
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="auth-verify"
+        )
+        self._semaphore = asyncio.Semaphore(max_pending)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.verifications = 0
+        self.wait_seconds = 0.0
+        self.verify_seconds = 0.0
+        self.max_verify_seconds = 0.0
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the verification pool and return its result."""
+        queued_at = time.perf_counter()
+        started_at = None
+
+        def call():
+            nonlocal started_at
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        async with self._semaphore:
+            with self._lock:
+                self._queued += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    if started_at is None:
+                        # Cancelled before a worker picked it up
+                        self._queued -= 1
+                        started_at = finished_at
+                    self.verifications += 1
+                    self.wait_seconds += started_at - queued_at
+                    self.verify_seconds += finished_at - started_at
+                    self.max_verify_seconds = max(self.max_verify_seconds, finished_at - started_at)
+
+    def stats(self) -> dict:
+        """Queue depth, verifications running and their timings."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "queued": self._queued,
+                "running": self._running,
+                "verifications": self.verifications,
+                "wait_seconds": self.wait_seconds,
+                "verify_seconds": self.verify_seconds,
+                "max_verify_seconds": self.max_verify_seconds,
+            }
+
+
+@functools.cache
+def get_token_verifier() -> TokenVerifier:
+    """Create the verification pool once and reuse it.
+
+    AUTH_VERIFY_WORKERS (default 4) threads verify tokens, with at most
+    AUTH_VERIFY_MAX_PENDING (default 256) verifications queued or running.
+    """
+    return TokenVerifier(
+        int(os.environ.get("AUTH_VERIFY_WORKERS", "4")),
+        int(os.environ.get("AUTH_VERIFY_MAX_PENDING", "256")),
+    )
@@ -1,12 +1,28 @@
+import asyncio
+import contextlib
 import os
 import pathlib
 import json
+import logging
+import time
 import dotenv
 from fastapi import FastAPI, APIRouter, Depends
 
 dotenv.load_dotenv()
 
 from databutton_app.mw.auth_mw import AuthConfig, get_authorized_user
+from databutton_app.mw.jwks import get_jwks
+from databutton_app.mw.token_cache import get_token_cache
+from databutton_app.mw.verifier import get_token_verifier
+from app.env import Mode, mode
+from app.libs.log import NonBlockingQueueHandler, RequestIdMiddleware, configure_logging
+from app.libs.metrics import MetricsMiddleware, get_metrics, metrics_endpoint
+from app.libs.repository import get_conflict_retries, get_json_store, get_storage_pool
+from app.libs.responses import FastJSONResponse, get_response_cache
+from app.libs.storage_io import StorageIOMiddleware
+from app.libs.startup import StartupTimer
+
+logger = logging.getLogger(__name__)
 
 
 def get_router_config() -> dict:
@@ -19,31 +35,43 @@ def get_router_config() -> dict:
 
 
 def is_auth_disabled(router_config: dict, name: str) -> bool:
-    return router_config["routers"][name]["disableAuth"]
-
-
-def import_api_routers() -> APIRouter:
-    """Create top level router including all user defined endpoints."""
-    routes = APIRouter(prefix="/routes")
+    # Routers missing from the config require auth
+    if not router_config:
+        return False
+    return router_config["routers"].get(name, {}).get("disableAuth", False)
 
-    router_config = get_router_config()
 
-    src_path = pathlib.Path(__file__).parent
+def get_api_names(router_config: dict) -> list[str]:
+    """Names of the API routers to import.
 
-    # Import API routers from "src/app/apis/*/__init__.py"
-    apis_path = src_path / "app" / "apis"
+    routers.json is the manifest of the deployed routers, so workers import
+    exactly those without scanning the source tree. Without it every
+    "app/apis/*/__init__.py" is imported.
+    """
+    if router_config:
+        return list(router_config["routers"])
 
-    api_names = [
+    apis_path = pathlib.Path(__file__).parent / "app" / "apis"
+    return sorted(
         p.relative_to(apis_path).parent.as_posix()
         for p in apis_path.glob("*/__init__.py")
-    ]
+    )
+
+
+def import_api_routers(timer: StartupTimer) -> APIRouter:
+    """Create top level router including all user defined endpoints."""
+    routes = APIRouter(prefix="/routes")
+
+    router_config = get_router_config()
 
     api_module_prefix = "app.apis."
 
-    for name in api_names:
-        print(f"Importing API: {name}")
+    for name in get_api_names(router_config):
+        logger.debug("Importing API: %s", name)
         try:
-            api_module = __import__(api_module_prefix + name, fromlist=[name])
+            # The first router also pays for the libraries the routers share
+            with timer.phase(f"import router {name}"):
+                api_module = __import__(api_module_prefix + name, fromlist=[name])
             api_router = getattr(api_module, "router", None)
             if isinstance(api_router, APIRouter):
                 routes.include_router(
@@ -54,12 +82,10 @@ def import_api_routers() -> APIRouter:
                         else [Depends(get_authorized_user)]
                     ),
                 )
-        except Exception as e:
-            print(e)
+        except Exception:
+            logger.exception("Failed to import API: %s", name)
             continue
 
-    print(routes.routes)
-
     return routes
 
 
@@ -74,23 +100,105 @@ def get_firebase_config() -> dict | None:
     return None
 
 
+def register_metrics(app: FastAPI, log_handler: NonBlockingQueueHandler) -> None:
+    """Record request latencies and serve them with the stats of pools and caches at METRICS_PATH.
+
+    In production they are only served when METRICS_TOKEN is set, scrapers
+    then send it as a bearer token.
+    """
+    metrics = get_metrics()
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+    if mode == Mode.PROD and not os.environ.get("METRICS_TOKEN"):
+        logger.warning("METRICS_TOKEN is not set, metrics are not served")
+    else:
+        app.add_route(os.environ.get("METRICS_PATH", "/metrics"), metrics_endpoint, include_in_schema=False)
+
+    # Collected on every scrape, nothing is created before first use
+    metrics.register_stats("storage_pool", lambda: get_storage_pool().stats())
+    metrics.register_stats("storage_conflicts", lambda: get_conflict_retries().stats())
+    if os.environ.get("STORAGE_BACKEND", "databutton") == "databutton":
+        # Without a cache (STORAGE_CACHE_MAX_BYTES=0) there are no stats
+        metrics.register_stats("storage_cache", lambda: getattr(get_json_store(), "stats", dict)())
+    metrics.register_stats("response_cache", lambda: get_response_cache().stats())
+    metrics.register_stats("auth_token_cache", lambda: get_token_cache().stats())
+    metrics.register_stats("auth_verifier", lambda: get_token_verifier().stats())
+    metrics.register_stats("log_queue", log_handler.stats)
+
+
+def warm_up_storage() -> None:
+    """Open the storage backend, so the first requests don't pay for importing it."""
+    from app.libs.repository import get_repository
+
+    started_at = time.perf_counter()
+    try:
+        get_repository()
+    except Exception as e:
+        logger.warning("Failed to open the storage backend, retrying on first use: %s", e)
+        return
+    logger.info("Storage backend opened in %.1f ms", (time.perf_counter() - started_at) * 1000)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the auth signing keys, then warm up in the background and refresh the keys while the app runs.
+
+    The app starts serving once the keys are loaded, or after
+    AUTH_JWKS_STARTUP_TIMEOUT_SECONDS (default 5) if the download hangs, so
+    early requests don't wait on it. Storage is warmed up in the background,
+    requests that arrive early load what they need themselves.
+    """
+    tasks = [asyncio.create_task(asyncio.to_thread(warm_up_storage))]
+    if app.state.auth_config is not None:
+        key_set = get_jwks(app.state.auth_config.jwks_url)
+        try:
+            await asyncio.wait_for(
+                asyncio.to_thread(key_set.load),
+                float(os.environ.get("AUTH_JWKS_STARTUP_TIMEOUT_SECONDS", "5")),
+            )
+        except Exception as e:
+            # Serve anyway, the refresh below retries and requests load the keys on demand
+            logger.warning("Failed to load signing keys at startup: %r", e)
+        # Refreshes the keys before they expire, right away if they failed to load
+        tasks.append(asyncio.create_task(key_set.refresh_periodically()))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
-    app.include_router(import_api_routers())
+    timer = StartupTimer()
+    log_handler = configure_logging()
+
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+    # Counts the storage calls of each request, Server-Timing headers are for development only
+    app.add_middleware(
+        StorageIOMiddleware,
+        budget=int(os.environ.get("STORAGE_CALL_BUDGET", "100")),
+        server_timing=mode == Mode.DEV,
+    )
+    # Tags the log records of each request with its id, added after so they include budget warnings
+    app.add_middleware(RequestIdMiddleware)
+    with timer.phase("import routers"):
+        api_routes = import_api_routers(timer)
+    with timer.phase("include routers"):
+        app.include_router(api_routes)
+    register_metrics(app, log_handler)
 
     for route in app.routes:
         if hasattr(route, "methods"):
             for method in route.methods:
-                print(f"{method} {route.path}")
+                logger.debug("%s %s", method, route.path)
 
     firebase_config = get_firebase_config()
 
     if firebase_config is None:
-        print("No firebase config found")
+        logger.info("No firebase config found")
         app.state.auth_config = None
     else:
-        print("Firebase config found")
+        logger.info("Firebase config found")
         auth_config = {
             "jwks_url": "https://www.googleapis.com/service_accounts/v1/jwk/securetoken@system.gserviceaccount.com",
             "audience": firebase_config["projectId"],
@@ -98,6 +206,10 @@ def create_app() -> FastAPI:
         }
 
         app.state.auth_config = AuthConfig(**auth_config)
+        get_metrics().register_stats("auth_jwks", get_jwks(app.state.auth_config.jwks_url).stats)
+
+    # Phase timings in milliseconds, e.g. to compare deployments
+    app.state.startup_timings = timer.report()
 
     return app
 
@@ -0,0 +1,99 @@
+"""Fixtures of the repository and api tests.
+
+Run from the backend directory:
+
+    python -m pytest -q tests
+
+The databutton backend runs on the in-memory store of the benchmarks, wrapped
+like get_json_store() wraps db.storage.json. Tests with two repositories on
+the same store stand in for two workers.
+
+The api runs on the databutton backend, over the in-memory store of the
+benchmarks installed as db.storage.json. Requests are signed in with a local
+signing key, so auth goes through the same token checks as in production.
+"""
+
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.libs.metrics import get_metrics
+from app.libs.repository import (
+    get_async_community_catalog,
+    get_async_repository,
+    get_community_catalog,
+    get_conflict_retries,
+    get_json_store,
+    get_repository,
+    get_storage_pool,
+)
+from app.libs.repository.sqlite import SqliteRepository
+from app.libs.responses import get_response_cache
+from bench.auth import LocalSigningKey
+from bench.storage import MemoryJsonStore, install_storage
+from databutton_app.mw.jwks import get_jwks
+from databutton_app.mw.token_cache import get_token_cache
+from databutton_app.mw.verifier import get_token_verifier
+from tests.records import json_repository
+
+# Created on first use, so every test starts with its own
+FACTORIES = [
+    get_json_store,
+    get_repository,
+    get_community_catalog,
+    get_conflict_retries,
+    get_storage_pool,
+    get_async_repository,
+    get_async_community_catalog,
+    get_response_cache,
+    get_metrics,
+    get_jwks,
+    get_token_cache,
+    get_token_verifier,
+]
+
+
+@pytest.fixture(params=["databutton", "sqlite"])
+def repository(request, tmp_path):
+    if request.param == "sqlite":
+        return SqliteRepository(str(tmp_path / "storage.sqlite3"))
+    return json_repository(MemoryJsonStore())
+
+
+@pytest.fixture(scope="session")
+def signing_key():
+    """Key the test tokens are signed with, auth reads it from AUTH_JWKS_FILE."""
+    environ = dict(os.environ)
+    key = LocalSigningKey()
+    key.configure_environment()
+    # Has to be in place before anything imports databutton
+    if "databutton" not in sys.modules:
+        install_storage(MemoryJsonStore())
+    yield key
+    os.remove(os.environ["AUTH_JWKS_FILE"])
+    os.environ.clear()
+    os.environ.update(environ)
+
+
+@pytest.fixture
+def store(monkeypatch, signing_key) -> MemoryJsonStore:
+    """Empty db.storage.json of the api under test."""
+    store = MemoryJsonStore()
+    monkeypatch.setattr(sys.modules["databutton"].storage, "json", store)
+    return store
+
+
+@pytest.fixture
+def api(monkeypatch, store):
+    """Client of a new app, its storage, caches and auth created afresh."""
+    monkeypatch.setenv("STORAGE_BACKEND", "databutton")
+    for factory in FACTORIES:
+        factory.cache_clear()
+    import main
+
+    with TestClient(main.create_app()) as client:
+        yield client
+    for factory in FACTORIES:
+        factory.cache_clear()
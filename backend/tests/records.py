@@ -0,0 +1,65 @@
+"""Records and repositories shared by the tests."""
+
+from app.libs.repository import CachedJsonStore, KeyListingStore, VersionedJsonStore
+from app.libs.repository.json_storage import JsonStorageRepository
+from bench.storage import MemoryJsonStore
+
+
+class RecordingStore(MemoryJsonStore):
+    """Keeps the keys of the documents read and written."""
+
+    def __init__(self):
+        super().__init__()
+        self.read, self.written = [], []
+
+    def get(self, key: str, default=None):
+        self.read.append(key)
+        return super().get(key, default)
+
+    def put(self, key: str, value) -> None:
+        self.written.append(key)
+        super().put(key, value)
+
+
+def json_repository(store: MemoryJsonStore) -> JsonStorageRepository:
+    """Repository of the databutton backend, wrapped like get_json_store() wraps db.storage.json."""
+    return JsonStorageRepository(
+        CachedJsonStore(KeyListingStore(VersionedJsonStore(store), ttl_seconds=60), 1 << 20, ttl_seconds=30)
+    )
+
+
+def community(community_id: str, creator_id: str = "creator", created_at: str = "2025-01-01T00:00:00+00:00") -> dict:
+    return {
+        "id": community_id,
+        "name": f"Community {community_id}",
+        "description": "",
+        "creator_id": creator_id,
+        "member_ids": [creator_id],
+        "created_at": created_at,
+    }
+
+
+def category(community_id: str, category_id: str) -> dict:
+    return {
+        "id": category_id,
+        "community_id": community_id,
+        "name": f"Category {category_id}",
+        "description": None,
+        "created_at": "2025-01-01T00:00:00+00:00",
+        "is_deleted": False,
+    }
+
+
+def topic(
+    community_id: str, category_id: str, topic_id: str, minute: int, is_deleted: bool = False, month: int = 1
+) -> dict:
+    return {
+        "id": topic_id,
+        "community_id": community_id,
+        "category_id": category_id,
+        "title": f"Topic {topic_id}",
+        "content": "",
+        "creator_id": "creator",
+        "created_at": f"2025-{month:02d}-02T00:{minute:02d}:00+00:00",
+        "is_deleted": is_deleted,
+    }
@@ -0,0 +1,303 @@
+"""Routes of the api, on the databutton backend with signed in users."""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.env import Mode
+from app.libs.repository import VersionConflictError, get_conflict_retries, get_json_store, get_repository
+from app.libs.responses import get_response_cache, make_etag
+from bench.auth import LocalSigningKey
+from databutton_app.mw.jwks import get_jwks
+from databutton_app.mw.token_cache import get_token_cache
+from tests.records import community, json_repository
+
+
+@pytest.fixture
+def create_community(api, signing_key):
+    """Creates a community through the api, returns its id."""
+
+    def create(name: str = "Python", creator_id: str = "creator") -> str:
+        response = api.post(
+            "/routes/communities/",
+            json={"name": name, "description": f"About {name}", "creator_id": creator_id},
+            headers=signing_key.headers(creator_id),
+        )
+        assert response.status_code == 201, response.text
+        return response.json()["id"]
+
+    return create
+
+
+def test_requests_without_a_token_are_rejected(api):
+    assert api.get("/routes/communities/my").status_code == 401
+
+
+def test_join_gives_up_on_repeated_conflicts(api, store, signing_key, create_community, monkeypatch):
+    community_id = create_community()
+    assert store.get(f"community-{community_id}.json")["creator_id"] == "creator"
+
+    def add_member(community_id: str, user_id: str) -> bool:
+        raise VersionConflictError(f"membercount_{community_id}.json", 1, 2)
+
+    monkeypatch.setattr(get_repository(), "add_member", add_member)
+    response = api.post(f"/routes/communities/{community_id}/join", headers=signing_key.headers("member"))
+    assert response.status_code == 409
+    assert "concurrently" in response.json()["detail"]
+    stats = get_conflict_retries().stats()["join_community"]
+    assert stats["exhausted"] == 1 and stats["attempts"] == stats["conflicts"] > 1
+
+
+def test_reads_see_the_writes_before_them(api, signing_key, create_community):
+    community_id = create_community()
+    headers = signing_key.headers("creator")
+    categories_path = f"/routes/communities/{community_id}/forum-categories"
+    category_id = api.post(categories_path, json={"name": "General"}, headers=headers).json()["id"]
+    assert [c["name"] for c in api.get(categories_path, headers=headers).json()] == ["General"]
+
+    response = api.put(f"{categories_path}/{category_id}", json={"name": "Renamed"}, headers=headers)
+    assert response.status_code == 200
+    assert [c["name"] for c in api.get(categories_path, headers=headers).json()] == ["Renamed"]
+
+
+def test_topic_cursor_pages_through_a_category(api, store, signing_key, create_community):
+    community_id = create_community()
+    headers = signing_key.headers("creator")
+    category_id = api.post(
+        f"/routes/communities/{community_id}/forum-categories", json={"name": "General"}, headers=headers
+    ).json()["id"]
+    topics_path = f"/routes/communities/{community_id}/categories/{category_id}/topics"
+    topic_ids = [
+        api.post(topics_path, json={"title": f"Topic {n}", "content": "text"}, headers=headers).json()["id"]
+        for n in range(5)
+    ]
+    # A delete that stopped before updating the index
+    key = f"forumtopic_{community_id}_{category_id}_{topic_ids[2]}.json"
+    get_json_store().put(key, {**store.get(key), "is_deleted": True})
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = api.get(topics_path, params=params, headers=headers).json()
+        pages.append([t["id"] for t in body["topics"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == [[topic_ids[4], topic_ids[3]], [topic_ids[1], topic_ids[0]], []]
+
+    latest = api.get(f"/routes/communities/{community_id}/topics/latest", params={"limit": 3}, headers=headers)
+    assert [t["id"] for t in latest.json()["topics"]] == [topic_ids[4], topic_ids[3], topic_ids[1]]
+    assert api.get(topics_path, params={"cursor": "garbage"}, headers=headers).status_code == 400
+
+
+def test_join_community(api, store, signing_key, create_community):
+    community_id = create_community()
+    join_path = f"/routes/communities/{community_id}/join"
+
+    assert api.post(join_path, headers=signing_key.headers("member")).status_code == 200
+    response = api.post(join_path, headers=signing_key.headers("member"))
+    assert response.status_code == 409 and "already a member" in response.json()["detail"]
+    assert api.post(join_path, headers=signing_key.headers("creator")).status_code == 409
+    assert api.post("/routes/communities/missing/join", headers=signing_key.headers("member")).status_code == 404
+
+    # A join that stopped after its membership record is finished, not refused
+    store.put(f"membership_{community_id}_late.json", {"community_id": community_id, "user_id": "late"})
+    assert api.post(join_path, headers=signing_key.headers("late")).status_code == 200
+    status = api.get(f"/routes/communities/{community_id}/membership_status", headers=signing_key.headers("late"))
+    assert status.json() == {"is_member": True, "is_creator": False}
+    assert store.get(f"membercount_{community_id}.json")["member_count"] == 3
+
+
+def test_list_communities_by_cursor(api, signing_key, create_community):
+    community_ids = [create_community(name) for name in ("Python", "Rust", "Go")]
+    api.post(f"/routes/communities/{community_ids[1]}/join", headers=signing_key.headers("member"))
+
+    headers = signing_key.headers("visitor")
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = api.get("/routes/communities", params=params, headers=headers).json()
+        assert body["total_count"] == 3
+        pages.append([(c["name"], c["member_count"]) for c in body["communities"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert pages == [[("Python", 1), ("Rust", 2)], [("Go", 1)]]
+    assert api.get("/routes/communities", params={"cursor": "garbage"}, headers=headers).status_code == 400
+
+
+def test_community_details_answer_304_until_the_community_changes(api, store, signing_key, create_community):
+    community_id = create_community()
+    headers = signing_key.headers("visitor")
+    path = f"/routes/communities/{community_id}"
+    first = api.get(path, headers=headers)
+    etag = first.headers["etag"]
+
+    assert api.get(path, headers={**headers, "if-none-match": etag}).status_code == 304
+    # A join through another worker changes the version right away
+    json_repository(store).add_member(community_id, "member")
+    response = api.get(path, headers={**headers, "if-none-match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert response.json()["member_ids"] == ["creator", "member"]
+
+
+def test_community_details_with_a_patched_body_are_not_cached(api, store, signing_key):
+    store.put("community-legacy.json", {**community("legacy"), "created_at": None})
+    headers = signing_key.headers("visitor")
+
+    for _ in range(2):
+        response = api.get("/routes/communities/legacy", headers=headers)
+        assert response.status_code == 200 and "etag" not in response.headers
+    assert get_response_cache().stats()["entries"] == 0
+
+
+def test_forum_categories_answer_304_until_they_change(api, signing_key, create_community):
+    community_id = create_community()
+    headers = signing_key.headers("creator")
+    path = f"/routes/communities/{community_id}/forum-categories"
+    api.post(path, json={"name": "General"}, headers=headers)
+    etag = api.get(path, headers=headers).headers["etag"]
+
+    assert api.get(path, headers={**headers, "if-none-match": etag}).status_code == 304
+    api.post(path, json={"name": "Help"}, headers=headers)
+    response = api.get(path, headers={**headers, "if-none-match": etag})
+    assert [c["name"] for c in response.json()] == ["General", "Help"]
+
+    # Unknown communities have no categories version, they are not answered with 304
+    missing_etag = make_etag("forum_categories", "missing", 0)
+    missing_path = "/routes/communities/missing/forum-categories"
+    response = api.get(missing_path, headers={**headers, "if-none-match": missing_etag})
+    assert response.status_code == 404
+
+
+def test_topics_answer_304_until_a_topic_is_added(api, signing_key, create_community):
+    community_id = create_community()
+    headers = signing_key.headers("creator")
+    category_id = api.post(
+        f"/routes/communities/{community_id}/forum-categories", json={"name": "General"}, headers=headers
+    ).json()["id"]
+    topics_path = f"/routes/communities/{community_id}/categories/{category_id}/topics"
+    latest_path = f"/routes/communities/{community_id}/topics/latest"
+    api.post(topics_path, json={"title": "First", "content": "text"}, headers=headers)
+    etags = [api.get(path, headers=headers).headers["etag"] for path in (topics_path, latest_path)]
+
+    for path, etag in zip((topics_path, latest_path), etags):
+        assert api.get(path, headers={**headers, "if-none-match": etag}).status_code == 304
+    api.post(topics_path, json={"title": "Second", "content": "text"}, headers=headers)
+    for path, etag in zip((topics_path, latest_path), etags):
+        response = api.get(path, headers={**headers, "if-none-match": etag})
+        assert [t["title"] for t in response.json()["topics"]] == ["Second", "First"]
+
+
+def test_search_communities(api, signing_key, create_community):
+    for name in ("Python Users", "Rust Users", "Pythonistas"):
+        create_community(name)
+    headers = signing_key.headers("visitor")
+
+    def search(**params) -> dict:
+        response = api.get("/routes/search/communities", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    body = search(q="pyth")
+    assert sorted(c["name"] for c in body["communities"]) == ["Python Users", "Pythonistas"]
+    assert body["total_count"] == 2
+    assert [c["name"] for c in search(q="users rust")["communities"]] == ["Rust Users"]
+    page = search(q="python", limit=1, offset=1)
+    assert len(page["communities"]) == 1 and page["total_count"] == 2
+    assert search(q="go")["total_count"] == 0
+    assert api.get("/routes/search/communities", params={"q": ""}, headers=headers).status_code == 422
+
+
+def test_membership_statuses(api, signing_key, create_community):
+    created = create_community("Python")
+    joined = create_community("Rust", creator_id="other")
+    other = create_community("Go", creator_id="other")
+    headers = signing_key.headers("creator")
+    api.post(f"/routes/communities/{joined}/join", headers=headers)
+
+    path = "/routes/communities/membership-statuses"
+    response = api.post(path, json={"community_ids": [created, joined, other, "missing", created]}, headers=headers)
+    assert response.json()["statuses"] == [
+        {"community_id": created, "is_member": True, "is_creator": True},
+        {"community_id": joined, "is_member": True, "is_creator": False},
+        {"community_id": other, "is_member": False, "is_creator": False},
+        {"community_id": "missing", "is_member": False, "is_creator": False},
+    ]
+    # At most 100 communities at once
+    assert api.post(path, json={"community_ids": [f"c{n}" for n in range(100)]}, headers=headers).status_code == 200
+    assert api.post(path, json={"community_ids": [f"c{n}" for n in range(101)]}, headers=headers).status_code == 422
+
+
+def test_verified_tokens_are_cached_until_shortly_before_they_expire(api, signing_key):
+    path = "/routes/communities/me"
+    assert api.get(path, headers=signing_key.headers("user")).status_code == 200
+    assert api.get(path, headers=signing_key.headers("user")).status_code == 200
+    stats = get_token_cache().stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+    # Valid, but too close to its exp to be kept
+    expiring = {"authorization": f"Bearer {signing_key.token('user', expires_in=10)}"}
+    assert api.get(path, headers=expiring).status_code == 200
+    assert get_token_cache().stats()["entries"] == 1
+
+    # Neither an expired token nor one of another key is let in, or cached
+    expired = {"authorization": f"Bearer {signing_key.token('user', expires_in=-60)}"}
+    assert api.get(path, headers=expired).status_code == 401
+    assert api.get(path, headers=LocalSigningKey().headers("user")).status_code == 401
+    assert get_token_cache().stats()["entries"] == 1
+
+
+@pytest.fixture
+def jwks_file(monkeypatch, tmp_path, signing_key):
+    """JWKS file of a single test, holding the public key of signing_key."""
+    path = tmp_path / "jwks.json"
+    path.write_text(json.dumps({"keys": [signing_key.jwk()]}))
+    monkeypatch.setenv("AUTH_JWKS_FILE", str(path))
+    return path
+
+
+def test_signing_keys_are_loaded_at_startup_and_on_rotation(jwks_file, api, signing_key):
+    # Requested before api, so the app reads the keys from this test's file
+    key_set = get_jwks(api.app.state.auth_config.jwks_url)
+    assert key_set.stats()["loads"] == 1
+    assert api.get("/routes/communities/me", headers=signing_key.headers("user")).status_code == 200
+    assert key_set.stats()["loads"] == 1
+
+    # A token of a new key is verified once the keys are downloaded again, at once here
+    rotated = LocalSigningKey(key_id="rotated-key")
+    jwks_file.write_text(json.dumps({"keys": [signing_key.jwk(), rotated.jwk()]}))
+    key_set.unknown_kid_interval = 0
+    assert api.get("/routes/communities/me", headers=rotated.headers("user")).status_code == 200
+    assert key_set.stats()["loads"] == 2
+
+    # Otherwise unknown keys download them at most once every 30 seconds
+    key_set.unknown_kid_interval = 30
+    unknown = LocalSigningKey(key_id="unknown-key")
+    assert api.get("/routes/communities/me", headers=unknown.headers("user")).status_code == 401
+    assert key_set.stats()["loads"] == 2
+
+
+def test_metrics_are_served_in_development(api, signing_key):
+    api.get("/routes/communities/me", headers=signing_key.headers("user"))
+    response = api.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/communities/me",status="2xx"} 1' in response.text
+
+
+@pytest.mark.parametrize("token", [None, "secret"])
+def test_metrics_in_production_need_a_token(api, monkeypatch, token):
+    import main
+
+    monkeypatch.setattr(main, "mode", Mode.PROD)
+    if token is not None:
+        monkeypatch.setenv("METRICS_TOKEN", token)
+    with TestClient(main.create_app()) as client:
+        if token is None:
+            # Not served at all
+            assert client.get("/metrics").status_code == 404
+        else:
+            assert client.get("/metrics").status_code == 401
+            assert client.get("/metrics", headers={"authorization": "Bearer wrong"}).status_code == 401
+            assert client.get("/metrics", headers={"authorization": f"Bearer {token}"}).status_code == 200
@@ -0,0 +1,84 @@
+"""Cache of the databutton backend in front of db.storage.json."""
+
+import pytest
+
+from app.libs.repository import CachedJsonStore, VersionConflictError, VersionedJsonStore
+from bench.storage import MemoryJsonStore
+
+
+class RacingStore(MemoryJsonStore):
+    """Runs on_get once, while the first get of a key is in flight."""
+
+    def __init__(self):
+        super().__init__()
+        self.on_get = None
+
+    def get(self, key: str, default=None):
+        value = super().get(key, default)
+        if self.on_get is not None:
+            on_get, self.on_get = self.on_get, None
+            on_get()
+        return value
+
+
+def test_cache_does_not_keep_a_read_that_raced_with_a_write():
+    store = RacingStore()
+    store.put("doc.json", {"a": 1})
+    cache = CachedJsonStore(store, max_bytes=1 << 20, ttl_seconds=30)
+    # The write lands while the read of the old document is in flight
+    store.on_get = lambda: cache.put("doc.json", {"a": 2})
+    assert cache.get("doc.json") == {"a": 1}
+    assert cache.get("doc.json") == {"a": 2}
+
+
+def test_cache_serves_reads_until_read_past():
+    store = MemoryJsonStore()
+    store.put("doc.json", {"a": 1})
+    cache = CachedJsonStore(store, max_bytes=1 << 20, ttl_seconds=30)
+    cache.get("doc.json")
+    store.put("doc.json", {"a": 2})
+    assert cache.get("doc.json") == {"a": 1}
+    assert cache.get_uncached("doc.json") == {"a": 2}
+    # Reading past the cache also drops the old document from it
+    assert cache.get("doc.json") == {"a": 2}
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_entries_expire():
+    store = MemoryJsonStore()
+    store.put("doc.json", {"a": 1})
+    cache = CachedJsonStore(store, max_bytes=1 << 20, ttl_seconds=0)
+    cache.get("doc.json")
+    store.put("doc.json", {"a": 2})
+    assert cache.get("doc.json") == {"a": 2}
+
+
+def test_cache_evicts_the_least_recently_used_documents():
+    # Room for two of the documents below, 23 bytes each json encoded
+    cache = CachedJsonStore(MemoryJsonStore(), max_bytes=60, ttl_seconds=30)
+    cache.put("a.json", {"value": "a" * 10})
+    cache.put("b.json", {"value": "b" * 10})
+    cache.get("a.json")
+    cache.put("c.json", {"value": "c" * 10})
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["size_bytes"] == 46
+    cache.get("a.json")
+    assert cache.stats()["hits"] == stats["hits"] + 1
+
+
+def test_cache_drops_a_document_whose_versioned_write_conflicted():
+    store = VersionedJsonStore(MemoryJsonStore())
+    cache = CachedJsonStore(store, max_bytes=1 << 20, ttl_seconds=30)
+    cache.put_if_version("doc.json", {"a": 1}, 0)
+    # Another worker writes past this cache
+    store.put_if_version("doc.json", {"a": 2}, 1)
+    with pytest.raises(VersionConflictError):
+        cache.put_if_version("doc.json", {"a": 3}, 1)
+    assert cache.get("doc.json") == {"a": 2, "version": 2}
+
+
+def test_cache_returns_copies():
+    cache = CachedJsonStore(MemoryJsonStore(), max_bytes=1 << 20, ttl_seconds=30)
+    cache.put("doc.json", {"items": [1]})
+    cache.get("doc.json")["items"].append(2)
+    assert cache.get("doc.json") == {"items": [1]}
@@ -0,0 +1,66 @@
+"""Community catalog, on both storage backends and in memory."""
+
+from app.libs.repository import CommunityCatalog
+from app.libs.repository.json_storage import COMMUNITY_CATALOG_KEY
+from bench.storage import MemoryJsonStore
+from tests.records import RecordingStore, community, json_repository
+
+
+def created(month: int, day: int = 1) -> str:
+    return f"2025-{month:02d}-{day:02d}T00:00:00+00:00"
+
+
+# --- Both backends ---
+def test_catalog_lists_communities_oldest_first(repository):
+    for community_id, month in [("b", 2), ("c", 3), ("a", 1), ("d", 2)]:
+        repository.create_community(community(community_id, created_at=created(month)))
+    repository.add_member("b", "member")
+
+    assert [(e["id"], e["member_count"]) for e in repository.list_catalog()] == [
+        ("a", 1),
+        ("b", 2),
+        ("d", 1),
+        ("c", 1),
+    ]
+
+
+def test_in_memory_catalog_pages_and_applies_upserts(repository):
+    for n in range(5):
+        repository.create_community(community(f"c{n}", created_at=created(n + 1)))
+    catalog = CommunityCatalog(repository, ttl_seconds=60)
+
+    entries, total = catalog.page(offset=1, limit=2)
+    assert [e["id"] for e in entries] == ["c1", "c2"] and total == 5
+    entries, _ = catalog.page(offset=0, limit=10, after=(entries[-1]["created_at"], entries[-1]["id"]))
+    assert [e["id"] for e in entries] == ["c3", "c4"]
+
+    catalog.upsert({**community("c0", created_at=created(1)), "name": "Renamed", "member_count": 7})
+    assert catalog.page(offset=0, limit=1)[0][0]["member_count"] == 7
+    assert [e["id"] for e in catalog.search("renamed", offset=0, limit=10)[0]] == ["c0"]
+
+
+# --- Catalog of the databutton backend ---
+def test_new_community_rewrites_only_the_catalog_chunk_of_its_month():
+    store = RecordingStore()
+    repository = json_repository(store)
+    repository.create_community(community("a", created_at=created(1)))
+    repository.create_community(community("b", created_at=created(2)))
+
+    store.written.clear()
+    repository.create_community(community("c", created_at=created(2, 15)))
+    assert sorted(key for key in store.written if key.startswith("communitycatalog")) == [
+        "communitycatalog_2025-02.json",
+        COMMUNITY_CATALOG_KEY,
+    ]
+    assert store.get(COMMUNITY_CATALOG_KEY)["months"] == [["2025-01", 1], ["2025-02", 2]]
+
+
+def test_catalog_is_built_from_communities_stored_before_it():
+    store = MemoryJsonStore()
+    for community_id, month in [("a", 1), ("b", 3)]:
+        store.put(f"community-{community_id}.json", community(community_id, created_at=created(month)))
+
+    repository = json_repository(store)
+    assert [(e["id"], e["member_count"]) for e in repository.list_catalog()] == [("a", 1), ("b", 1)]
+    repository.create_community(community("c", created_at=created(2)))
+    assert [e["id"] for e in json_repository(store).list_catalog()] == ["a", "c", "b"]
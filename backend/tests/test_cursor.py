@@ -0,0 +1,32 @@
+"""Cursors of keyset pagination."""
+
+import pytest
+
+from app.libs.repository.cursor import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize(
+    "position",
+    [("2025-01-02T00:00:00+00:00", "a-b_c"), ("", ""), ("2025-01-02T00:00:00.123456+00:00", "ünïcode")],
+)
+def test_cursor_round_trip(position):
+    cursor = encode_cursor(*position)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == position
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "garbage",
+        "",
+        encode_cursor("2025", "id") + "!",
+        # Valid base64 of json that is not a [created_at, id] pair of strings
+        "WzEsMl0",  # [1,2]
+        "eyJhIjoxfQ",  # {"a":1}
+        "WyJhIiwiYiIsImMiXQ",  # ["a","b","c"]
+    ],
+)
+def test_cursor_rejects_malformed_tokens(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
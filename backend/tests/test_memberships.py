@@ -0,0 +1,93 @@
+"""Memberships and member counts, on both storage backends."""
+
+import pytest
+
+from app.libs.repository import VersionConflictError
+from app.libs.repository.json_storage import COMMUNITY_CATALOG_KEY
+from bench.storage import MemoryJsonStore
+from tests.records import community, json_repository
+
+
+# --- Both backends ---
+def test_members_and_memberships(repository):
+    repository.create_community(community("c"))
+    repository.create_community(community("d", creator_id="other", created_at="2025-01-03T00:00:00+00:00"))
+
+    assert repository.add_member("d", "creator") is True
+    assert repository.add_member("d", "creator") is False
+    assert repository.count_members("d") == 2
+    assert repository.is_member("d", "creator") and not repository.is_member("c", "other")
+
+    assert repository.get_memberships("creator", ["c", "d", "missing"]) == {
+        "c": {"is_member": True, "is_creator": True},
+        "d": {"is_member": True, "is_creator": False},
+        "missing": {"is_member": False, "is_creator": False},
+    }
+    assert [(c["id"], c["member_ids"]) for c in repository.list_user_communities("creator")] == [
+        ("c", ["creator"]),
+        ("d", ["other", "creator"]),
+    ]
+    assert [(e["id"], e["member_count"]) for e in repository.list_catalog()] == [("c", 1), ("d", 2)]
+
+
+# --- Joins on the databutton backend ---
+def test_workers_joining_at_once_conflict_and_retry():
+    store = MemoryJsonStore()
+    first, second = json_repository(store), json_repository(store)
+    first.create_community(community("c"))
+    second.count_members("c")
+
+    first.add_member("c", "a")
+    # The second worker's counter is stale, its join stops after the membership
+    with pytest.raises(VersionConflictError):
+        second.add_member("c", "b")
+    assert [c["id"] for c in second.list_user_communities("b")] == []
+    # The conflict dropped the stale counter, the retry finishes the join
+    assert second.add_member("c", "b") is True
+    assert second.add_member("c", "b") is False
+
+    third = json_repository(store)
+    assert third.count_members("c") == 3
+    assert [e["member_count"] for e in third.list_catalog()] == [3]
+    assert [c["id"] for c in third.list_user_communities("a")] == ["c"]
+
+
+def test_join_that_stopped_is_finished_by_the_next_attempt():
+    store = MemoryJsonStore()
+    repository = json_repository(store)
+    repository.create_community(community("c"))
+    # One join stopped after its membership, another after its counter too
+    store.put("membership_c_a.json", {"community_id": "c", "user_id": "a"})
+    store.put("membership_c_b.json", {"community_id": "c", "user_id": "b"})
+    counter = store.get("membercount_c.json")
+    store.put("membercount_c.json", {"member_count": 2, "recent_ids": ["b"], "version": counter["version"] + 1})
+
+    repository = json_repository(store)
+    assert repository.add_member("c", "a") is True
+    assert repository.add_member("c", "b") is True
+    assert repository.add_member("c", "a") is False
+    assert repository.count_members("c") == 3
+    assert repository.get_memberships("b", ["c"]) == {"c": {"is_member": True, "is_creator": False}}
+
+
+def test_members_from_the_community_document_are_not_added_again():
+    store = MemoryJsonStore()
+    repository = json_repository(store)
+    repository.create_community({**community("c"), "member_ids": ["creator", "legacy"]})
+    store.delete("membership_c_legacy.json")
+
+    assert json_repository(store).add_member("c", "legacy") is False
+    assert json_repository(store).count_members("c") == 2
+
+
+def test_joins_leave_the_catalog_document_alone():
+    store = MemoryJsonStore()
+    repository = json_repository(store)
+    repository.create_community(community("c"))
+    catalog = store.get(COMMUNITY_CATALOG_KEY), store.get("communitycatalog_2025-01.json")
+
+    repository.add_member("c", "a")
+    repository.add_member("c", "b")
+    assert (store.get(COMMUNITY_CATALOG_KEY), store.get("communitycatalog_2025-01.json")) == catalog
+    # The catalog listing reads the counts from the counters
+    assert [e["member_count"] for e in json_repository(store).list_catalog()] == [3]
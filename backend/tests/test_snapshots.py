@@ -0,0 +1,98 @@
+"""Versions and snapshots the ETags of read endpoints are made from."""
+
+from bench.storage import MemoryJsonStore
+from tests.records import category, community, json_repository, topic
+
+
+# --- Both backends ---
+def test_versions_change_with_writes(repository):
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    versions = (
+        repository.get_categories_version("c"),
+        repository.get_category_topics_version("c", "k"),
+        repository.get_community_topics_version("c"),
+        repository.get_community_version("c"),
+    )
+    repository.put_topic(topic("c", "k", "t", 0))
+    assert repository.get_categories_version("c") == versions[0]
+    assert repository.get_category_topics_version("c", "k") != versions[1]
+    assert repository.get_community_topics_version("c") != versions[2]
+
+    repository.add_member("c", "member")
+    assert repository.get_community_version("c") != versions[3]
+    repository.put_category({**repository.get_category("c", "k"), "name": "Renamed"})
+    assert repository.get_categories_version("c") != versions[0]
+
+
+def test_snapshots_match_their_versions(repository):
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    repository.add_member("c", "member")
+
+    version, record = repository.get_community_snapshot("c")
+    assert version == repository.get_community_version("c")
+    assert record["member_ids"] == ["creator", "member"]
+
+    version, categories = repository.list_categories_snapshot("c")
+    assert version == repository.get_categories_version("c")
+    assert [c["id"] for c in categories] == ["k"]
+
+
+# --- Two workers on the databutton backend ---
+def test_snapshot_sees_members_and_categories_of_other_workers():
+    store = MemoryJsonStore()
+    first, second = json_repository(store), json_repository(store)
+    first.create_community(community("c"))
+    first.put_category(category("c", "k"))
+    # Cached listing, counter and categories of the second worker
+    second.get_community_snapshot("c")
+    second.list_categories("c")
+
+    first.add_member("c", "member")
+    first.put_category({**first.get_category("c", "k"), "name": "Renamed"})
+    first.put_category(category("c", "new"))
+
+    version, record = second.get_community_snapshot("c")
+    assert record["member_ids"] == ["creator", "member"]
+    assert version == first.get_community_version("c")
+    version, categories = second.list_categories_snapshot("c")
+    assert version == first.get_categories_version("c")
+    assert [c["name"] for c in categories] == ["Renamed", "Category new"]
+
+
+def test_half_written_join_has_no_snapshot_version():
+    store = MemoryJsonStore()
+    repository = json_repository(store)
+    repository.create_community(community("c"))
+    # A counter ahead of the memberships, e.g. of a membership deleted by hand
+    counter = store.get("membercount_c.json")
+    store.put("membercount_c.json", {"member_count": counter["member_count"] + 1, "version": counter["version"] + 1})
+
+    version, record = repository.get_community_snapshot("c")
+    assert version is None
+    assert record["member_ids"] == ["creator"]
+
+
+def test_versions_are_read_past_the_cache():
+    store = MemoryJsonStore()
+    first, second = json_repository(store), json_repository(store)
+    first.create_community(community("c"))
+    first.put_category(category("c", "k"))
+    versions = lambda repository: (
+        repository.get_community_version("c"),
+        repository.get_categories_version("c"),
+        repository.get_category_topics_version("c", "k"),
+        repository.get_community_topics_version("c"),
+    )
+    # The second worker has read everything the versions come from
+    before = versions(second)
+    second.get_community("c")
+    second.count_members("c")
+
+    first.add_member("c", "member")
+    first.put_category({**first.get_category("c", "k"), "name": "Renamed"})
+    first.put_topic(topic("c", "k", "t", 0))
+    after = versions(second)
+    assert after == versions(first)
+    assert all(b != a for b, a in zip(before, after))
@@ -0,0 +1,192 @@
+"""Topic listings through the topic indexes, on both storage backends."""
+
+import pytest
+
+from app.libs.repository.sqlite import SqliteRepository
+from bench.storage import MemoryJsonStore
+from tests.records import RecordingStore, category, community, json_repository, topic
+
+
+# --- Both backends ---
+def test_topic_pages_by_offset_and_cursor(repository):
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    for minute in range(5):
+        repository.put_topic(topic("c", "k", f"t{minute}", minute))
+    repository.put_topic(topic("c", "k", "deleted", 9, is_deleted=True))
+
+    topics, total = repository.list_category_topics("c", "k", offset=1, limit=2)
+    assert [t["id"] for t in topics] == ["t3", "t2"] and total == 5
+
+    last = topics[-1]
+    topics, _ = repository.list_category_topics("c", "k", offset=0, limit=10, after=(last["created_at"], last["id"]))
+    assert [t["id"] for t in topics] == ["t1", "t0"]
+
+    # A cursor past the oldest topic gives an empty page
+    topics, _ = repository.list_category_topics("c", "k", offset=0, limit=10, after=("2000-01-01", "x"))
+    assert topics == []
+
+
+def test_latest_topics_page_across_categories(repository):
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "a"))
+    repository.put_category(category("c", "b"))
+    for minute in range(6):
+        repository.put_topic(topic("c", "ab"[minute % 2], f"t{minute}", minute))
+    # Topics created at the same time are ordered by id
+    repository.put_topic(topic("c", "a", "u5", 5))
+
+    seen, after = [], None
+    while True:
+        topics, total = repository.list_latest_topics("c", limit=3, after=after)
+        seen += [t["id"] for t in topics]
+        if len(topics) < 3:
+            break
+        after = (topics[-1]["created_at"], topics[-1]["id"])
+    assert seen == ["u5", "t5", "t4", "t3", "t2", "t1", "t0"]
+    assert total == 7
+
+
+def test_deleting_a_topic_removes_it_from_listings(repository):
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    repository.put_topic(topic("c", "k", "t", 0))
+    repository.put_topic(topic("c", "k", "t", 0, is_deleted=True))
+
+    assert repository.list_category_topics("c", "k", offset=0, limit=10) == ([], 0)
+    assert repository.list_latest_topics("c", limit=10) == ([], 0)
+    with pytest.raises(FileNotFoundError):
+        repository.find_topic("c", "t")
+
+
+def test_find_topic_by_id(repository):
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    repository.put_topic(topic("c", "k", "t", 0))
+
+    assert repository.find_topic("c", "t")["title"] == "Topic t"
+    with pytest.raises(FileNotFoundError):
+        repository.find_topic("other", "t")
+
+
+def test_backends_list_the_same_topics(tmp_path):
+    repositories = [json_repository(MemoryJsonStore()), SqliteRepository(str(tmp_path / "storage.sqlite3"))]
+    for repository in repositories:
+        repository.create_community(community("c"))
+        repository.put_category(category("c", "k"))
+        for minute in range(8):
+            repository.put_topic(topic("c", "k", f"t{minute % 3}{minute}", minute // 2, is_deleted=minute == 4))
+
+    def listings(repository) -> tuple:
+        return (
+            repository.list_category_topics("c", "k", offset=2, limit=3),
+            repository.list_category_topics("c", "k", offset=0, limit=3, after=("2025-01-02T00:02:00+00:00", "t16")),
+            repository.list_latest_topics("c", limit=4),
+            repository.list_latest_topics("c", limit=4, after=("2025-01-02T00:01:00+00:00", "t23")),
+        )
+
+    json_listings, sqlite_listings = map(listings, repositories)
+    assert json_listings == sqlite_listings
+
+
+def test_topic_pages_span_months(repository):
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    for month in (1, 2, 3):
+        for minute in range(3):
+            repository.put_topic(topic("c", "k", f"m{month}t{minute}", minute, month=month))
+
+    topics, total = repository.list_category_topics("c", "k", offset=2, limit=3)
+    assert [t["id"] for t in topics] == ["m3t0", "m2t2", "m2t1"] and total == 9
+    # Whole months within the offset
+    topics, _ = repository.list_category_topics("c", "k", offset=6, limit=10)
+    assert [t["id"] for t in topics] == ["m1t2", "m1t1", "m1t0"]
+
+    last = topics[0]
+    topics, _ = repository.list_category_topics("c", "k", offset=1, limit=2, after=(last["created_at"], last["id"]))
+    assert [t["id"] for t in topics] == ["m1t0"]
+    topics, total = repository.list_latest_topics("c", limit=4, after=("2025-02-02T00:01:00+00:00", "m2t1"))
+    assert [t["id"] for t in topics] == ["m2t0", "m1t2", "m1t1", "m1t0"] and total == 9
+
+
+# --- Topic index of the databutton backend ---
+def test_workers_keep_each_others_index_entries():
+    store = MemoryJsonStore()
+    first, second = json_repository(store), json_repository(store)
+    first.create_community(community("c"))
+    first.put_category(category("c", "k"))
+    # Both have the indexes cached before the other one writes
+    first.list_category_topics("c", "k", offset=0, limit=10)
+    second.list_category_topics("c", "k", offset=0, limit=10)
+    second.list_latest_topics("c", limit=10)
+
+    first.put_topic(topic("c", "k", "a", 0))
+    second.put_topic(topic("c", "k", "b", 1))
+    first.put_topic(topic("c", "k", "c", 2))
+
+    third = json_repository(store)
+    assert [t["id"] for t in third.list_category_topics("c", "k", offset=0, limit=10)[0]] == ["c", "b", "a"]
+    assert [t["id"] for t in third.list_latest_topics("c", limit=10)[0]] == ["c", "b", "a"]
+
+
+def test_new_topic_rewrites_only_the_chunk_of_its_month():
+    store = RecordingStore()
+    repository = json_repository(store)
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    for month in (1, 2):
+        repository.put_topic(topic("c", "k", f"m{month}", 0, month=month))
+
+    store.written.clear()
+    repository.put_topic(topic("c", "k", "new", 1, month=2))
+    assert sorted(key for key in store.written if "month" in key) == [
+        "ftopiccommunitymonth_c_2025-02.json",
+        "ftopiccommunitymonths_c.json",
+        "ftopicmonth_c_k_2025-02.json",
+        "ftopicmonths_c_k.json",
+    ]
+
+    # A page of the newest topics reads the head and the newest chunk
+    store.read.clear()
+    json_repository(store).list_category_topics("c", "k", offset=0, limit=2)
+    assert [key for key in store.read if "month" in key] == ["ftopicmonths_c_k.json", "ftopicmonth_c_k_2025-02.json"]
+
+
+def test_topic_index_is_built_from_topics_stored_before_it():
+    store = MemoryJsonStore()
+    repository = json_repository(store)
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    for month in (1, 2):
+        record = topic("c", "k", f"m{month}", 0, month=month)
+        store.put(f"forumtopic_c_k_m{month}.json", record)
+
+    repository = json_repository(store)
+    topics, total = repository.list_category_topics("c", "k", offset=0, limit=10)
+    assert [t["id"] for t in topics] == ["m2", "m1"] and total == 2
+    assert store.get("ftopicmonths_c_k.json")["months"] == [["2025-01", 1], ["2025-02", 1]]
+    # New topics go into the built index
+    repository.put_topic(topic("c", "k", "new", 1, month=2))
+    assert [t["id"] for t in repository.list_latest_topics("c", limit=10)[0]] == ["new", "m2", "m1"]
+    assert repository.find_topic("c", "m1")["id"] == "m1"
+
+
+def test_pages_stay_full_past_topics_being_deleted():
+    repository = json_repository(MemoryJsonStore())
+    repository.create_community(community("c"))
+    repository.put_category(category("c", "k"))
+    for minute in range(6):
+        repository.put_topic(topic("c", "k", f"t{minute}", minute))
+    # A delete that stopped before updating the index entries, and a topic that is gone
+    repository.store.put("forumtopic_c_k_t3.json", topic("c", "k", "t3", 3, is_deleted=True))
+    repository.store.delete("forumtopic_c_k_t1.json")
+
+    pages, after = [], None
+    while True:
+        topics, _ = repository.list_category_topics("c", "k", offset=0, limit=2, after=after)
+        pages.append([t["id"] for t in topics])
+        if len(topics) < 2:
+            break
+        after = (topics[-1]["created_at"], topics[-1]["id"])
+    assert pages == [["t5", "t4"], ["t2", "t0"], []]
+    assert [t["id"] for t in repository.list_latest_topics("c", limit=3)[0]] == ["t5", "t4", "t2"]
@@ -0,0 +1,71 @@
+"""Compare-and-swap writes of the databutton backend and their retries."""
+
+import asyncio
+
+import pytest
+
+from app.libs.repository import ConflictRetries, VersionConflictError, VersionedJsonStore
+from app.libs.repository.versions import StripedLocks
+from bench.storage import MemoryJsonStore
+
+
+def test_put_if_version_writes_the_next_version():
+    store = VersionedJsonStore(MemoryJsonStore())
+    assert store.put_if_version("doc.json", {"a": 1}, 0) == 1
+    assert store.put_if_version("doc.json", {"a": 2}, 1) == 2
+    assert store.get("doc.json") == {"a": 2, "version": 2}
+
+
+def test_put_if_version_conflicts_on_another_version():
+    store = VersionedJsonStore(MemoryJsonStore())
+    store.put_if_version("doc.json", {"a": 1}, 0)
+    with pytest.raises(VersionConflictError) as conflict:
+        store.put_if_version("doc.json", {"a": 2}, 0)
+    assert (conflict.value.expected_version, conflict.value.current_version) == (0, 1)
+    assert store.get("doc.json") == {"a": 1, "version": 1}
+    assert store.stats() == {"versioned_puts": 2, "conflicts": 1}
+
+
+def test_striped_locks_do_not_grow_with_the_keys():
+    locks = StripedLocks(stripes=4)
+    assert locks["a.json"] is locks["a.json"]
+    assert len({id(locks[f"doc{i}.json"]) for i in range(1000)}) <= 4
+
+
+def test_conflict_retries_run_until_the_operation_succeeds():
+    retries = ConflictRetries(max_attempts=3)
+    attempts = []
+
+    async def operation():
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise VersionConflictError("doc.json", 1, 2)
+        return "done"
+
+    assert asyncio.run(retries.run("update", operation)) == "done"
+    stats = retries.stats()["update"]
+    assert (stats["calls"], stats["attempts"], stats["conflicts"], stats["exhausted"]) == (1, 3, 2, 0)
+
+
+def test_conflict_retries_raise_the_last_conflict_when_exhausted():
+    retries = ConflictRetries(max_attempts=2)
+
+    async def operation():
+        raise VersionConflictError("doc.json", 1, 2)
+
+    with pytest.raises(VersionConflictError):
+        asyncio.run(retries.run("update", operation))
+    stats = retries.stats()["update"]
+    assert (stats["attempts"], stats["conflicts"], stats["exhausted"]) == (2, 2, 1)
+    assert stats["conflict_rate"] == 1.0
+
+
+def test_conflict_retries_leave_other_errors_alone():
+    retries = ConflictRetries(max_attempts=5)
+
+    async def operation():
+        raise FileNotFoundError("doc.json")
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(retries.run("update", operation))
+    assert retries.stats()["update"]["attempts"] == 1